@@ -0,0 +1,427 @@
+""":mod:`libearth.asynccrawler` --- Asynchronous crawler
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:func:`~libearth.crawler.crawl()` takes a thread for each concurrent
+fetch, and every fetch opens a new connection.  :func:`crawl_async()`
+instead crawls feeds on an :mod:`asyncio` event loop, and reuses
+keep-alive connections to the same host through :class:`ConnectionPool`,
+so that thousands of feeds can be crawled concurrently from a single
+thread:
+
+.. code-block:: python
+
+   loop = asyncio.get_event_loop()
+   results = loop.run_until_complete(crawl_async(feed_urls, concurrency=100))
+   for result in results:
+       if isinstance(result, CrawlError):
+           print(result.feed_uri, result)
+       else:
+           print(result.url, result.feed.title)
+
+It's built on only the standard library: :mod:`asyncio` streams and
+a minimal HTTP/1.1 client.
+
+.. note::
+
+   This module requires Python 3.4 or higher.
+
+.. versionadded:: 0.4.0
+
+"""
+import asyncio
+import logging
+import urllib.parse
+
+from .crawler import (ACCEPT_ENCODING, BUFFER_SIZE, DEFAULT_TIMEOUT,
+                      CrawlError, CrawlResult, Decompressor, discover_favicon,
+                      parse_feed)
+from .version import VERSION
+
+__all__ = ('DEFAULT_CONCURRENCY', 'MAX_REDIRECTS', 'ConnectionPool',
+           'Response', 'crawl_async', 'fetch', 'get_feed_async')
+
+
+#: (:class:`numbers.Integral`) The default number of feeds to crawl
+#: concurrently.
+DEFAULT_CONCURRENCY = 100
+
+#: (:class:`numbers.Integral`) The maximum number of redirects to follow.
+MAX_REDIRECTS = 5
+
+#: (:class:`numbers.Integral`) The maximum number of header lines
+#: of a response.
+MAX_HEADERS = 100
+
+#: (:class:`str`) The :mailheader:`User-Agent` header to send.
+USER_AGENT = '{0}/{1}'.format(__package__, VERSION)
+
+
+class Response(object):
+    """The response of :func:`fetch()`.
+
+    :param url: the url of the response
+    :type url: :class:`str`
+    :param status: the status code e.g. 200
+    :type status: :class:`numbers.Integral`
+    :param reason: the reason phrase e.g. ``'OK'``
+    :type reason: :class:`str`
+    :param headers: the mapping of lowercased header names to values
+    :type headers: :class:`collections.Mapping`
+    :param body: the response body.  it's already decompressed even if
+                 the response has :mailheader:`Content-Encoding`
+    :type body: :class:`bytes`
+
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} {1} {2!r}>'.format(
+            type(self), self.status, self.url
+        )
+
+
+class ConnectionPool(object):
+    """The pool of keep-alive connections for each host.  Connections are
+    returned to the pool after responses are completely read, and
+    the next request to the same host reuses them.
+
+    :param max_idle: the maximum number of idle connections to keep
+                     for each host.  4 by default
+    :type max_idle: :class:`numbers.Integral`
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of connections opened
+    #: so far.
+    connections = 0
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.idle = {}
+
+    @asyncio.coroutine
+    def acquire(self, scheme, host, port):
+        """Get an idle connection to the host, or open a new one.
+
+        :returns: a triple of (:class:`asyncio.StreamReader`,
+                  :class:`asyncio.StreamWriter`, whether it's reused)
+        :rtype: :class:`tuple`
+
+        """
+        idle = self.idle.get((scheme, host, port))
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = yield from asyncio.open_connection(
+            host, port, ssl=scheme == 'https'
+        )
+        self.connections += 1
+        return reader, writer, False
+
+    def release(self, scheme, host, port, reader, writer, reusable=True):
+        """Return the connection to the pool.  It's closed instead if it's
+        not ``reusable`` or the pool is full.
+
+        """
+        idle = self.idle.setdefault((scheme, host, port), [])
+        if reusable and not reader.at_eof() and len(idle) < self.max_idle:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        """Close all idle connections."""
+        idle = self.idle
+        self.idle = {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+
+@asyncio.coroutine
+def fetch(pool, url, method='GET', headers=None, timeout=DEFAULT_TIMEOUT):
+    """Request the ``url`` and read the whole response.  Redirects are
+    followed.
+
+    :param pool: the connection pool to use
+    :type pool: :class:`ConnectionPool`
+    :param url: the url to request
+    :type url: :class:`str`
+    :param method: the request method.  ``'GET'`` by default
+    :type method: :class:`str`
+    :param headers: the extra request headers
+    :type headers: :class:`collections.Mapping`
+    :param timeout: the timeout in seconds for each request
+    :type timeout: :class:`numbers.Real`
+    :returns: the final response
+    :rtype: :class:`Response`
+    :raises IOError: when the request fails
+
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        response = yield from asyncio.wait_for(
+            _request(pool, method, url, headers or {}),
+            timeout
+        )
+        location = response.headers.get('location')
+        if response.status not in (301, 302, 303, 307, 308) or not location:
+            return response
+        url = urllib.parse.urljoin(url, location)
+        if response.status == 303:
+            method = 'GET'
+    raise IOError('too many redirects: ' + url)
+
+
+@asyncio.coroutine
+def _request(pool, method, url, headers):
+    parsed = urllib.parse.urlsplit(url)
+    scheme = parsed.scheme.lower()
+    if scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('unsupported url: ' + repr(url))
+    host = parsed.hostname
+    port = parsed.port or (443 if scheme == 'https' else 80)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    lines = ['{0} {1} HTTP/1.1'.format(method, path),
+             'Host: ' + parsed.netloc.rpartition('@')[2],
+             'User-Agent: ' + USER_AGENT,
+             'Accept-Encoding: ' + ACCEPT_ENCODING,
+             'Connection: keep-alive']
+    lines.extend('{0}: {1}'.format(name, value)
+                 for name, value in headers.items())
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    while True:
+        reader, writer, reused = yield from pool.acquire(scheme, host, port)
+        released = False
+        try:
+            writer.write(head)
+            try:
+                status_line = yield from reader.readline()
+            except OSError:
+                if not reused:
+                    raise
+                status_line = b''
+            if not status_line:
+                if reused:
+                    # The server closed the idle connection in the meantime.
+                    continue
+                raise IOError('connection closed by ' + host)
+            response, reusable = yield from _read_response(
+                reader, url, method, status_line
+            )
+            pool.release(scheme, host, port, reader, writer, reusable)
+            released = True
+            return response
+        finally:
+            if not released:
+                writer.close()
+
+
+@asyncio.coroutine
+def _read_response(reader, url, method, status_line):
+    parts = status_line.decode('latin-1').split(None, 2)
+    try:
+        version = parts[0]
+        status = int(parts[1])
+    except (IndexError, ValueError):
+        raise IOError('invalid status line: ' + repr(status_line))
+    reason = parts[2].rstrip() if len(parts) > 2 else ''
+    headers = {}
+    for _ in range(MAX_HEADERS + 1):
+        line = yield from reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = headers[name] + ', ' + value \
+            if name in headers else value
+    else:
+        raise IOError('too many headers: ' + url)
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        reusable = connection != 'close'
+    else:
+        reusable = connection == 'keep-alive'
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        return Response(url, status, reason, headers, b''), reusable
+    try:
+        decompressor = Decompressor(headers.get('content-encoding'))
+    except ValueError as e:
+        raise IOError(str(e))
+    chunks = []
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size_line = yield from reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if not size:
+                break
+            data = yield from reader.readexactly(size)
+            chunks.append(decompressor.decompress(data))
+            yield from reader.readline()
+        # Skip trailers.
+        while (yield from reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+    elif 'content-length' in headers:
+        size = int(headers['content-length'])
+        while size > 0:
+            data = yield from reader.readexactly(min(size, BUFFER_SIZE))
+            size -= len(data)
+            chunks.append(decompressor.decompress(data))
+    else:
+        while True:
+            data = yield from reader.read(BUFFER_SIZE)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+        reusable = False
+    chunks.append(decompressor.flush())
+    body = b''.join(chunks)
+    return Response(url, status, reason, headers, body), reusable
+
+
+@asyncio.coroutine
+def get_feed_async(pool, feed_url, timeout=DEFAULT_TIMEOUT, validators=None,
+                   favicons=None):
+    """Crawl the ``feed_url``.  It's an asynchronous version of
+    :func:`~libearth.crawler.get_feed()`.
+
+    :param pool: the connection pool to use
+    :type pool: :class:`ConnectionPool`
+    :param feed_url: the feed url to crawl
+    :type feed_url: :class:`str`
+    :param timeout: the timeout in seconds for each request
+    :type timeout: :class:`numbers.Real`
+    :param validators: optional cache of validators to make
+                       a conditional request
+    :type validators: :class:`~libearth.crawler.ValidatorCache`
+    :param favicons: optional cache of favicons.  on cache misses the site
+                     is probed in the background, and the result has
+                     no :attr:`~libearth.crawler.CrawlResult.icon_url`
+    :type favicons: :class:`~libearth.crawler.FaviconCache`
+    :returns: the crawled result
+    :rtype: :class:`~libearth.crawler.CrawlResult`
+    :raises libearth.crawler.CrawlError: when it fails to crawl
+
+    """
+    logger = logging.getLogger(__name__ + '.get_feed_async')
+    try:
+        headers = {}
+        if validators is not None:
+            headers = validators.get_headers(feed_url)
+        response = yield from fetch(pool, feed_url, headers=headers,
+                                    timeout=timeout)
+        if response.status == 304 and validators is not None:
+            return CrawlResult(feed_url, None, None, not_modified=True)
+        elif response.status != 200:
+            raise IOError('HTTP Error {0}: {1}'.format(response.status,
+                                                       response.reason))
+        feed, crawler_hints = parse_feed(feed_url, response.body,
+                                         response.headers.get('content-type'))
+        if validators is not None:
+            validators.update(feed_url, response.headers.get('etag'),
+                              response.headers.get('last-modified'))
+        favicon = feed.links.favicon
+        permalink = feed.links.permalink
+        if favicon is None and permalink and favicons is not None:
+            found, favicon = favicons.lookup(permalink.uri)
+            if not found:
+                favicons.resolve(permalink.uri, timeout)
+        elif favicon is None:
+            favicon = yield from _find_favicon(pool, feed, timeout)
+        else:
+            favicon = favicon.uri
+        return CrawlResult(feed_url, feed, crawler_hints, favicon)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception('%s: %s', feed_url, e)
+        raise CrawlError(feed_url, '{0} failed: {1}'.format(feed_url, e))
+
+
+@asyncio.coroutine
+def _find_favicon(pool, feed, timeout):
+    permalink = feed.links.permalink
+    if not permalink:
+        return
+    favicon = None
+    try:
+        response = yield from fetch(pool, permalink.uri, timeout=timeout)
+    except (IOError, ValueError, asyncio.TimeoutError):
+        pass
+    else:
+        if response.status == 200:
+            favicon = discover_favicon(permalink.uri, response.body,
+                                       response.headers.get('content-type'))
+    if favicon is None:
+        favicon = urllib.parse.urljoin(permalink.uri, '/favicon.ico')
+        try:
+            response = yield from fetch(pool, favicon, method='HEAD',
+                                        timeout=timeout)
+        except (IOError, ValueError, asyncio.TimeoutError):
+            favicon = None
+        else:
+            if response.status != 200:
+                favicon = None
+    return favicon
+
+
+@asyncio.coroutine
+def crawl_async(feed_urls, concurrency=DEFAULT_CONCURRENCY,
+                timeout=DEFAULT_TIMEOUT, validators=None, favicons=None):
+    """Crawl feeds concurrently on the current event loop.
+
+    :param feed_urls: feed urls to crawl
+    :type feed_urls: :class:`collections.Iterable`
+    :param concurrency: the maximum number of feeds to crawl at a time.
+                        :const:`DEFAULT_CONCURRENCY` by default
+    :type concurrency: :class:`numbers.Integral`
+    :param timeout: the timeout in seconds for each request.
+                    :const:`~libearth.crawler.DEFAULT_TIMEOUT` by default
+    :type timeout: :class:`numbers.Real`
+    :param validators: optional cache of validators to make conditional
+                       requests.  feeds which are not modified since
+                       the last crawl result in
+                       :class:`~libearth.crawler.CrawlResult`\ s with
+                       :attr:`~libearth.crawler.CrawlResult.not_modified`
+                       flag
+    :type validators: :class:`~libearth.crawler.ValidatorCache`
+    :param favicons: optional cache of favicons of sites.
+                     see also :func:`~libearth.crawler.crawl()`
+    :type favicons: :class:`~libearth.crawler.FaviconCache`
+    :returns: the list of :class:`~libearth.crawler.CrawlResult` objects,
+              in the same order to ``feed_urls``.  feeds which failed
+              to be crawled are :class:`~libearth.crawler.CrawlError`
+              objects instead of being raised
+    :rtype: :class:`collections.Sequence`
+
+    """
+    pool = ConnectionPool()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    @asyncio.coroutine
+    def crawl_one(feed_url):
+        yield from semaphore.acquire()
+        try:
+            return (yield from get_feed_async(pool, feed_url, timeout,
+                                              validators, favicons))
+        except CrawlError as e:
+            return e
+        finally:
+            semaphore.release()
+    try:
+        results = yield from asyncio.gather(
+            *[crawl_one(feed_url) for feed_url in feed_urls]
+        )
+    finally:
+        pool.close()
+    return results
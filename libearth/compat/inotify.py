@@ -0,0 +1,147 @@
+""":mod:`libearth.compat.inotify` --- Linux inotify binding
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Minimal :mod:`ctypes` binding of Linux inotify_ API.  It doesn't require
+any third-party package, but works only on Linux.  :const:`available`
+is :const:`False` on other platforms.
+
+.. _inotify: http://man7.org/linux/man-pages/man7/inotify.7.html
+
+.. versionadded:: 0.4.0
+
+"""
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+import errno
+import os
+import struct
+import sys
+
+from . import PY3
+
+__all__ = ('IN_CLOSE_WRITE', 'IN_CREATE', 'IN_DELETE', 'IN_DELETE_SELF',
+           'IN_IGNORED', 'IN_ISDIR', 'IN_MOVED_FROM', 'IN_MOVED_TO',
+           'IN_Q_OVERFLOW', 'add_watch', 'available', 'init', 'read_events',
+           'remove_watch')
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#: (:class:`str`) The format of the fixed-size part of
+#: ``struct inotify_event``: watch descriptor, mask, cookie, and the length
+#: of the name.
+EVENT_FORMAT = 'iIII'
+
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+
+def _load_libc():
+    if ctypes is None or not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+_libc = _load_libc()
+
+#: (:class:`bool`) Whether inotify is available or not.
+available = _libc is not None
+
+
+def _check(result):
+    if result < 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    return result
+
+
+def init():
+    """Create a new non-blocking inotify instance.
+
+    :returns: the file descriptor of the inotify instance
+    :rtype: :class:`numbers.Integral`
+    :raises OSError: when inotify is unavailable or fails
+
+    """
+    if not available:
+        raise OSError(errno.ENOSYS, 'inotify is unavailable')
+    return _check(_libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+
+def add_watch(fd, path, mask):
+    """Watch the given ``path``.
+
+    :param fd: the file descriptor of the inotify instance
+    :type fd: :class:`numbers.Integral`
+    :param path: the path to watch
+    :type path: :class:`str`
+    :param mask: the bit mask of events to watch
+    :type mask: :class:`numbers.Integral`
+    :returns: the watch descriptor
+    :rtype: :class:`numbers.Integral`
+
+    """
+    if not isinstance(path, bytes):
+        path = path.encode(sys.getfilesystemencoding())
+    return _check(_libc.inotify_add_watch(fd, path, mask))
+
+
+def remove_watch(fd, wd):
+    """Stop watching the given watch descriptor ``wd``."""
+    _check(_libc.inotify_rm_watch(fd, wd))
+
+
+def read_events(fd, buffer_size=65536):
+    """Read pending events from the inotify instance.  It returns
+    an empty list if there's no pending event.
+
+    :param fd: the file descriptor of the inotify instance
+    :type fd: :class:`numbers.Integral`
+    :returns: the list of quadruples of (watch descriptor, mask,
+              cookie, name).  name is :const:`None` if the event is about
+              the watched directory itself
+    :rtype: :class:`collections.Sequence`
+
+    """
+    try:
+        data = os.read(fd, buffer_size)
+    except OSError as e:
+        if e.errno in (errno.EAGAIN, errno.EINTR):
+            return []
+        raise
+    events = []
+    offset = 0
+    while offset + EVENT_SIZE <= len(data):
+        wd, mask, cookie, size = struct.unpack_from(EVENT_FORMAT, data, offset)
+        offset += EVENT_SIZE
+        name = data[offset:offset + size].rstrip(b'\0')
+        offset += size
+        if not name:
+            name = None
+        elif PY3:
+            name = os.fsdecode(name)
+        events.append((wd, mask, cookie, name))
+    return events
@@ -6,10 +6,22 @@ Crawl feeds.
 """
 import collections
 import functools
+import json
 import logging
 import re
 import sys
+import threading
+import time
+import zlib
 
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 try:
     import urllib.request as urllib2
 except ImportError:
@@ -19,14 +31,22 @@ try:
 except ImportError:
     import urlparse
 
-from .compat.parallel import parallel_map
+from .compat.parallel import cpu_count, parallel_map
 from .feed import Link
 from .parser.autodiscovery import AutoDiscovery, get_format
+from .parser.util import parse_xml
+from .repository import Repository, RepositoryKeyError
+from .stage import Stage
 from .subscribe import SubscriptionSet
 from .version import VERSION
 
 
-__all__ = 'DEFAULT_TIMEOUT', 'CrawlError', 'CrawlResult', 'crawl', 'get_feed'
+__all__ = ('ACCEPT_ENCODING', 'DEFAULT_BATCH_SIZE', 'DEFAULT_HOST_CONCURRENCY',
+           'DEFAULT_HOST_DELAY', 'DEFAULT_TIMEOUT', 'CrawlError', 'CrawlReport',
+           'CrawlResult', 'CrawlStream',
+           'Decompressor', 'FaviconCache', 'HostScheduler', 'ValidatorCache',
+           'crawl', 'crawl_into', 'crawl_pipelined', 'crawl_stream',
+           'discover_favicon', 'find_favicon', 'get_feed', 'parse_feed')
 
 
 #: (:class:`numbers.Integral`) The default timeout for connection attempts.
@@ -35,6 +55,33 @@ __all__ = 'DEFAULT_TIMEOUT', 'CrawlError', 'CrawlResult', 'crawl', 'get_feed'
 #: .. versionadded:: 0.3.0
 DEFAULT_TIMEOUT = 10
 
+#: (:class:`numbers.Integral`) The default maximum number of concurrent
+#: requests to the same host.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_HOST_CONCURRENCY = 2
+
+#: (:class:`numbers.Real`) The default minimum delay in seconds between
+#: starts of requests to the same host.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_HOST_DELAY = 0
+
+#: (:class:`str`) The :mailheader:`Accept-Encoding` header crawlers send.
+#: Responses are decompressed by :class:`Decompressor`.
+#:
+#: .. versionadded:: 0.4.0
+ACCEPT_ENCODING = 'gzip, deflate'
+
+#: (:class:`numbers.Integral`) The size of blocks to read response bodies.
+BUFFER_SIZE = 16384
+
+#: (:class:`numbers.Integral`) The default number of feeds that
+#: :func:`crawl_into()` merges into a stage in a transaction.
+#:
+#: .. versionadded:: 0.4.0
+DEFAULT_BATCH_SIZE = 16
+
 
 def open_url(url, *args, **kwargs):
     if isinstance(url, Request):
@@ -42,11 +89,40 @@ def open_url(url, *args, **kwargs):
     else:
         request = urllib2.Request(url)
     request.add_header('User-agent', '{0}/{1}'.format(__package__, VERSION))
+    request.add_header('Accept-encoding', ACCEPT_ENCODING)
     return urllib2.urlopen(request, *args, **kwargs)
 
 
-def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
-    """Crawl feeds in feed list using thread.
+def read_response(response, buffer_size=BUFFER_SIZE):
+    """Read the body of the ``response`` which is made by :func:`open_url()`
+    block by block, and decompress it on the fly.
+
+    :returns: decompressed chunks
+    :rtype: :class:`collections.Iterable`
+
+    """
+    decompressor = Decompressor(response.info().get('content-encoding'))
+    try:
+        while True:
+            data = response.read(buffer_size)
+            if not data:
+                break
+            chunk = decompressor.decompress(data)
+            if chunk:
+                yield chunk
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        response.close()
+
+
+def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT, validators=None,
+          host_concurrency=DEFAULT_HOST_CONCURRENCY,
+          host_delay=DEFAULT_HOST_DELAY, favicons=None):
+    """Crawl feeds in feed list using thread.  Feeds are scheduled by
+    :class:`HostScheduler` so that workers don't hammer a host which
+    serves many of them, while feeds from other hosts fill idle workers.
 
     :param feed_urls: feed urls to crawl
     :type feed_urls: :class: `collections.Sequence`
@@ -55,6 +131,26 @@ def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
     :param timeout: optional timeout for connection attempts.
                     :const:`DEFAULT_TIMEOUT` is used if omitted
     :type timeout: :class:`numbers.Integral`
+    :param validators: optional cache of validators to make conditional
+                       requests.  feeds which are not modified since
+                       the last crawl result in :class:`CrawlResult`\ s
+                       with :attr:`~CrawlResult.not_modified` flag
+    :type validators: :class:`ValidatorCache`
+    :param host_concurrency: the maximum number of concurrent requests
+                             to the same host.
+                             :const:`DEFAULT_HOST_CONCURRENCY` by default
+    :type host_concurrency: :class:`numbers.Integral`
+    :param host_delay: the minimum delay in seconds between starts of
+                       requests to the same host.
+                       :const:`DEFAULT_HOST_DELAY` by default
+    :type host_delay: :class:`numbers.Real`
+    :param favicons: optional cache of favicons of sites.  if it's given
+                     sites are probed for their favicons at most once
+                     per its ttl, and in the background.  feeds of which
+                     favicons aren't cached yet result in
+                     :class:`CrawlResult`\ s without
+                     :attr:`~CrawlResult.icon_url`
+    :type favicons: :class:`FaviconCache`
     :returns: a set of :class:`CrawlResult` objects
     :rtype: :class:`collections.Iterable`
 
@@ -71,72 +167,666 @@ def crawl(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT):
 
        Added optional ``timeout`` parameter.
 
+    .. versionadded:: 0.4.0
+
+       Added optional ``validators``, ``host_concurrency``,
+       ``host_delay`` and ``favicons`` parameters.
+
+    .. seealso::
+
+       :func:`crawl_stream()`
+          Streams results and errors as they complete, with progress
+          callback, deadline and cancellation.
+
     """
-    if type(timeout) is type(DEFAULT_TIMEOUT) and timeout == DEFAULT_TIMEOUT:
+    if validators is not None or favicons is not None:
+        func = functools.partial(get_feed, timeout=timeout,
+                                 validators=validators, favicons=favicons)
+    elif (type(timeout) is type(DEFAULT_TIMEOUT) and
+          timeout == DEFAULT_TIMEOUT):
         func = get_feed
     else:
         func = functools.partial(get_feed, timeout=int(timeout))
-    return parallel_map(pool_size, func, feed_urls)
+    scheduler = HostScheduler(feed_urls, host_concurrency, host_delay)
+    # Each call takes whichever url is ready next from the scheduler
+    # rather than its argument, so it needs as many calls as urls.
+    return parallel_map(pool_size,
+                        functools.partial(_get_scheduled_feed, scheduler, func),
+                        scheduler.feed_urls)
+
+
+def _get_scheduled_feed(scheduler, func, _):
+    feed_url = scheduler.acquire()
+    try:
+        return func(feed_url)
+    finally:
+        scheduler.release(feed_url)
+
+
+def crawl_pipelined(feed_urls, io_workers, parse_workers=None,
+                    queue_size=None, timeout=DEFAULT_TIMEOUT, validators=None,
+                    favicons=None, host_concurrency=DEFAULT_HOST_CONCURRENCY,
+                    host_delay=DEFAULT_HOST_DELAY, executor=None):
+    """Crawl feeds in a pipeline of two stages: ``io_workers`` threads
+    fetch feeds, and ``parse_workers`` processes parse them.  Unlike
+    :func:`crawl()` which parses feeds in the same threads that fetch
+    them, parsing doesn't contend with network I/O for the GIL, so that
+    crawling many feeds can use all CPU cores.
+
+    Fetched feeds wait for parse workers in a queue bounded by
+    ``queue_size``; when it's full, I/O workers stop fetching until
+    parse workers catch up.  Parsed feeds are transferred back by
+    pickling.
+
+    :param feed_urls: feed urls to crawl
+    :type feed_urls: :class:`collections.Iterable`
+    :param io_workers: the number of threads to fetch feeds
+    :type io_workers: :class:`numbers.Integral`
+    :param parse_workers: the number of processes to parse feeds.
+                          the number of cpu cores by default
+    :type parse_workers: :class:`numbers.Integral`
+    :param queue_size: the maximum number of fetched feeds waiting for
+                       or being parsed.  twice the ``parse_workers``
+                       by default
+    :type queue_size: :class:`numbers.Integral`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Integral`
+    :param validators: optional cache of validators to make conditional
+                       requests.  see also :func:`crawl()`
+    :type validators: :class:`ValidatorCache`
+    :param favicons: optional cache of favicons of sites.
+                     see also :func:`crawl()`
+    :type favicons: :class:`FaviconCache`
+    :param host_concurrency: the maximum number of concurrent requests
+                             to the same host.
+                             :const:`DEFAULT_HOST_CONCURRENCY` by default
+    :type host_concurrency: :class:`numbers.Integral`
+    :param host_delay: the minimum delay in seconds between starts of
+                       requests to the same host.
+                       :const:`DEFAULT_HOST_DELAY` by default
+    :type host_delay: :class:`numbers.Real`
+    :param executor: optional :class:`concurrent.futures.Executor` to
+                     parse feeds instead of a new
+                     :class:`~concurrent.futures.ProcessPoolExecutor`.
+                     it isn't shut down by the crawler
+    :type executor: :class:`concurrent.futures.Executor`
+    :returns: a lazy iterable of :class:`CrawlResult` objects in the order
+              of completion.  feeds which failed to be crawled are
+              :class:`CrawlError` objects instead of being raised
+    :rtype: :class:`collections.Iterable`
+    :raises RuntimeError: when :mod:`concurrent.futures` is unavailable
+                          and ``executor`` is omitted
+
+    .. versionadded:: 0.4.0
+
+    """
+    if executor is None and ProcessPoolExecutor is None:
+        raise RuntimeError('crawl_pipelined() requires concurrent.futures; '
+                           'install futures package on Python 2')
+    if parse_workers is None:
+        parse_workers = cpu_count()
+    if queue_size is None:
+        queue_size = parse_workers * 2
+    scheduler = HostScheduler(feed_urls, host_concurrency, host_delay)
+    return _crawl_pipelined(scheduler, io_workers, parse_workers, queue_size,
+                            timeout, validators, favicons, executor)
+
+
+def _crawl_pipelined(scheduler, io_workers, parse_workers, queue_size,
+                     timeout, validators, favicons, executor):
+    logger = logging.getLogger(__name__ + '.crawl_pipelined')
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(parse_workers)
+    results = queue.Queue()
+    parsed = queue.Queue()
+    slots = threading.Semaphore(queue_size)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    exited = [0]
+
+    def fail(feed_url, e):
+        logger.exception('%s: %s', feed_url, e)
+        results.put(CrawlError(feed_url, '{0} failed: {1}'.format(feed_url,
+                                                                  e)))
+
+    def finish_parsed(block, current):
+        # Resolving favicons needs network I/O as well, so parsed feeds
+        # come back to I/O workers.
+        try:
+            feed_url, validator, future = parsed.get(
+                timeout=0.05 if block else 0
+            )
+        except queue.Empty:
+            return False
+        current.append(feed_url)
+        try:
+            feed, crawler_hints = future.result()
+            if validators is not None:
+                validators.update(feed_url, *validator)
+            favicon = _get_favicon(feed, timeout, favicons)
+        except Exception as e:
+            fail(feed_url, e)
+        else:
+            results.put(CrawlResult(feed_url, feed, crawler_hints, favicon))
+        current.pop()
+        return True
+
+    def on_parsed(feed_url, validator, future):
+        slots.release()
+        parsed.put((feed_url, validator, future))
+
+    def work(current):
+        while not stopped.is_set():
+            if finish_parsed(False, current):
+                continue
+            feed_url = scheduler.acquire()
+            if feed_url is None:
+                # Nothing to fetch; help to finish parsed feeds.
+                finish_parsed(True, current)
+                continue
+            current.append(feed_url)
+            try:
+                fetched = _fetch_feed(feed_url, timeout, validators)
+            except Exception as e:
+                fail(feed_url, e)
+                current.pop()
+                continue
+            finally:
+                scheduler.release(feed_url)
+            if isinstance(fetched, CrawlResult):
+                results.put(fetched)
+                current.pop()
+                continue
+            while not slots.acquire(False):
+                if stopped.is_set():
+                    return
+                finish_parsed(True, current)
+            feed_xml, content_type, validator = fetched
+            try:
+                future = executor.submit(parse_feed, feed_url, feed_xml,
+                                         content_type)
+            except RuntimeError as e:
+                # The executor was shut down or is broken.
+                slots.release()
+                fail(feed_url, e)
+                current.pop()
+                continue
+            current.pop()
+            future.add_done_callback(
+                functools.partial(on_parsed, feed_url, validator)
+            )
+
+    def run():
+        # Feeds the worker is handling, so that they can be reported as
+        # failed even if the worker dies unexpectedly.
+        current = []
+        try:
+            work(current)
+        finally:
+            for feed_url in current:
+                results.put(CrawlError(feed_url, '{0} failed: the worker '
+                                                 'exited'.format(feed_url)))
+            # Wake the consumer up so that it doesn't wait forever for
+            # results of parsed feeds no worker is left to finish.
+            with lock:
+                exited[0] += 1
+            results.put(None)
+
+    threads = [threading.Thread(target=run) for _ in range(io_workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    remaining = {}
+    for feed_url in scheduler.feed_urls:
+        remaining[feed_url] = remaining.get(feed_url, 0) + 1
+    count = len(scheduler)
+    completed = False
+    try:
+        while count:
+            result = results.get()
+            if result is None:
+                with lock:
+                    if exited[0] < io_workers:
+                        continue
+                if not results.empty():
+                    continue
+                break
+            feed_url = (result.feed_uri if isinstance(result, CrawlError)
+                        else result.url)
+            remaining[feed_url] -= 1
+            count -= 1
+            yield result
+        for feed_url, n in remaining.items():
+            for _ in range(n):
+                yield CrawlError(feed_url, '{0} failed: every worker '
+                                           'exited'.format(feed_url))
+        completed = True
+    finally:
+        stopped.set()
+        if own_executor:
+            executor.shutdown(wait=completed)
+
+
+def crawl_stream(feed_urls, pool_size, timeout=DEFAULT_TIMEOUT,
+                 validators=None, favicons=None,
+                 host_concurrency=DEFAULT_HOST_CONCURRENCY,
+                 host_delay=DEFAULT_HOST_DELAY, callback=None, deadline=None,
+                 fail_fast=False, queue_size=None):
+    """Crawl feeds in feed list using thread, and stream the results as
+    they complete.  Unlike :func:`crawl()` which raises errors after
+    all results are consumed, feeds which failed to be crawled are
+    yielded as :class:`CrawlError` objects in the order of completion,
+    so that results can be stored while the crawl is still running:
+
+    .. code-block:: python
+
+       stream = crawl_stream(feed_urls, 4, deadline=60)
+       for result in stream:
+           if isinstance(result, CrawlResult):
+               stage.feeds[get_hash(result.url)] = result.feed
+       print('{0}/{1} feeds done'.format(stream.completed, len(stream)))
+
+    Crawling starts as soon as the function is called, even if the stream
+    is not iterated.
+
+    :param feed_urls: feed urls to crawl
+    :type feed_urls: :class:`collections.Iterable`
+    :param pool_size: the number of concurrent workers
+    :type pool_size: :class:`numbers.Integral`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Real`
+    :param validators: optional cache of validators to make conditional
+                       requests.  see also :func:`crawl()`
+    :type validators: :class:`ValidatorCache`
+    :param favicons: optional cache of favicons of sites.
+                     see also :func:`crawl()`
+    :type favicons: :class:`FaviconCache`
+    :param host_concurrency: the maximum number of concurrent requests
+                             to the same host.
+                             :const:`DEFAULT_HOST_CONCURRENCY` by default
+    :type host_concurrency: :class:`numbers.Integral`
+    :param host_delay: the minimum delay in seconds between starts of
+                       requests to the same host.
+                       :const:`DEFAULT_HOST_DELAY` by default
+    :type host_delay: :class:`numbers.Real`
+    :param callback: optional function called with each result, i.e.
+                     :class:`CrawlResult` or :class:`CrawlError`, as soon
+                     as it completes.  it's called in worker threads,
+                     but never concurrently.  it may call
+                     :meth:`CrawlStream.cancel()`
+    :type callback: :class:`collections.Callable`
+    :param deadline: optional seconds to finish the whole crawl in.
+                     when it passes the crawl is cancelled
+                     (see :meth:`CrawlStream.cancel()`)
+    :type deadline: :class:`numbers.Real`
+    :param fail_fast: cancel the crawl at the first failure.
+                      :const:`False` by default
+    :type fail_fast: :class:`bool`
+    :param queue_size: the maximum number of completed results waiting to
+                       be consumed.  when it's full, workers stop crawling
+                       until the stream is iterated.  unbounded by default
+    :type queue_size: :class:`numbers.Integral`
+    :returns: a stream of :class:`CrawlResult` and :class:`CrawlError`
+              objects
+    :rtype: :class:`CrawlStream`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if callback is not None and not callable(callback):
+        raise TypeError('callback must be callable, not ' + repr(callback))
+    scheduler = HostScheduler(feed_urls, host_concurrency, host_delay)
+    return CrawlStream(scheduler, pool_size, timeout, validators, favicons,
+                       callback, deadline, fail_fast, queue_size)
+
+
+class CrawlStream(collections.Iterable):
+    """The stream of crawl results made by :func:`crawl_stream()`.
+    Iterating it yields :class:`CrawlResult` and :class:`CrawlError`
+    objects in the order of completion.  Iteration ends when every feed
+    has completed, or the crawl is cancelled.
+
+    .. versionadded:: 0.4.0
 
+    """
+
+    #: (:class:`numbers.Integral`) The number of feeds completed so far.
+    completed = 0
+
+    def __init__(self, scheduler, pool_size, timeout, validators, favicons,
+                 callback, deadline, fail_fast, queue_size=None):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.validators = validators
+        self.favicons = favicons
+        self.callback = callback
+        self.deadline = None if deadline is None else time.time() + deadline
+        self.fail_fast = fail_fast
+        self.queue_size = queue_size
+        self.results = queue.Queue()
+        # The number of results put or about to be put, but not consumed.
+        # Notified when results are consumed or the crawl is cancelled.
+        self.queued = 0
+        self.consumed = threading.Condition()
+        # Reentrant so that callbacks can cancel the crawl.
+        self.lock = threading.RLock()
+        #: (:class:`threading.Event`) Set when the crawl is cancelled.
+        self.cancelled = threading.Event()
+        #: (:class:`collections.Set`) Feed urls which are completed.
+        self.done = set()
+        for _ in range(min(pool_size, len(scheduler))):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+
+    def work(self):
+        scheduler = self.scheduler
+        while not self.cancelled.is_set():
+            feed_url = scheduler.acquire()
+            if feed_url is None:
+                break
+            try:
+                timeout = self.timeout
+                if self.deadline is not None:
+                    remaining = self.deadline - time.time()
+                    if remaining <= 0:
+                        self.cancel()
+                    timeout = min(timeout, remaining)
+                if self.cancelled.is_set():
+                    break
+                try:
+                    result = get_feed(feed_url, timeout, self.validators,
+                                      self.favicons)
+                except CrawlError as e:
+                    result = e
+            finally:
+                scheduler.release(feed_url)
+            self.complete(feed_url, result)
+
+    def complete(self, feed_url, result):
+        with self.consumed:
+            while (self.queue_size and self.queued >= self.queue_size and
+                   not self.cancelled.is_set()):
+                self.consumed.wait()
+            self.queued += 1
+        with self.lock:
+            if self.cancelled.is_set():
+                return
+            self.done.add(feed_url)
+            self.completed += 1
+            self.results.put(result)
+            if self.callback is not None:
+                try:
+                    self.callback(result)
+                except Exception as e:
+                    logger = logging.getLogger(__name__ + '.crawl_stream')
+                    logger.exception('callback failed: %s', e)
+        if self.fail_fast and isinstance(result, CrawlError):
+            self.cancel()
+
+    def cancel(self):
+        """Cancel the crawl.  Feeds which aren't started yet are never
+        fetched, and results of fetches in progress are discarded.
+        Results completed before are still yielded.
+
+        """
+        with self.lock:
+            if not self.cancelled.is_set():
+                self.cancelled.set()
+                self.results.put(None)
+        with self.consumed:
+            self.consumed.notify_all()
+
+    @property
+    def pending(self):
+        """(:class:`collections.Set`) Feed urls which are not completed.
+        After the crawl is cancelled these are left uncrawled.
+
+        """
+        with self.lock:
+            return frozenset(self.scheduler.feed_urls) - self.done
+
+    def __iter__(self):
+        for _ in range(len(self.scheduler)):
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(0, self.deadline - time.time())
+            try:
+                result = self.results.get(timeout=timeout)
+            except queue.Empty:
+                self.cancel()
+                result = self.results.get()
+            if result is None:
+                # Cancelled; re-put the mark for other iterations.
+                self.results.put(None)
+                return
+            with self.consumed:
+                self.queued -= 1
+                self.consumed.notify()
+            yield result
+
+    def __len__(self):
+        return len(self.scheduler)
+
+
+def crawl_into(stage, subscription_list, pool_size, timeout=DEFAULT_TIMEOUT,
+               validators=None, favicons=None,
+               host_concurrency=DEFAULT_HOST_CONCURRENCY,
+               host_delay=DEFAULT_HOST_DELAY, batch_size=DEFAULT_BATCH_SIZE,
+               queue_size=None, deadline=None, callback=None):
+    """Crawl every feed of the ``subscription_list`` and merge them into
+    the ``stage``.  Results are consumed from :func:`crawl_stream()`
+    while the crawl is still running, and merged ``batch_size`` feeds
+    per transaction instead of a transaction per feed.  Stored feeds
+    of a batch are read at once, and feeds of which entries didn't
+    change are skipped without being written:
+
+    .. code-block:: python
+
+       with stage:
+           subscriptions = stage.subscriptions
+       report = crawl_into(stage, subscriptions, 4, validators=validators)
+       print('{0.updated} feeds updated ({0.throughput:.1f} feeds/s)'
+             .format(report))
+
+    It has to be called out of any transaction of the ``stage`` in
+    the current context, since it begins transactions by itself.
+
+    :param stage: the stage to merge feeds into
+    :type stage: :class:`~libearth.stage.Stage`
+    :param subscription_list: subscriptions to crawl
+    :type subscription_list: :class:`~libearth.subscribe.SubscriptionSet`
+    :param pool_size: the number of concurrent workers
+    :type pool_size: :class:`numbers.Integral`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Real`
+    :param validators: optional cache of validators to make conditional
+                       requests.  see also :func:`crawl()`
+    :type validators: :class:`ValidatorCache`
+    :param favicons: optional cache of favicons of sites.
+                     see also :func:`crawl()`
+    :type favicons: :class:`FaviconCache`
+    :param host_concurrency: the maximum number of concurrent requests
+                             to the same host.
+                             :const:`DEFAULT_HOST_CONCURRENCY` by default
+    :type host_concurrency: :class:`numbers.Integral`
+    :param host_delay: the minimum delay in seconds between starts of
+                       requests to the same host.
+                       :const:`DEFAULT_HOST_DELAY` by default
+    :type host_delay: :class:`numbers.Real`
+    :param batch_size: the number of feeds to merge in a transaction.
+                       :const:`DEFAULT_BATCH_SIZE` by default
+    :type batch_size: :class:`numbers.Integral`
+    :param queue_size: the maximum number of crawled feeds waiting to be
+                       merged.  when it's full, workers stop crawling until
+                       merges catch up.  twice the ``batch_size`` by default
+    :type queue_size: :class:`numbers.Integral`
+    :param deadline: optional seconds to finish the whole crawl in.
+                     feeds not crawled until then are left
+                     in :attr:`CrawlReport.pending`
+    :type deadline: :class:`numbers.Real`
+    :param callback: optional function called with the :class:`CrawlReport`
+                     after each batch is merged, to report progress
+    :type callback: :class:`collections.Callable`
+    :returns: the report of the crawl
+    :rtype: :class:`CrawlReport`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if not isinstance(stage, Stage):
+        raise TypeError('stage must be an instance of {0.__module__}.'
+                        '{0.__name__}, not {1!r}'.format(Stage, stage))
+    elif not isinstance(subscription_list, SubscriptionSet):
+        raise TypeError(
+            'subscription_list must be an instance of {0.__module__}.'
+            '{0.__name__}, not {1!r}'.format(SubscriptionSet,
+                                             subscription_list)
+        )
+    elif batch_size < 1:
+        raise ValueError('batch_size must be greater than 0, not ' +
+                         repr(batch_size))
+    elif callback is not None and not callable(callback):
+        raise TypeError('callback must be callable, not ' + repr(callback))
+    if queue_size is None:
+        queue_size = batch_size * 2
+    feed_ids = {}
+    for subscription in subscription_list.recursive_subscriptions:
+        feed_ids.setdefault(subscription.feed_uri, set()).add(
+            subscription.feed_id
+        )
+    report = CrawlReport()
+    started_at = time.time()
+    stream = crawl_stream(feed_ids, pool_size, timeout, validators, favicons,
+                          host_concurrency, host_delay, deadline=deadline,
+                          queue_size=queue_size)
+    batch = []
+    try:
+        for result in stream:
+            if isinstance(result, CrawlError):
+                report.errors.append(result)
+            elif result.not_modified:
+                report.not_modified += 1
+            else:
+                report.crawled += 1
+                batch.append(result)
+            if len(batch) >= batch_size:
+                _merge_batch(stage, feed_ids, batch, report)
+                batch = []
+                report.elapsed = time.time() - started_at
+                if callback is not None:
+                    callback(report)
+        if batch:
+            _merge_batch(stage, feed_ids, batch, report)
+    finally:
+        stream.cancel()
+    report.pending = stream.pending
+    report.elapsed = time.time() - started_at
+    logger = logging.getLogger(__name__ + '.crawl_into')
+    logger.info('%r', report)
+    if batch and callback is not None:
+        callback(report)
+    return report
+
+
+def _merge_batch(stage, feed_ids, batch, report):
+    with stage:
+        pairs = [(feed_id, result.feed)
+                 for result in batch
+                 for feed_id in sorted(feed_ids[result.url])]
+        stored = stage.feeds.get_many(feed_id for feed_id, _ in pairs)
+        for feed_id, feed in pairs:
+            try:
+                stored_feed = stored[feed_id]
+            except KeyError:
+                pass
+            else:
+                stored_entries = dict((entry.id, entry.updated_at)
+                                      for entry in stored_feed.entries)
+                if all(stored_entries.get(entry.id) == entry.updated_at
+                       for entry in feed.entries):
+                    report.unchanged += 1
+                    continue
+            # Entries are merged with the stored ones by the stage,
+            # so that their read and starred marks are kept.
+            stage.feeds[feed_id] = feed
+            report.updated += 1
+    report.batches += 1
 
-def get_feed(feed_url, timeout=DEFAULT_TIMEOUT):
+
+class CrawlReport(object):
+    """The report of :func:`crawl_into()`.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of feeds crawled and parsed.
+    crawled = 0
+
+    #: (:class:`numbers.Integral`) The number of feeds which are not
+    #: modified since the last crawl.  See also :class:`ValidatorCache`.
+    not_modified = 0
+
+    #: (:class:`numbers.Integral`) The number of stored feeds which are
+    #: written with new entries.
+    updated = 0
+
+    #: (:class:`numbers.Integral`) The number of stored feeds which are
+    #: skipped since their entries didn't change.
+    unchanged = 0
+
+    #: (:class:`numbers.Integral`) The number of transactions.
+    batches = 0
+
+    #: (:class:`numbers.Real`) The seconds elapsed.
+    elapsed = 0
+
+    #: (:class:`collections.Set`) Feed urls which were not crawled until
+    #: the deadline.
+    pending = frozenset()
+
+    def __init__(self):
+        #: (:class:`collections.Sequence`) :class:`CrawlError`\ s of feeds
+        #: which failed to be crawled.
+        self.errors = []
+
+    @property
+    def throughput(self):
+        """(:class:`numbers.Real`) The number of feeds completed per
+        second.
+
+        """
+        completed = self.crawled + self.not_modified + len(self.errors)
+        return completed / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            '<{0.__module__}.{0.__name__} crawled={1.crawled} '
+            'not_modified={1.not_modified} errors={2} updated={1.updated} '
+            'unchanged={1.unchanged} batches={1.batches} '
+            'elapsed={1.elapsed:.3f}>'.format(type(self), self,
+                                              len(self.errors))
+        )
+
+
+def get_feed(feed_url, timeout=DEFAULT_TIMEOUT, validators=None,
+             favicons=None):
     # TODO: should be documented
     logger = logging.getLogger(__name__ + '.get_feed')
     try:
-        f = open_url(feed_url, timeout=timeout)
-        feed_xml = f.read()
-        f.close()
-        parser = get_format(feed_xml)
-        if parser is None:
-            logger.warn('failed to detect the format of %s', feed_url)
-            logger.debug('the response body of %s:\n%s', feed_url, feed_xml)
-            raise CrawlError(feed_url,
-                             'failed to detect the format of ' + feed_url)
-        feed, crawler_hints = parser(feed_xml, feed_url)
-        self_uri = None
-        for link in feed.links:
-            if link.relation == 'self':
-                self_uri = link.uri
-        if not self_uri:
-            feed.links.append(Link(relation='self', uri=feed_url,
-                                   mimetype=f.info()['content-type']))
-        feed.entries = sorted(feed.entries, key=lambda entry: entry.updated_at,
-                              reverse=True)
-        favicon = feed.links.favicon
-        if favicon is None:
-            permalink = feed.links.permalink
-            if permalink:
-                try:
-                    f = open_url(permalink.uri, timeout=timeout)
-                except IOError:
-                    pass
-                else:
-                    content_type = f.headers['content-type']
-                    html = f.read()
-                    f.close()
-                    if isinstance(html, bytes) and \
-                       not isinstance(html, str):
-                        match = re.search(r';\s*charset\s*=\s*([^;\s]+)',
-                                          content_type)
-                        enc = match.group(1) if match else 'utf-8'
-                        html = html.decode(enc, 'replace')
-                    _, icon_urls = AutoDiscovery().find(html)
-                    if icon_urls:
-                        favicon = urlparse.urljoin(permalink.uri,
-                                                   icon_urls[0])
-                if favicon is None:
-                    favicon = urlparse.urljoin(permalink.uri, '/favicon.ico')
-                    req = Request(favicon, method='HEAD')
-                    try:
-                        f = open_url(req, timeout=timeout)
-                    except (IOError, OSError):
-                        favicon = None
-                    else:
-                        if f.getcode() != 200:
-                            favicon = None
-                        f.close()
-        else:
-            favicon = favicon.uri
+        fetched = _fetch_feed(feed_url, timeout, validators, stream=True)
+        if isinstance(fetched, CrawlResult):
+            return fetched
+        feed_xml, content_type, validator = fetched
+        feed, crawler_hints = parse_feed(feed_url, feed_xml, content_type)
+        if validators is not None:
+            validators.update(feed_url, *validator)
+        favicon = _get_favicon(feed, timeout, favicons)
         return CrawlResult(feed_url, feed, crawler_hints, favicon)
     except Exception as e:
         logger.exception(
@@ -145,6 +835,166 @@ def get_feed(feed_url, timeout=DEFAULT_TIMEOUT):
         raise CrawlError(feed_url, '{0} failed: {1}'.format(feed_url, e))
 
 
+def _fetch_feed(feed_url, timeout, validators, stream=False):
+    """Fetch the ``feed_url``.  It returns a triple of (the response body,
+    :mailheader:`Content-Type`, a pair of validators), or a not modified
+    :class:`CrawlResult`.  If ``stream`` is :const:`True` the body is
+    an iterable of chunks which are read from the socket while they are
+    consumed.  Validators aren't stored to ``validators`` until the body
+    is parsed, so that a broken response isn't cached.
+
+    """
+    request = Request(feed_url)
+    if validators is not None:
+        for name, value in validators.get_headers(feed_url).items():
+            request.add_header(name, value)
+    try:
+        f = open_url(request, timeout=timeout)
+    except urllib2.HTTPError as e:
+        if e.code == 304 and validators is not None:
+            return CrawlResult(feed_url, None, None, not_modified=True)
+        raise
+    info = f.info()
+    chunks = read_response(f)
+    feed_xml = chunks if stream else b''.join(chunks)
+    validator = info.get('etag'), info.get('last-modified')
+    return feed_xml, info['content-type'], validator
+
+
+def _get_favicon(feed, timeout, favicons):
+    favicon = feed.links.favicon
+    if favicon is not None:
+        return favicon.uri
+    permalink = feed.links.permalink
+    if not permalink:
+        return
+    elif favicons is None:
+        return find_favicon(permalink.uri, timeout)
+    found, favicon = favicons.lookup(permalink.uri)
+    if not found:
+        favicons.resolve(permalink.uri, timeout)
+    return favicon
+
+
+def find_favicon(page_url, timeout=DEFAULT_TIMEOUT):
+    """Find the favicon of the web page.  The ``page_url`` is fetched to
+    find the favicon link in it, and if there's no link
+    :file:`/favicon.ico` is probed.
+
+    :param page_url: the url of the web page e.g. the permalink of a feed
+    :type page_url: :class:`str`
+    :param timeout: optional timeout for connection attempts.
+                    :const:`DEFAULT_TIMEOUT` is used if omitted
+    :type timeout: :class:`numbers.Integral`
+    :returns: the absolute favicon url.  :const:`None` if the site
+              has no favicon
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    favicon = None
+    try:
+        f = open_url(page_url, timeout=timeout)
+    except IOError:
+        pass
+    else:
+        content_type = f.headers['content-type']
+        html = b''.join(read_response(f))
+        favicon = discover_favicon(page_url, html, content_type)
+    if favicon is None:
+        favicon = urlparse.urljoin(page_url, '/favicon.ico')
+        req = Request(favicon, method='HEAD')
+        try:
+            f = open_url(req, timeout=timeout)
+        except (IOError, OSError):
+            favicon = None
+        else:
+            if f.getcode() != 200:
+                favicon = None
+            f.close()
+    return favicon
+
+
+def parse_feed(feed_url, feed_xml, content_type=None):
+    """Parse the fetched ``feed_xml`` of the ``feed_url``.  Its format is
+    detected, and its entries are sorted by their update time.  If it has
+    no ``self`` link the ``feed_url`` is added.
+
+    :param feed_url: the url of the feed
+    :type feed_url: :class:`str`
+    :param feed_xml: the fetched document.  it can be an iterable of
+                     byte chunks as well, which is parsed incrementally
+                     while chunks are read
+    :type feed_xml: :class:`bytes`, :class:`collections.Iterable`
+    :param content_type: the :mailheader:`Content-Type` of the response
+    :type content_type: :class:`str`
+    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hints)
+    :rtype: :class:`tuple`
+    :raises CrawlError: when the format of the document cannot be detected
+
+    .. versionadded:: 0.4.0
+
+    """
+    logger = logging.getLogger(__name__ + '.get_feed')
+    try:
+        document = parse_xml(feed_xml)
+    except Exception as e:
+        logger.warning(e, exc_info=True)
+        parser = None
+    else:
+        parser = get_format(document)
+    finally:
+        # Streamed chunks may hold the response open if parsing stopped
+        # halfway.
+        close = getattr(feed_xml, 'close', None)
+        if callable(close):
+            close()
+    if parser is None:
+        logger.warn('failed to detect the format of %s', feed_url)
+        if isinstance(feed_xml, bytes):
+            logger.debug('the response body of %s:\n%s', feed_url, feed_xml)
+        raise CrawlError(feed_url,
+                         'failed to detect the format of ' + feed_url)
+    feed, crawler_hints = parser(document, feed_url)
+    self_uri = None
+    for link in feed.links:
+        if link.relation == 'self':
+            self_uri = link.uri
+    if not self_uri:
+        feed.links.append(Link(relation='self', uri=feed_url,
+                               mimetype=content_type))
+    feed.entries = sorted(feed.entries, key=lambda entry: entry.updated_at,
+                          reverse=True)
+    return feed, crawler_hints
+
+
+def discover_favicon(page_url, html, content_type=None):
+    """Find the favicon url from the ``html`` of the ``page_url``.
+
+    :param page_url: the url of the web page
+    :type page_url: :class:`str`
+    :param html: the html of the web page
+    :type html: :class:`bytes`, :class:`str`
+    :param content_type: the :mailheader:`Content-Type` of the page.
+                         it's used to decode the ``html``
+    :type content_type: :class:`str`
+    :returns: the absolute favicon url.  :const:`None` if the page has
+              no favicon link
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if isinstance(html, bytes) and not isinstance(html, str):
+        match = re.search(r';\s*charset\s*=\s*([^;\s]+)', content_type or '')
+        enc = match.group(1) if match else 'utf-8'
+        html = html.decode(enc, 'replace')
+    _, icon_urls = AutoDiscovery().find(html)
+    if icon_urls:
+        return urlparse.urljoin(page_url, icon_urls[0])
+
+
 class CrawlResult(collections.Sequence):
     """The result of each crawl of a feed.
 
@@ -166,17 +1016,34 @@ class CrawlResult(collections.Sequence):
     #: (:class:`collections.Mapping`) The extra hints for the crawler
     #: e.g. ``skipHours``, ``skipMinutes``, ``skipDays``.
     #: It might be :const:`None`.
+    #:
+    #: .. seealso::
+    #:
+    #:    :func:`libearth.parser.rss2.parse_crawler_hints()`
+    #:       The available hints.
+    #:
+    #:    :class:`libearth.schedule.FeedScheduler`
+    #:       Schedules the next crawls by hints.
     hints = None
 
     #: (:class:`str`) The favicon url of the :attr:`feed` if exists.
     #: It might be :const:`None`.
     icon_url = None
 
-    def __init__(self, url, feed, hints, icon_url=None):
+    #: (:class:`bool`) Whether the feed was not modified since the last
+    #: crawl.  If it's :const:`True` the response had no body, so
+    #: :attr:`feed`, :attr:`hints` and :attr:`icon_url` are all
+    #: :const:`None`.
+    #:
+    #: .. versionadded:: 0.4.0
+    not_modified = False
+
+    def __init__(self, url, feed, hints, icon_url=None, not_modified=False):
         self.url = url
         self.feed = feed
         self.hints = hints
         self.icon_url = icon_url
+        self.not_modified = bool(not_modified)
 
     def add_as_subscription(self, subscription_set):
         """Add it as a subscription to the given ``subscription_set``.
@@ -188,6 +1055,9 @@ class CrawlResult(collections.Sequence):
         :rtype: :class:`~libearth.subscribe.Subscription`
 
         """
+        if self.not_modified:
+            raise ValueError('{0!r} was not modified; it has no feed to '
+                             'subscribe'.format(self.url))
         if not isinstance(subscription_set, SubscriptionSet):
             raise TypeError(
                 'expected an instance of {0.__module__}.{0.__name__}, '
@@ -208,6 +1078,523 @@ class CrawlResult(collections.Sequence):
         raise IndexError('index out of range')
 
 
+class Decompressor(object):
+    """Decompress a response body incrementally according to its
+    :mailheader:`Content-Encoding`.  Both zlib-wrapped and raw
+    ``deflate`` streams are accepted since servers disagree on it.
+
+    .. code-block:: python
+
+       decompressor = Decompressor(response.headers.get('content-encoding'))
+       for data in blocks:
+           yield decompressor.decompress(data)
+       yield decompressor.flush()
+
+    :param content_encoding: the :mailheader:`Content-Encoding` of
+                             the response.  :const:`None` or
+                             ``'identity'`` means not compressed
+    :type content_encoding: :class:`str`
+    :raises ValueError: when the ``content_encoding`` is unsupported
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self, content_encoding=None):
+        encoding = (content_encoding or 'identity').strip().lower()
+        self.pending = b''
+        if encoding in ('gzip', 'x-gzip'):
+            self.decompressobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            # Detected from the first two bytes.
+            self.decompressobj = None
+        elif encoding == 'identity':
+            self.decompressobj = False
+        else:
+            raise ValueError('unsupported content encoding: ' +
+                             repr(content_encoding))
+
+    def decompress(self, data):
+        """Decompress the next block of the body.
+
+        :param data: the next block of the compressed body
+        :type data: :class:`bytes`
+        :returns: the decompressed data so far.  it might be empty
+        :rtype: :class:`bytes`
+
+        """
+        if self.decompressobj is False:
+            return data
+        elif self.decompressobj is None:
+            self.pending += data
+            if len(self.pending) < 2:
+                return b''
+            data = self.pending
+            self.pending = b''
+            header = bytearray(data[:2])
+            if header[0] & 0x0f == 8 and (header[0] << 8 | header[1]) % 31 == 0:
+                wbits = zlib.MAX_WBITS
+            else:
+                wbits = -zlib.MAX_WBITS
+            self.decompressobj = zlib.decompressobj(wbits)
+        try:
+            return self.decompressobj.decompress(data)
+        except zlib.error as e:
+            raise IOError('failed to decompress: {0}'.format(e))
+
+    def flush(self):
+        """Decompress the rest of the body.
+
+        :returns: the rest of the decompressed data
+        :rtype: :class:`bytes`
+
+        """
+        if self.decompressobj is False:
+            return b''
+        elif self.decompressobj is None:
+            if not self.pending:
+                return b''
+            self.decompressobj = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self.decompress(self.pending)
+            self.pending = b''
+            return data + self.flush()
+        return self.decompressobj.flush()
+
+
+class HostScheduler(object):
+    """Schedule feed urls so that requests to the same host are limited
+    to ``host_concurrency`` at a time, and started at least ``host_delay``
+    seconds apart.  Hosts are visited in round-robin, so while a host is
+    saturated workers take urls of other hosts instead of waiting.
+
+    Workers share a scheduler::
+
+        while True:
+            feed_url = scheduler.acquire()
+            if feed_url is None:
+                break
+            try:
+                crawl_feed(feed_url)
+            finally:
+                scheduler.release(feed_url)
+
+    :param feed_urls: feed urls to schedule
+    :type feed_urls: :class:`collections.Iterable`
+    :param host_concurrency: the maximum number of concurrent requests
+                             to the same host
+    :type host_concurrency: :class:`numbers.Integral`
+    :param host_delay: the minimum delay in seconds between starts of
+                       requests to the same host
+    :type host_delay: :class:`numbers.Real`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self, feed_urls, host_concurrency=DEFAULT_HOST_CONCURRENCY,
+                 host_delay=DEFAULT_HOST_DELAY):
+        if host_concurrency < 1:
+            raise ValueError('host_concurrency must be greater than 0, not ' +
+                             repr(host_concurrency))
+        elif host_delay < 0:
+            raise ValueError('host_delay cannot be negative, not ' +
+                             repr(host_delay))
+        self.feed_urls = list(feed_urls)
+        self.host_concurrency = host_concurrency
+        self.host_delay = host_delay
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.hosts = collections.deque()
+        self.running = {}
+        self.ready_at = {}
+        for feed_url in self.feed_urls:
+            host = self.get_host(feed_url)
+            if host not in self.pending:
+                self.pending[host] = collections.deque()
+                self.hosts.append(host)
+                self.running[host] = 0
+            self.pending[host].append(feed_url)
+
+    @staticmethod
+    def get_host(feed_url):
+        """Get the host which the ``feed_url`` belongs to.
+
+        :param feed_url: the feed url
+        :type feed_url: :class:`str`
+        :returns: the lowercased host name
+        :rtype: :class:`str`
+
+        """
+        return (urlparse.urlsplit(feed_url).hostname or '').lower()
+
+    def acquire(self):
+        """Take the next feed url to crawl.  It blocks until any host
+        becomes available.
+
+        :returns: the next feed url.  :const:`None` if there's no more
+                  feed urls to crawl
+        :rtype: :class:`str`
+
+        """
+        with self.condition:
+            while self.hosts:
+                now = time.time()
+                timeout = None
+                for _ in range(len(self.hosts)):
+                    host = self.hosts[0]
+                    self.hosts.rotate(-1)
+                    if self.running[host] >= self.host_concurrency:
+                        continue
+                    ready_at = self.ready_at.get(host, now)
+                    if ready_at > now:
+                        if timeout is None or ready_at - now < timeout:
+                            timeout = ready_at - now
+                        continue
+                    pending = self.pending[host]
+                    feed_url = pending.popleft()
+                    if not pending:
+                        del self.pending[host]
+                        self.hosts.remove(host)
+                    self.running[host] += 1
+                    self.ready_at[host] = now + self.host_delay
+                    return feed_url
+                self.condition.wait(timeout)
+
+    def release(self, feed_url):
+        """Mark the crawl of the ``feed_url`` done.
+
+        :param feed_url: the feed url which was taken by :meth:`acquire()`
+        :type feed_url: :class:`str`
+
+        """
+        with self.condition:
+            self.running[self.get_host(feed_url)] -= 1
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.feed_urls)
+
+
+class FaviconCache(object):
+    """The cache of favicons of sites.  Favicons are cached for each
+    origin (scheme, host and port) of web pages, so that feeds on
+    the same site share the favicon.  Sites without favicon are cached
+    as well, for shorter ``negative_ttl``.
+
+    On cache misses :meth:`resolve()` probes the site in a background
+    thread, so the crawl of the feed doesn't wait for it.  The favicon
+    becomes available from the next crawl.
+
+    The cache is kept in memory.  If ``repository`` and ``key`` are given
+    it's loaded from and :meth:`save()`\ d to the repository as well.
+
+    :param repository: the optional repository to persist the cache
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the key to store the cache in the ``repository``
+    :type key: :class:`collections.Sequence`
+    :param ttl: how long in seconds found favicons are cached.
+                a week by default
+    :type ttl: :class:`numbers.Real`
+    :param negative_ttl: how long in seconds sites without favicon are
+                         cached.  a day by default
+    :type negative_ttl: :class:`numbers.Real`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to persist
+    #: the cache.  It might be :const:`None`.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The key to store the cache in
+    #: the :attr:`repository`.
+    key = None
+
+    def __init__(self, repository=None, key=None, ttl=7 * 24 * 60 * 60,
+                 negative_ttl=24 * 60 * 60):
+        if repository is not None:
+            if not isinstance(repository, Repository):
+                raise TypeError(
+                    'repository must be an instance of {0.__module__}.'
+                    '{0.__name__}, not {1!r}'.format(Repository, repository)
+                )
+            elif key is None:
+                raise TypeError('key is required when repository is given')
+        self.repository = repository
+        self.key = key
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.favicons = {}
+        self.resolving = {}
+        if repository is not None:
+            try:
+                data = b''.join(repository.read(key))
+            except RepositoryKeyError:
+                pass
+            else:
+                for origin, favicon, expires_at in \
+                        json.loads(data.decode('utf-8')):
+                    self.favicons[origin] = favicon, expires_at
+
+    @staticmethod
+    def get_origin(url):
+        """Get the origin of the ``url``.
+
+        :param url: the url of a web page
+        :type url: :class:`str`
+        :returns: the origin e.g. ``'http://example.com:8080'``
+        :rtype: :class:`str`
+
+        """
+        parsed = urlparse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        origin = scheme + '://' + (parsed.hostname or '').lower()
+        if parsed.port and parsed.port != {'http': 80,
+                                           'https': 443}.get(scheme):
+            origin += ':{0}'.format(parsed.port)
+        return origin
+
+    def lookup(self, page_url, now=None):
+        """Look up the favicon of the site of the ``page_url``.
+
+        :param page_url: the url of a web page
+        :type page_url: :class:`str`
+        :param now: the current time in seconds since the epoch.
+                    :func:`time.time()` if omitted
+        :type now: :class:`numbers.Real`
+        :returns: a pair of (whether it's cached, the favicon url).
+                  the favicon url is :const:`None` if it isn't cached or
+                  the site has no favicon
+        :rtype: :class:`tuple`
+
+        """
+        if now is None:
+            now = time.time()
+        try:
+            favicon, expires_at = self.favicons[self.get_origin(page_url)]
+        except KeyError:
+            return False, None
+        if expires_at <= now:
+            return False, None
+        return True, favicon
+
+    def store(self, page_url, favicon, now=None):
+        """Cache the ``favicon`` of the site of the ``page_url``.
+
+        :param page_url: the url of a web page
+        :type page_url: :class:`str`
+        :param favicon: the favicon url.  :const:`None` if the site has
+                        no favicon
+        :type favicon: :class:`str`
+        :param now: the current time in seconds since the epoch.
+                    :func:`time.time()` if omitted
+        :type now: :class:`numbers.Real`
+
+        """
+        if now is None:
+            now = time.time()
+        ttl = self.negative_ttl if favicon is None else self.ttl
+        with self.lock:
+            self.favicons[self.get_origin(page_url)] = favicon, now + ttl
+
+    def resolve(self, page_url, timeout=DEFAULT_TIMEOUT):
+        """Find the favicon of the site of the ``page_url`` using
+        :func:`find_favicon()` in a background thread, and :meth:`store()`
+        it.  It immediately returns.  If the site is being probed already
+        it does nothing.
+
+        :param page_url: the url of a web page
+        :type page_url: :class:`str`
+        :param timeout: optional timeout for connection attempts.
+                        :const:`DEFAULT_TIMEOUT` is used if omitted
+        :type timeout: :class:`numbers.Integral`
+
+        """
+        origin = self.get_origin(page_url)
+        with self.lock:
+            if origin in self.resolving:
+                return
+            thread = threading.Thread(target=self._resolve,
+                                      args=(origin, page_url, timeout))
+            thread.daemon = True
+            self.resolving[origin] = thread
+        thread.start()
+
+    def _resolve(self, origin, page_url, timeout):
+        logger = logging.getLogger(__name__ + '.FaviconCache.resolve')
+        try:
+            self.store(page_url, find_favicon(page_url, timeout))
+        except Exception as e:
+            logger.exception('%s: %s', page_url, e)
+        finally:
+            with self.lock:
+                del self.resolving[origin]
+
+    def wait(self, timeout=None):
+        """Wait for sites being probed by :meth:`resolve()`.
+
+        :param timeout: the maximum number of seconds to wait for each
+                        probe.  waits forever if omitted
+        :type timeout: :class:`numbers.Real`
+
+        """
+        with self.lock:
+            threads = list(self.resolving.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def save(self):
+        """Write the cache to the :attr:`repository`.  Expired entries
+        are dropped.
+
+        :raises TypeError: when there's no :attr:`repository` to save to
+
+        """
+        if self.repository is None:
+            raise TypeError('there is no repository to save favicons to')
+        now = time.time()
+        with self.lock:
+            data = sorted(
+                [origin, favicon, expires_at]
+                for origin, (favicon, expires_at) in self.favicons.items()
+                if expires_at > now
+            )
+        self.repository.write(self.key, [json.dumps(data).encode('utf-8')])
+
+    def __len__(self):
+        return len(self.favicons)
+
+
+class ValidatorCache(object):
+    """The cache of validators (:mailheader:`ETag` and
+    :mailheader:`Last-Modified`) of crawled feeds.  Crawlers send these
+    back as :mailheader:`If-None-Match` and :mailheader:`If-Modified-Since`
+    so that servers can respond with ``304 Not Modified`` instead of
+    the whole feed if it hasn't changed.
+
+    Validators are kept in memory.  If ``repository`` and ``key`` are
+    given these are loaded from and :meth:`save()`\ d to the repository
+    as well::
+
+        validators = ValidatorCache(repository, ['.validators'])
+        for result in crawl(feed_urls, 4, validators=validators):
+            if not result.not_modified:
+                ...
+        validators.save()
+
+    :param repository: the optional repository to persist validators
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the key to store validators in the ``repository``
+    :type key: :class:`collections.Sequence`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to persist
+    #: validators.  It might be :const:`None`.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The key to store validators in
+    #: the :attr:`repository`.
+    key = None
+
+    def __init__(self, repository=None, key=None):
+        if repository is not None:
+            if not isinstance(repository, Repository):
+                raise TypeError(
+                    'repository must be an instance of {0.__module__}.'
+                    '{0.__name__}, not {1!r}'.format(Repository, repository)
+                )
+            elif key is None:
+                raise TypeError('key is required when repository is given')
+        self.repository = repository
+        self.key = key
+        self.lock = threading.Lock()
+        self.validators = {}
+        if repository is not None:
+            try:
+                data = b''.join(repository.read(key))
+            except RepositoryKeyError:
+                pass
+            else:
+                for url, etag, last_modified in \
+                        json.loads(data.decode('utf-8')):
+                    self.validators[url] = etag, last_modified
+
+    def get(self, feed_url):
+        """Get the validators of the ``feed_url``.
+
+        :param feed_url: the feed url
+        :type feed_url: :class:`str`
+        :returns: a pair of (:mailheader:`ETag`, :mailheader:`Last-Modified`).
+                  both might be :const:`None`
+        :rtype: :class:`tuple`
+
+        """
+        return self.validators.get(feed_url, (None, None))
+
+    def get_headers(self, feed_url):
+        """Make conditional request headers for the ``feed_url``.
+
+        :param feed_url: the feed url
+        :type feed_url: :class:`str`
+        :returns: the mapping of request header names to values.
+                  it's empty if there's no validators of the ``feed_url``
+        :rtype: :class:`collections.Mapping`
+
+        """
+        etag, last_modified = self.get(feed_url)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def update(self, feed_url, etag, last_modified):
+        """Store the validators of the response of the ``feed_url``.
+        If both are :const:`None` the previous validators are forgotten.
+
+        :param feed_url: the feed url
+        :type feed_url: :class:`str`
+        :param etag: the :mailheader:`ETag` of the response
+        :type etag: :class:`str`
+        :param last_modified: the :mailheader:`Last-Modified` of
+                              the response
+        :type last_modified: :class:`str`
+
+        """
+        with self.lock:
+            if etag or last_modified:
+                self.validators[feed_url] = etag or None, last_modified or None
+            else:
+                self.validators.pop(feed_url, None)
+
+    def save(self):
+        """Write validators to the :attr:`repository`.
+
+        :raises TypeError: when there's no :attr:`repository` to save to
+
+        """
+        if self.repository is None:
+            raise TypeError('there is no repository to save validators to')
+        with self.lock:
+            data = sorted(
+                [url, etag, last_modified]
+                for url, (etag, last_modified) in self.validators.items()
+            )
+        self.repository.write(self.key, [json.dumps(data).encode('utf-8')])
+
+    def __len__(self):
+        return len(self.validators)
+
+    def __contains__(self, feed_url):
+        return feed_url in self.validators
+
+
 class CrawlError(IOError):
     """Error which rises when crawling given url failed.
 
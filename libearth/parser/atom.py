@@ -14,12 +14,11 @@ except ImportError:
     import urllib.parse as urlparse
 
 from ..codecs import Rfc3339, Rfc822
-from ..compat.etree import fromstring
 from ..feed import (Category, Content, Entry, Feed, Generator, Link,
                     Person, Source, Text)
 from ..schema import DecodeError
 from .base import ParserBase, SessionBase, get_element_id
-from .util import normalize_xml_encoding
+from .util import parse_syndication_hints, parse_xml
 
 __all__ = ('ATOM_XMLNS_SET', 'AtomSession', 'XML_XMLNS',
            'get_xml_base', 'parse_atom')
@@ -216,8 +215,10 @@ def parse_atom(xml, feed_url, need_entries=True):
     """Atom parser.  It parses the Atom XML and returns the feed data
     as internal representation.
 
-    :param xml: target atom xml to parse
-    :type xml: :class:`str`
+    :param xml: target atom xml to parse.  it can be an iterable of
+                byte chunks as well, which is parsed incrementally
+                (see :func:`~libearth.parser.util.parse_xml()`)
+    :type xml: :class:`str`, :class:`collections.Iterable`
     :param feed_url: the url used to retrieve the atom feed.
                      it will be the base url when there are any relative
                      urls without ``xml:base`` attribute
@@ -226,11 +227,20 @@ def parse_atom(xml, feed_url, need_entries=True):
                         it's useful to ignore items when retrieve
                         ``<source>`` in rss 2.0.  :const:`True` by default.
     :type parse_item: :class:`bool`
-    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint)
+    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint).
+              crawler hint is filled from syndication module elements
+              (see :func:`~libearth.parser.util.parse_syndication_hints()`),
+              or :const:`None` if there are no hints
     :rtype: :class:`tuple`
 
+    .. versionchanged:: 0.4.0
+       Crawler hint became filled from syndication module elements.
+
+    .. versionchanged:: 0.4.0
+       The ``xml`` can be an iterable of byte chunks.
+
     """
-    root = fromstring(normalize_xml_encoding(xml))
+    root = parse_xml(xml)
     for atom_xmlns in ATOM_XMLNS_SET:
         if root.tag.startswith('{' + atom_xmlns + '}'):
             break
@@ -245,4 +255,6 @@ def parse_atom(xml, feed_url, need_entries=True):
         for entry in entries:
             entry_list.append(parse_entry(entry, session))
         feed_data.entries = entry_list
-    return feed_data, None
+    hints = {}
+    parse_syndication_hints(root, hints)
+    return feed_data, hints or None
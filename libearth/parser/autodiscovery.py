@@ -17,10 +17,9 @@ except ImportError:
     import urllib.parse as urlparse
 
 from ..compat import text
-from ..compat.etree import fromstring
 from .atom import parse_atom
 from .rss2 import parse_rss
-from .util import normalize_xml_encoding
+from .util import parse_xml
 
 
 __all__ = ('ATOM_TYPE', 'RSS_TYPE', 'TYPE_TABLE', 'AutoDiscovery', 'FeedLink',
@@ -158,8 +157,11 @@ class FeedUrlNotFoundError(Exception):
 def get_format(document):
     """Guess the syndication format of an arbitrary ``document``.
 
-    :param document: document string to guess
-    :type document: :class:`str`, :class:`bytes`
+    :param document: document string to guess.  it can be an iterable
+                     of byte chunks or an element already parsed as well
+                     (see :func:`~libearth.parser.util.parse_xml()`)
+    :type document: :class:`str`, :class:`bytes`,
+                    :class:`collections.Iterable`
     :returns: the function possible to parse the given ``document``
     :rtype: :class:`collections.Callable`
 
@@ -168,10 +170,12 @@ def get_format(document):
        removed now) before 0.2.0, but now it's moved to
        :mod:`libearth.parser.autodiscovery`.
 
+    .. versionchanged:: 0.4.0
+       The ``document`` can be an iterable of byte chunks or an element.
+
     """
-    document = normalize_xml_encoding(document)
     try:
-        root = fromstring(document)
+        root = parse_xml(document)
     except Exception as e:
         logger = logging.getLogger(__name__ + '.get_format')
         logger.debug('document = %r', document)
@@ -15,14 +15,13 @@ except ImportError:
 
 from ..codecs import Rfc3339, Rfc822
 from ..compat import IRON_PYTHON
-from ..compat.etree import fromstring
 from ..feed import (Category, Content, Entry, Feed, Generator, Link,
                     Person, Text)
 from ..schema import DecodeError
 from ..tz import FixedOffset, guess_tzinfo_by_locale, now, utc
 from .atom import ATOM_XMLNS_SET
 from .base import ParserBase, SessionBase
-from .util import normalize_xml_encoding
+from .util import WEEKDAYS, parse_syndication_hints, parse_xml
 
 
 GUID_PATTERN = re.compile('^(\{{0,1}([0-9a-fA-F]){8}-([0-9a-fA-F]){4}-([0-9'
@@ -247,17 +246,27 @@ def parse_rss(xml, feed_url=None, parse_entry=True):
     If ``pubDate`` is not present, ``updated`` field will be from
     the latest entry's ``updated`` time, or the time it's crawled instead.
 
-    :param xml: rss 2.0 xml string to parse
-    :type xml: :class:`str`
+    :param xml: rss 2.0 xml string to parse.  it can be an iterable of
+                byte chunks as well, which is parsed incrementally
+                (see :func:`~libearth.parser.util.parse_xml()`)
+    :type xml: :class:`str`, :class:`collections.Iterable`
     :param parse_item: whether to parse items (entries) as well.
                        it's useful when to ignore items when retrieve
                        ``<source>``.  :const:`True` by default
     :type parse_item: :class:`bool`
-    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint)
+    :returns: a pair of (:class:`~libearth.feed.Feed`, crawler hint).
+              see also :func:`parse_crawler_hints()` for crawler hint
     :rtype: :class:`tuple`
 
+    .. versionchanged:: 0.4.0
+       Crawler hint became filled from ``<ttl>``, ``<skipHours>``,
+       ``<skipDays>`` and syndication module elements.
+
+    .. versionchanged:: 0.4.0
+       The ``xml`` can be an iterable of byte chunks.
+
     """
-    root = fromstring(normalize_xml_encoding(xml))
+    root = parse_xml(xml)
     channel = root.find('channel')
     default_tzinfo = guess_default_tzinfo(root, feed_url)
     session = RSS2Session(feed_url, default_tzinfo)
@@ -269,7 +278,71 @@ def parse_rss(xml, feed_url=None, parse_entry=True):
             entry_list.append(parse_item(item, session))
         feed_data.entries = entry_list
     check_valid_as_atom(feed_data, session)
-    return feed_data, None
+    return feed_data, parse_crawler_hints(channel)
+
+
+def parse_crawler_hints(channel):
+    """Parse crawler hints of the ``channel``.  Hints are a mapping
+    which can have the following keys:
+
+    ``'ttl'``
+       (:class:`numbers.Integral`) The number of minutes the channel
+       can be cached before refreshing.
+
+    ``'skipHours'``
+       (:class:`frozenset`) Hours in GMT (0--23) when the channel
+       doesn't need to be refreshed.
+
+    ``'skipDays'``
+       (:class:`frozenset`) Days of the week e.g. ``'Saturday'`` when
+       the channel doesn't need to be refreshed.
+
+    ``'updatePeriod'``, ``'updateFrequency'``, ``'updateBase'``
+       See :func:`~libearth.parser.util.parse_syndication_hints()`.
+
+    Invalid values are ignored.
+
+    :param channel: the ``<channel>`` element
+    :type channel: :class:`xml.etree.ElementTree.Element`
+    :returns: crawler hints.  :const:`None` if there are no hints
+    :rtype: :class:`collections.Mapping`
+
+    .. versionadded:: 0.4.0
+
+    """
+    hints = {}
+    ttl = channel.find('ttl')
+    if ttl is not None and ttl.text:
+        try:
+            ttl = int(ttl.text.strip())
+        except ValueError:
+            pass
+        else:
+            if ttl > 0:
+                hints['ttl'] = ttl
+    skip_hours = set()
+    for hour in channel.findall('skipHours/hour'):
+        try:
+            hour = int((hour.text or '').strip())
+        except ValueError:
+            continue
+        if 0 <= hour < 24:
+            skip_hours.add(hour)
+        elif hour == 24:
+            # Some feeds count hours from 1 to 24.
+            skip_hours.add(0)
+    if skip_hours:
+        hints['skipHours'] = frozenset(skip_hours)
+    weekdays = dict((day.lower(), day) for day in WEEKDAYS)
+    skip_days = frozenset(
+        weekdays[day.text.strip().lower()]
+        for day in channel.findall('skipDays/day')
+        if day.text and day.text.strip().lower() in weekdays
+    )
+    if skip_days:
+        hints['skipDays'] = skip_days
+    parse_syndication_hints(channel, hints)
+    return hints or None
 
 
 def check_valid_as_atom(feed_data, session):
@@ -4,12 +4,47 @@
 .. versionadded:: 0.3.0
 
 """
+import codecs
+import itertools
 import logging
 import re
 
+from ..codecs import Rfc3339
 from ..compat import IRON_PYTHON, binary_type, text_type
+from ..compat.etree import fromstring, fromstringlist
+from ..schema import DecodeError
 
-__all__ = 'XML_ENCODING_PATTERN ', 'normalize_xml_encoding'
+__all__ = ('SYNDICATION_XMLNS', 'UPDATE_PERIODS', 'WEEKDAYS',
+           'XML_ENCODING_PATTERN ',
+           'normalize_xml_encoding', 'normalize_xml_encoding_chunks',
+           'parse_syndication_hints', 'parse_xml')
+
+
+#: (:class:`str`) The XML namespace of the `RSS syndication module`__.
+#:
+#: __ http://web.resource.org/rss/1.0/modules/syndication/
+#:
+#: .. versionadded:: 0.4.0
+SYNDICATION_XMLNS = 'http://purl.org/rss/1.0/modules/syndication/'
+
+#: (:class:`collections.Mapping`) The mapping of ``<sy:updatePeriod>``
+#: values to their length in seconds.
+#:
+#: .. versionadded:: 0.4.0
+UPDATE_PERIODS = {
+    'hourly': 60 * 60,
+    'daily': 24 * 60 * 60,
+    'weekly': 7 * 24 * 60 * 60,
+    'monthly': 30 * 24 * 60 * 60,
+    'yearly': 365 * 24 * 60 * 60
+}
+
+#: (:class:`collections.Sequence`) Day names used in ``<skipDays>``,
+#: in the order of :meth:`datetime.date.weekday()`.
+#:
+#: .. versionadded:: 0.4.0
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+            'Saturday', 'Sunday')
 
 
 XML_ENCODING_PATTERN = re.compile(br'''
@@ -51,3 +86,124 @@ def normalize_xml_encoding(document):
             if IRON_PYTHON:
                 document = bytes(document)
     return document.replace(b'\x1c', b'')
+
+
+def normalize_xml_encoding_chunks(chunks):
+    """Incremental version of :func:`normalize_xml_encoding()`.  It takes
+    chunks of an XML document instead of the whole document, and yields
+    normalized chunks as soon as they arrive.  Only the beginning of
+    the document is buffered until its XML declaration is complete.
+
+    :param chunks: chunks of the XML document
+    :type chunks: :class:`collections.Iterable`
+    :returns: chunks encoded in UTF-8
+    :rtype: :class:`collections.Iterable`
+
+    .. versionadded:: 0.4.0
+
+    """
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        if not isinstance(chunk, binary_type):
+            raise TypeError('chunks must be bytestrings, not ' + repr(chunk))
+        head += chunk
+        stripped = head.lstrip()
+        if b'?>' in head or (len(stripped) >= 5 and
+                             not stripped.startswith(b'<?xml')):
+            break
+    decoder = None
+    match = XML_ENCODING_PATTERN.match(head)
+    if match:
+        encoding = match.group(1) or match.group(2)
+        if encoding:
+            if not isinstance(encoding, str):
+                encoding = encoding.decode('ascii')
+            head = head[match.end():]
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            except LookupError as e:
+                logger = logging.getLogger(__name__ +
+                                           '.normalize_xml_encoding_chunks')
+                logger.warning(e, exc_info=True)
+    for chunk in itertools.chain([head], chunks):
+        if decoder is not None:
+            try:
+                chunk = decoder.decode(chunk).encode('utf-8')
+            except UnicodeError as e:
+                logger = logging.getLogger(__name__ +
+                                           '.normalize_xml_encoding_chunks')
+                logger.warning(e, exc_info=True)
+                decoder = None
+        if IRON_PYTHON:
+            chunk = bytes(chunk)
+        chunk = chunk.replace(b'\x1c', b'')
+        if chunk:
+            yield chunk
+    if decoder is not None:
+        chunk = decoder.decode(b'', True).encode('utf-8')
+        if chunk:
+            yield chunk
+
+
+def parse_xml(document):
+    """Parse the given XML ``document`` into an element tree.  The document
+    can be a string, or an iterable of byte chunks e.g. read from a socket.
+    Chunks are parsed incrementally as they are read, so the whole document
+    doesn't have to be held in memory, and parsing doesn't have to wait
+    until the last chunk arrives.  If an element is given it's returned
+    as it is, so a document once parsed can be passed to several parsers.
+
+    :param document: xml document to parse
+    :type document: :class:`str`, :class:`bytes`,
+                    :class:`collections.Iterable`
+    :returns: the root element
+    :rtype: :class:`xml.etree.ElementTree.Element`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if isinstance(document, (text_type, binary_type)):
+        return fromstring(normalize_xml_encoding(document))
+    elif hasattr(document, 'tag'):
+        return document
+    return fromstringlist(normalize_xml_encoding_chunks(document))
+
+
+def parse_syndication_hints(element, hints):
+    """Read ``<sy:updatePeriod>``, ``<sy:updateFrequency>`` and
+    ``<sy:updateBase>`` children of the ``element`` into crawler ``hints``.
+    Invalid values are ignored.
+
+    :param element: the ``<channel>`` or ``<feed>`` element
+    :type element: :class:`xml.etree.ElementTree.Element`
+    :param hints: the crawler hints to update
+    :type hints: :class:`collections.MutableMapping`
+
+    .. versionadded:: 0.4.0
+
+    """
+    def find_text(name):
+        child = element.find('{' + SYNDICATION_XMLNS + '}' + name)
+        if child is not None and child.text:
+            return child.text.strip()
+    period = find_text('updatePeriod')
+    if period and period.lower() in UPDATE_PERIODS:
+        hints['updatePeriod'] = period.lower()
+    frequency = find_text('updateFrequency')
+    if frequency:
+        try:
+            frequency = int(frequency)
+        except ValueError:
+            pass
+        else:
+            if frequency > 0:
+                hints['updateFrequency'] = frequency
+    base = find_text('updateBase')
+    if base:
+        # W3CDTF, which the module uses, allows to omit seconds.
+        base = re.sub(r'(T\d\d:\d\d)(?=[Z+-]|$)', r'\1:00', base)
+        try:
+            hints['updateBase'] = Rfc3339().decode(base)
+        except DecodeError:
+            pass
@@ -0,0 +1,10 @@
+""":mod:`libearth.repositories` --- Additional repository implementations
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This package contains :class:`~libearth.repository.Repository`
+implementations other than the builtin
+:class:`~libearth.repository.FileSystemRepository`.
+
+.. versionadded:: 0.4.0
+
+"""
@@ -0,0 +1,363 @@
+""":mod:`libearth.repositories.caching` --- Caching repository wrapper
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Some keys like ``subscriptions.<session>.xml`` and ``.sessions/*`` are
+read for almost every transaction of :class:`~libearth.stage.Stage`.
+:class:`CachingRepository` wraps other repository and keeps recently
+read values and :meth:`~libearth.repository.Repository.list()` results
+in memory, so that they don't hit the disk every time:
+
+.. code-block:: python
+
+   repository = CachingRepository(FileSystemRepository(path),
+                                  max_bytes=32 * 1024 * 1024)
+
+Values written through the wrapper invalidate the cache.  If other
+processes also write to the same repository, turn ``validate`` option on
+to make it check the modification time and the size of files before
+cached values are used.
+
+.. versionadded:: 0.4.0
+
+"""
+import contextlib
+import os
+import threading
+
+from ..repository import (FileSystemRepository, Repository,
+                          RepositoryKeyError, Watcher, iterate_chunks)
+
+__all__ = 'CachingRepository', 'InvalidatingWatcher'
+
+
+class CachingRepository(Repository):
+    """:class:`~libearth.repository.Repository` wrapper which caches values
+    and :meth:`list()` results of the ``inner`` repository in memory.
+    The least recently used ones are evicted first when the cache
+    becomes larger than ``max_bytes``.
+
+    :param inner: the repository to actually store values
+    :type inner: :class:`~libearth.repository.Repository`
+    :param max_bytes: the maximum size of the cache in bytes.
+                      16 MiB by default
+    :type max_bytes: :class:`numbers.Integral`
+    :param validate: whether to check the modification time and the size
+                     of backing files, and :meth:`stamp()` of directories,
+                     before cached values are used.
+                     it's available only if ``inner`` is
+                     a :class:`~libearth.repository.FileSystemRepository`.
+                     :const:`False` by default
+    :type validate: :class:`bool`
+    :param buffer_size: the size of chunks that :meth:`read()` produces
+                        for cached values.  65536 bytes by default
+    :type buffer_size: :class:`numbers.Integral`
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to actually
+    #: store values.
+    inner = None
+
+    #: (:class:`numbers.Integral`) The maximum size of the cache in bytes.
+    max_bytes = None
+
+    #: (:class:`numbers.Integral`) The current size of the cache in bytes.
+    current_bytes = 0
+
+    #: (:class:`numbers.Integral`) The number of cache hits.
+    hits = 0
+
+    #: (:class:`numbers.Integral`) The number of cache misses.
+    misses = 0
+
+    #: (:class:`numbers.Integral`) The number of evicted entries.
+    evictions = 0
+
+    def __init__(self, inner, max_bytes=16 * 1024 * 1024, validate=False,
+                 buffer_size=65536):
+        if not isinstance(inner, Repository):
+            raise TypeError(
+                'inner must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(Repository, inner)
+            )
+        elif validate and not isinstance(inner, FileSystemRepository):
+            raise ValueError(
+                'validate option is available only for '
+                '{0.__module__}.{0.__name__}'.format(FileSystemRepository)
+            )
+        self.inner = inner
+        self.max_bytes = max_bytes
+        self.validate = bool(validate)
+        self.buffer_size = buffer_size
+        self.lock = threading.RLock()
+        self.clear()
+
+    @property
+    def hit_rate(self):
+        """(:class:`numbers.Real`) The ratio of cache hits to all lookups.
+        It's 0 if there was no lookup yet.
+
+        """
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
+
+    def clear(self):
+        """Empty the cache and reset statistics."""
+        with self.lock:
+            # Entries are linked in the order of their use:
+            # [prev, next, cache_key, value, size, stamp].  The root link
+            # is a sentinel; root[1] is the least recently used entry.
+            root = []
+            root[:] = [root, root, None, None, 0, None]
+            self.root = root
+            self.entries = {}
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+            self.generation = 0
+
+    def _get(self, cache_key):
+        with self.lock:
+            link = self.entries.get(cache_key)
+            if link is None:
+                self.misses += 1
+                return None
+            if self.validate:
+                stamp = self._stamp(*cache_key)
+                valid = stamp is not None and link[5] == stamp
+            else:
+                valid = True
+            if not valid:
+                self._remove(link)
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Move the link to the most recently used end.
+            link_prev, link_next = link[0], link[1]
+            link_prev[1] = link_next
+            link_next[0] = link_prev
+            root = self.root
+            last = root[0]
+            last[1] = root[0] = link
+            link[0], link[1] = last, root
+            return link
+
+    def _put(self, cache_key, value, size, stamp, generation):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            # Values read before any invalidation (e.g. writes by other
+            # threads) must not be cached, since they could be stale.
+            if generation != self.generation:
+                return
+            link = self.entries.get(cache_key)
+            if link is not None:
+                self._remove(link)
+            root = self.root
+            last = root[0]
+            link = [last, root, cache_key, value, size, stamp]
+            last[1] = root[0] = link
+            self.entries[cache_key] = link
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(root[1])
+                self.evictions += 1
+
+    def _remove(self, link):
+        link_prev, link_next = link[0], link[1]
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+        del self.entries[link[2]]
+        self.current_bytes -= link[4]
+
+    def _stamp(self, operation, key):
+        if not self.validate:
+            return None
+        elif operation == 'list':
+            # A new key of a sharded repository is made in one of shard
+            # directories, so the directory of the key itself might not
+            # change.  The inner repository knows how to stamp it.
+            try:
+                return self.inner.stamp(key)
+            except RepositoryKeyError:
+                return None
+        try:
+            stat = os.stat(self.inner.get_path(key))
+        except OSError:
+            return None
+        # The inode number changes when a file is replaced by renaming,
+        # even if the modification time doesn't change in its resolution.
+        return stat.st_ino, stat.st_mtime, stat.st_size
+
+    def invalidate(self, key=None):
+        """Invalidate cached entries of the ``key``, and :meth:`list()`
+        results of its upper keys.  It has to be called if other processes
+        write to the ``inner`` repository and ``validate`` option is off.
+
+        :param key: the key to invalidate.  the whole cache is invalidated
+                    if it's omitted
+        :type key: :class:`collections.Sequence`
+
+        """
+        with self.lock:
+            self.generation += 1
+            if key is None:
+                root = self.root
+                while root[1] is not root:
+                    self._remove(root[1])
+                return
+            key = tuple(key)
+            cache_keys = [('read', key), ('list', key)]
+            cache_keys.extend(('list', key[:i]) for i in range(len(key)))
+            for cache_key in cache_keys:
+                link = self.entries.get(cache_key)
+                if link is not None:
+                    self._remove(link)
+
+    def to_url(self, scheme):
+        return self.inner.to_url(scheme)
+
+    def read(self, key):
+        super(CachingRepository, self).read(key)
+        cache_key = 'read', tuple(key)
+        link = self._get(cache_key)
+        if link is not None:
+            return iterate_chunks(link[3], self.buffer_size)
+        generation = self.generation
+        stamp = self._stamp('read', key)
+        value = b''.join(self.inner.read(key))
+        self._put(cache_key, value, len(value), stamp, generation)
+        return iterate_chunks(value, self.buffer_size)
+
+    def read_many(self, keys):
+        """Read several values at once.  Only values that aren't cached
+        are read from the ``inner`` repository through its
+        :meth:`~libearth.repository.Repository.read_many()`.
+
+        """
+        super(CachingRepository, self).read_many(keys)
+        keys = list(keys)
+        values = [None] * len(keys)
+        missed = []
+        for i, key in enumerate(keys):
+            super(CachingRepository, self).read(key)
+            link = self._get(('read', tuple(key)))
+            if link is None:
+                missed.append(i)
+            else:
+                values[i] = link[3]
+        if missed:
+            generation = self.generation
+            stamps = [self._stamp('read', keys[i]) for i in missed]
+            chunks_list = self.inner.read_many([keys[i] for i in missed])
+            for i, stamp, chunks in zip(missed, stamps, chunks_list):
+                value = b''.join(chunks)
+                self._put(('read', tuple(keys[i])), value, len(value),
+                          stamp, generation)
+                values[i] = value
+        return [iterate_chunks(value, self.buffer_size) for value in values]
+
+    def write(self, key, iterable):
+        super(CachingRepository, self).write(key, iterable)
+        try:
+            self.inner.write(key, iterable)
+        finally:
+            self.invalidate(key)
+
+    def write_many(self, items):
+        super(CachingRepository, self).write_many(items)
+        items = list(items)
+        try:
+            self.inner.write_many(items)
+        finally:
+            for key, _ in items:
+                self.invalidate(key)
+
+    def exists(self, key):
+        super(CachingRepository, self).exists(key)
+        key = tuple(key)
+        if key and not self.validate:
+            # A cached list of the upper key tells it without any I/O.
+            with self.lock:
+                link = self.entries.get(('list', key[:-1]))
+                if link is not None:
+                    return key[-1] in link[3]
+        return self.inner.exists(key)
+
+    def list(self, key):
+        super(CachingRepository, self).list(key)
+        cache_key = 'list', tuple(key)
+        link = self._get(cache_key)
+        if link is not None:
+            return link[3]
+        generation = self.generation
+        stamp = self._stamp('list', key)
+        names = frozenset(self.inner.list(key))
+        size = sum(len(name) for name in names)
+        self._put(cache_key, names, size, stamp, generation)
+        return names
+
+    def stamp(self, key):
+        """Stamp the ``key`` of the ``inner`` repository, so that changes
+        behind the cache are noticed as well.
+
+        """
+        super(CachingRepository, self).stamp(key)
+        return self.inner.stamp(key)
+
+    def watch(self, key, interval=1.0):
+        """Watch changes of the ``inner`` repository.  Changed keys are
+        also :meth:`invalidate()`\ d when they are yielded, so it can be
+        used instead of ``validate`` option to notice changes made by
+        other processes.
+
+        """
+        super(CachingRepository, self).watch(key, interval)
+        return InvalidatingWatcher(self, self.inner.watch(key, interval))
+
+    def lock_keys(self, keys):
+        """Lock the ``keys`` of the ``inner`` repository.  Cached values
+        of the keys are :meth:`invalidate()`\ d as soon as they are locked,
+        since other processes could have changed them before.
+
+        """
+        super(CachingRepository, self).lock_keys(keys)
+        return self._hold_locks(list(keys))
+
+    @contextlib.contextmanager
+    def _hold_locks(self, keys):
+        with self.inner.lock_keys(keys):
+            for key in keys:
+                self.invalidate(key)
+            yield
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, max_bytes={2!r})'.format(
+            type(self), self.inner, self.max_bytes
+        )
+
+
+class InvalidatingWatcher(Watcher):
+    """:class:`~libearth.repository.Watcher` which invalidates changed keys
+    in the :class:`CachingRepository` as they are found.
+
+    :param repository: the caching repository to invalidate
+    :type repository: :class:`CachingRepository`
+    :param watcher: the watcher of the inner repository
+    :type watcher: :class:`~libearth.repository.Watcher`
+
+    """
+
+    def __init__(self, repository, watcher):
+        super(InvalidatingWatcher, self).__init__()
+        self.repository = repository
+        self.watcher = watcher
+
+    def poll(self, timeout=None):
+        keys = self.watcher.poll(timeout)
+        for key in keys:
+            self.repository.invalidate(key)
+        return keys
+
+    def close(self):
+        super(InvalidatingWatcher, self).close()
+        self.watcher.close()
@@ -0,0 +1,275 @@
+""":mod:`libearth.repositories.compressed` --- Compressing repository wrapper
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Feed documents are highly redundant XML, so they usually compress
+5--10 times.  :class:`CompressedRepository` wraps other repository
+and compresses values when they are written, and decompresses them
+chunk by chunk when they are read, so that the parser can consume
+the decompressed document incrementally.
+
+Every compressed value starts with a :const:`HEADER_MAGIC` and the name
+of the codec.  Values without the header are read as they are, so
+a repository which has both compressed and uncompressed values (e.g.
+while it's being migrated) keeps working:
+
+.. code-block:: python
+
+   repository = CompressedRepository(FileSystemRepository(path))
+
+.. versionadded:: 0.4.0
+
+"""
+import zlib
+
+from ..compat import binary
+from ..repository import Repository
+
+__all__ = ('CODECS', 'HEADER_MAGIC', 'CompressedRepository', 'Codec',
+           'compress_chunks', 'decompress_chunks')
+
+
+#: (:class:`bytes`) The magic bytes that every compressed value starts with.
+#: Followed by a byte of the length of the codec name, and the codec name.
+#: Since XML documents cannot start with ``0x89`` byte, it doesn't conflict
+#: with uncompressed values.
+HEADER_MAGIC = b'\x89LEC'
+
+
+class Codec(object):
+    """Compression codec which consists of factories of incremental
+    compressor and decompressor objects.
+
+    :param name: the codec name to be stored in headers.
+                 it must be ASCII and shorter than 256 bytes
+    :type name: :class:`str`
+    :param compressor: the factory function that takes a compression
+                       ``level`` and returns a compressor object which
+                       has ``compress(data)`` and ``flush()`` methods
+    :type compressor: :class:`collections.Callable`
+    :param decompressor: the factory function that returns
+                         a decompressor object which has
+                         ``decompress(data)`` method
+    :type decompressor: :class:`collections.Callable`
+
+    """
+
+    def __init__(self, name, compressor, decompressor):
+        self.name = name
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    @property
+    def header(self):
+        """(:class:`bytes`) The header of values compressed by the codec."""
+        name = binary(self.name)
+        return HEADER_MAGIC + bytes(bytearray([len(name)])) + name
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.name)
+
+
+#: (:class:`collections.Mapping`) The mapping of available codec names to
+#: :class:`Codec` objects.  ``'zlib'`` is always available, and ``'bz2'``
+#: and ``'lzma'`` are available only if the corresponding modules
+#: are installed.
+CODECS = {
+    'zlib': Codec('zlib', zlib.compressobj, zlib.decompressobj)
+}
+
+try:
+    import bz2
+except ImportError:
+    pass
+else:
+    CODECS['bz2'] = Codec('bz2', bz2.BZ2Compressor, bz2.BZ2Decompressor)
+
+try:
+    import lzma
+except ImportError:
+    pass
+else:
+    CODECS['lzma'] = Codec('lzma',
+                           lambda level: lzma.LZMACompressor(preset=level),
+                           lzma.LZMADecompressor)
+
+
+def compress_chunks(codec, chunks, level=6):
+    """Compress the ``chunks`` incrementally.  The first chunk it yields
+    is the header of the ``codec``.
+
+    :param codec: the codec to compress
+    :type codec: :class:`Codec`
+    :param chunks: the iterable of chunks to compress
+    :type chunks: :class:`collections.Iterable`
+    :param level: the compression level.  6 by default
+    :type level: :class:`numbers.Integral`
+    :returns: the iterable of compressed chunks
+    :rtype: :class:`collections.Iterable`
+
+    """
+    compressor = codec.compressor(level)
+    yield codec.header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def decompress_chunks(chunks):
+    """Decompress the ``chunks`` incrementally if they have the header of
+    a codec.  If they don't have any header they are yielded as they are.
+
+    :param chunks: the iterable of possibly compressed chunks
+    :type chunks: :class:`collections.Iterable`
+    :returns: the iterable of decompressed chunks
+    :rtype: :class:`collections.Iterable`
+    :raises ValueError: when the header refers unknown codec
+
+    """
+    # Note that iter() must be called only once, because FileIterator
+    # reopens the file every time iter() is called on it.
+    iterator = iter(chunks)
+    head = b''
+    magic_size = len(HEADER_MAGIC)
+    # Read chunks until the whole header is read or it turns out to be
+    # uncompressed.
+    while len(head) <= magic_size or \
+            len(head) <= magic_size + bytearray(head)[magic_size]:
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            if head:
+                yield head
+            return
+        head += bytes(chunk)
+        if not HEADER_MAGIC.startswith(head[:magic_size]):
+            yield head
+            for chunk in _iterate_rest(iterator):
+                yield chunk
+            return
+    name_size = bytearray(head)[magic_size]
+    offset = magic_size + 1
+    name = head[offset:offset + name_size].decode('ascii')
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        raise ValueError('unknown codec: ' + repr(name))
+    decompressor = codec.decompressor()
+    data = decompressor.decompress(head[offset + name_size:])
+    if data:
+        yield data
+    for chunk in _iterate_rest(iterator):
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    flush = getattr(decompressor, 'flush', None)
+    if flush is not None:
+        data = flush()
+        if data:
+            yield data
+
+
+def _iterate_rest(iterator):
+    while True:
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        yield chunk
+
+
+class CompressedRepository(Repository):
+    """:class:`~libearth.repository.Repository` wrapper which compresses
+    values of the ``inner`` repository.
+
+    :param inner: the repository to actually store values
+    :type inner: :class:`~libearth.repository.Repository`
+    :param codec: the name of the codec to compress values.
+                  see also :data:`CODECS`.  if it's :const:`None` values
+                  are written uncompressed, but compressed values still
+                  can be read.  ``'zlib'`` by default
+    :type codec: :class:`str`
+    :param level: the compression level.  6 by default
+    :type level: :class:`numbers.Integral`
+    :raises ValueError: when the ``codec`` is unavailable
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to actually
+    #: store values.
+    inner = None
+
+    #: (:class:`Codec`) The codec to compress values.  :const:`None` if
+    #: values are written uncompressed.
+    codec = None
+
+    def __init__(self, inner, codec='zlib', level=6):
+        if not isinstance(inner, Repository):
+            raise TypeError(
+                'inner must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(Repository, inner)
+            )
+        if codec is not None:
+            try:
+                codec = CODECS[codec]
+            except KeyError:
+                raise ValueError('unavailable codec: ' + repr(codec))
+        self.inner = inner
+        self.codec = codec
+        self.level = level
+
+    def to_url(self, scheme):
+        return self.inner.to_url(scheme)
+
+    def read(self, key):
+        super(CompressedRepository, self).read(key)
+        return decompress_chunks(self.inner.read(key))
+
+    def read_many(self, keys):
+        super(CompressedRepository, self).read_many(keys)
+        return [decompress_chunks(chunks)
+                for chunks in self.inner.read_many(keys)]
+
+    def _compress(self, iterable):
+        if self.codec is None:
+            return iterable
+        return compress_chunks(self.codec, iterable, self.level)
+
+    def write(self, key, iterable):
+        super(CompressedRepository, self).write(key, iterable)
+        self.inner.write(key, self._compress(iterable))
+
+    def write_many(self, items):
+        super(CompressedRepository, self).write_many(items)
+        pairs = []
+        for key, iterable in items:
+            super(CompressedRepository, self).write(key, iterable)
+            pairs.append((key, self._compress(iterable)))
+        self.inner.write_many(pairs)
+
+    def exists(self, key):
+        super(CompressedRepository, self).exists(key)
+        return self.inner.exists(key)
+
+    def exists_many(self, keys):
+        super(CompressedRepository, self).exists_many(keys)
+        return self.inner.exists_many(keys)
+
+    def list(self, key):
+        super(CompressedRepository, self).list(key)
+        return self.inner.list(key)
+
+    def watch(self, key, interval=1.0):
+        super(CompressedRepository, self).watch(key, interval)
+        return self.inner.watch(key, interval)
+
+    def lock_keys(self, keys):
+        super(CompressedRepository, self).lock_keys(keys)
+        return self.inner.lock_keys(keys)
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r}, {2!r})'.format(
+            type(self), self.inner, self.codec and self.codec.name
+        )
@@ -0,0 +1,376 @@
+""":mod:`libearth.repositories.dedup` --- Deduplicating repository
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Every session has its own copy of the same feed, and these copies differ
+only in few attributes like revisions.  :class:`DedupRepository` splits
+values into *chunks* right before every entry (``<entry`` or ``<item``
+tag), and stores each chunk only once under the SHA-1 digest of its
+content.  Each key is stored as a *manifest* which lists digests of its
+chunks, so entries which are identical across sessions and feeds share
+the same chunk.
+
+The repository counts references to every chunk.  Chunks that are not
+referenced anymore (e.g. because their keys are overwritten) are removed
+by :meth:`DedupRepository.collect_garbage()`.
+
+It's registered as ``dedup`` entry point of ``libearth.repositories``
+group:
+
+.. code-block:: text
+
+   dedup:///home/dahlia/.earthreader/
+
+.. versionadded:: 0.4.0
+
+"""
+import errno
+import hashlib
+import os
+import os.path
+import sys
+import threading
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from ..repository import (FileNotFoundError, FileSystemRepository,
+                          NotADirectoryError, Repository, RepositoryKeyError)
+
+__all__ = ('BOUNDARIES', 'MANIFEST_MAGIC', 'DedupRepository',
+           'decode_manifest', 'encode_manifest', 'split_chunks')
+
+
+#: (:class:`collections.Sequence`) The default byte strings that chunks
+#: are split right before.  These are start tags of Atom and RSS entries,
+#: and end tags of feeds so that the last entry isn't followed by them.
+BOUNDARIES = b'<entry', b'<item', b'</feed', b'</channel'
+
+#: (:class:`bytes`) The magic bytes that every manifest starts with.
+MANIFEST_MAGIC = b'\x89LEM\n'
+
+
+def split_chunks(chunks, boundaries=BOUNDARIES, max_size=65536):
+    """Split the ``chunks`` right before every occurrence of
+    ``boundaries``.  Pieces longer than ``max_size`` are split as well.
+
+    .. code-block:: python
+
+       >>> list(split_chunks([b'<feed><entry>a</entry><en', b'try/>']))
+       [b'<feed>', b'<entry>a</entry>', b'<entry/>']
+
+    :param chunks: the iterable of chunks to split
+    :type chunks: :class:`collections.Iterable`
+    :param boundaries: the byte strings that pieces are split right
+                       before.  :const:`BOUNDARIES` by default
+    :type boundaries: :class:`collections.Sequence`
+    :param max_size: the maximum size of pieces in bytes.
+                     65536 bytes by default
+    :type max_size: :class:`numbers.Integral`
+    :returns: the iterable of pieces
+    :rtype: :class:`collections.Iterable`
+
+    """
+    longest = max(len(boundary) for boundary in boundaries) \
+        if boundaries else 0
+    # Note that iter() must be called only once, because FileIterator
+    # reopens the file every time iter() is called on it.
+    iterator = iter(chunks)
+    buffer_ = b''
+    searched = 0
+    while True:
+        # Boundaries before the searched offset were already looked for,
+        # except ones that could be cut off by the end of the buffer.
+        start = max(1, searched - longest + 1)
+        cut = None
+        for boundary in boundaries:
+            index = buffer_.find(boundary, start)
+            if index > 0 and (cut is None or index < cut):
+                cut = index
+        if len(buffer_) >= max_size and (cut is None or cut > max_size):
+            cut = max_size
+        if cut is not None:
+            yield buffer_[:cut]
+            buffer_ = buffer_[cut:]
+            searched = 0
+            continue
+        searched = len(buffer_)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            break
+        buffer_ += bytes(chunk)
+    if buffer_:
+        yield buffer_
+
+
+def encode_manifest(entries):
+    """Encode the manifest of the given chunk ``entries``.
+
+    :param entries: the list of pairs of the hexadecimal digest and
+                    the size of each chunk
+    :type entries: :class:`collections.Iterable`
+    :returns: the encoded manifest
+    :rtype: :class:`bytes`
+
+    """
+    lines = ['{0} {1}\n'.format(digest, size).encode('ascii')
+             for digest, size in entries]
+    return MANIFEST_MAGIC + b''.join(lines)
+
+
+def decode_manifest(manifest):
+    """Decode the ``manifest`` encoded by :func:`encode_manifest()`.
+
+    :param manifest: the encoded manifest
+    :type manifest: :class:`bytes`
+    :returns: the list of pairs of the hexadecimal digest and
+              the size of each chunk
+    :rtype: :class:`collections.Sequence`
+    :raises ValueError: when the ``manifest`` is invalid
+
+    """
+    if not manifest.startswith(MANIFEST_MAGIC):
+        raise ValueError('not a manifest: ' + repr(manifest[:32]))
+    entries = []
+    for line in manifest[len(MANIFEST_MAGIC):].splitlines():
+        digest, size = line.split()
+        entries.append((digest.decode('ascii'), int(size)))
+    return entries
+
+
+class DedupRepository(Repository):
+    """:class:`~libearth.repository.Repository` implementation which
+    stores values as manifests of deduplicated chunks.
+
+    .. note::
+
+       Only one :class:`DedupRepository` instance (and so only one process)
+       should write to the same ``path`` at a time, since reference counts
+       are maintained in memory.
+
+    :param path: the directory path to store manifests and chunks
+    :type path: :class:`str`
+    :param mkdir: create the directory if it doesn't exist yet.
+                  :const:`True` by default
+    :type mkdir: :class:`bool`
+    :param boundaries: the byte strings that chunks are split right before.
+                       :const:`BOUNDARIES` by default
+    :type boundaries: :class:`collections.Sequence`
+    :param max_chunk_size: the maximum size of chunks in bytes.
+                           65536 bytes by default
+    :type max_chunk_size: :class:`numbers.Integral`
+    :raises FileNotFoundError: when the ``path`` doesn't exist
+    :raises NotADirectoryError: when the ``path`` is not a directory
+
+    """
+
+    #: (:class:`str`) The name of the directory to store manifests.
+    MANIFESTS_DIRECTORY = 'manifests'
+
+    #: (:class:`str`) The name of the directory to store chunks.
+    CHUNKS_DIRECTORY = 'chunks'
+
+    #: (:class:`str`) The path of the directory to store manifests and
+    #: chunks.
+    path = None
+
+    #: (:class:`~libearth.repository.FileSystemRepository`) The repository
+    #: which stores manifests of keys.
+    manifests = None
+
+    #: (:class:`~libearth.repository.FileSystemRepository`) The repository
+    #: which stores chunks under their digests.
+    chunks = None
+
+    @classmethod
+    def from_url(cls, url):
+        if not isinstance(url, urlparse.ParseResult):
+            raise TypeError(
+                'url must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(urlparse.ParseResult, url)
+            )
+        if url.scheme != 'dedup':
+            raise ValueError('{0.__module__}.{0.__name__} only accepts '
+                             'dedup:// scheme'.format(DedupRepository))
+        elif url.netloc or url.params or url.query or url.fragment:
+            raise ValueError('dedup:// must not contain any host/port/user/'
+                             'password/parameters/query/fragment')
+        if sys.platform == 'win32':
+            if not url.path.startswith('/'):
+                raise ValueError('invalid file path: ' + repr(url.path))
+            parts = url.path.lstrip('/').split('/')
+            path = os.path.join(parts[0] + os.path.sep, *parts[1:])
+        else:
+            path = url.path
+        return cls(path)
+
+    def __init__(self, path, mkdir=True, boundaries=BOUNDARIES,
+                 max_chunk_size=65536):
+        if not os.path.exists(path):
+            if mkdir:
+                try:
+                    os.makedirs(path)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            else:
+                raise FileNotFoundError(repr(path) + ' does not exist')
+        if not os.path.isdir(path):
+            raise NotADirectoryError(repr(path) + ' is not a directory')
+        if max_chunk_size < 1:
+            raise ValueError('max_chunk_size must be a positive integer, '
+                             'not ' + repr(max_chunk_size))
+        self.path = path
+        self.boundaries = tuple(boundaries)
+        self.max_chunk_size = max_chunk_size
+        self.manifests = FileSystemRepository(
+            os.path.join(path, self.MANIFESTS_DIRECTORY)
+        )
+        self.chunks = FileSystemRepository(
+            os.path.join(path, self.CHUNKS_DIRECTORY),
+            buffer_size=65536,
+            shard_width=2
+        )
+        self.lock = threading.RLock()
+        self.refcounts = None
+        self.garbage = set()
+
+    def to_url(self, scheme):
+        super(DedupRepository, self).to_url(scheme)
+        if sys.platform == 'win32':
+            drive, path = os.path.splitdrive(self.path)
+            path = '/'.join(path.lstrip(os.path.sep).split(os.path.sep))
+            return '{0}:///{1}/{2}'.format(scheme, drive, path)
+        return '{0}://{1}'.format(scheme, self.path)
+
+    def get_refcounts(self):
+        """Get the reference counts of chunks.  These are counted from
+        all manifests when it's called first time.
+
+        :returns: the mapping of chunk digests to their reference counts
+        :rtype: :class:`collections.Mapping`
+
+        """
+        with self.lock:
+            if self.refcounts is None:
+                refcounts = {}
+                self._count_references([], refcounts)
+                self.refcounts = refcounts
+            return self.refcounts
+
+    def _count_references(self, key, refcounts):
+        for name in self.manifests.list(key):
+            subkey = key + [name]
+            if os.path.isdir(self.manifests.get_path(subkey)):
+                self._count_references(subkey, refcounts)
+                continue
+            for digest, _ in self._read_manifest(subkey):
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+
+    def _read_manifest(self, key):
+        return decode_manifest(b''.join(self.manifests.read(key)))
+
+    def read(self, key):
+        super(DedupRepository, self).read(key)
+        return self._iterate_chunks(self._read_manifest(key))
+
+    def _iterate_chunks(self, entries):
+        for digest, _ in entries:
+            for chunk in self.chunks.read([digest]):
+                yield chunk
+
+    def write(self, key, iterable):
+        super(DedupRepository, self).write(key, iterable)
+        self.write_many([(key, iterable)])
+
+    def write_many(self, items):
+        super(DedupRepository, self).write_many(items)
+        with self.lock:
+            refcounts = self.get_refcounts()
+            manifests = {}
+            order = []
+            for key, iterable in items:
+                super(DedupRepository, self).write(key, iterable)
+                entries = []
+                for piece in split_chunks(iterable, self.boundaries,
+                                          self.max_chunk_size):
+                    digest = hashlib.sha1(piece).hexdigest()
+                    if not refcounts.get(digest) and \
+                       not self.chunks.exists([digest]):
+                        self.chunks.write([digest], [piece])
+                        # It's collected if the manifest fails to be
+                        # written.
+                        self.garbage.add(digest)
+                    entries.append((digest, len(piece)))
+                key = tuple(key)
+                if key not in manifests:
+                    order.append(key)
+                manifests[key] = entries
+            old_manifests = []
+            for key in order:
+                try:
+                    old_manifests.append(self._read_manifest(key))
+                except RepositoryKeyError:
+                    pass
+            self.manifests.write_many(
+                (list(key), [encode_manifest(manifests[key])])
+                for key in order
+            )
+            for entries in manifests.values():
+                for digest, _ in entries:
+                    refcounts[digest] = refcounts.get(digest, 0) + 1
+            for entries in old_manifests:
+                for digest, _ in entries:
+                    refcounts[digest] -= 1
+                    if refcounts[digest] < 1:
+                        self.garbage.add(digest)
+
+    def exists(self, key):
+        super(DedupRepository, self).exists(key)
+        return self.manifests.exists(key)
+
+    def list(self, key):
+        super(DedupRepository, self).list(key)
+        return self.manifests.list(key)
+
+    def watch(self, key, interval=1.0):
+        super(DedupRepository, self).watch(key, interval)
+        return self.manifests.watch(key, interval)
+
+    def collect_garbage(self, full=False):
+        """Remove chunks which are not referenced by any manifest.
+
+        :param full: look for unreferenced chunks from all stored chunks,
+                     including ones left by crash or other instances.
+                     only chunks which became unreferenced through
+                     the instance are removed by default
+        :type full: :class:`bool`
+        :returns: the number of reclaimed bytes
+        :rtype: :class:`numbers.Integral`
+
+        """
+        with self.lock:
+            refcounts = self.get_refcounts()
+            if full:
+                candidates = self.chunks.list([])
+            else:
+                candidates = self.garbage
+            reclaimed = 0
+            for digest in candidates:
+                if refcounts.get(digest, 0) > 0:
+                    continue
+                path = self.chunks.get_path([digest])
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                refcounts.pop(digest, None)
+                reclaimed += size
+            self.garbage = set()
+            return reclaimed
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.path)
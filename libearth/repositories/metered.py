@@ -0,0 +1,427 @@
+""":mod:`libearth.repositories.metered` --- Instrumented repository wrapper
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`MeteredRepository` wraps other repository and records how many
+times each operation is called, how many bytes are read and written,
+and histograms of their latencies, for each key prefix.  It helps to find
+out whether slow transactions of :class:`~libearth.stage.Stage` are spent
+in I/O or not:
+
+.. code-block:: python
+
+   repository = MeteredRepository(FileSystemRepository(path))
+   stage = Stage(session, repository)
+   ...
+   for (operation, prefix), meter in repository.snapshot().items():
+       print(operation, prefix, meter.calls,
+             meter.latency.percentile(0.99))
+
+Since values are read lazily, latencies of :meth:`~MeteredRepository.read()`
+are measured twice: until the first chunk is produced
+(``'read.first_chunk'``), and until the whole value is consumed
+(``'read'``).
+
+.. versionadded:: 0.4.0
+
+"""
+import bisect
+import copy
+import logging
+import threading
+import time
+
+from ..compat import xrange
+from ..repository import Repository
+
+__all__ = 'DEFAULT_BOUNDS', 'Histogram', 'Meter', 'MeteredRepository'
+
+
+#: (:class:`collections.Sequence`) The default upper bounds of
+#: :class:`Histogram` buckets in seconds.  These grow exponentially from
+#: 10 microseconds to about 84 seconds.
+DEFAULT_BOUNDS = tuple(0.00001 * 2 ** i for i in xrange(24))
+
+
+class Histogram(object):
+    """Histogram of latencies which counts values in buckets.
+
+    :param bounds: the sorted upper bounds of buckets.  values greater than
+                   the last bound are counted in the extra overflow bucket.
+                   :const:`DEFAULT_BOUNDS` by default
+    :type bounds: :class:`collections.Sequence`
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of recorded values.
+    count = 0
+
+    #: (:class:`numbers.Real`) The sum of recorded values.
+    total = 0.0
+
+    #: (:class:`numbers.Real`) The minimum recorded value.  :const:`None`
+    #: if there's no value yet.
+    min = None
+
+    #: (:class:`numbers.Real`) The maximum recorded value.  :const:`None`
+    #: if there's no value yet.
+    max = None
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+
+    def add(self, value):
+        """Record the ``value``.
+
+        :param value: the value to record e.g. latency in seconds
+        :type value: :class:`numbers.Real`
+
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        """(:class:`numbers.Real`) The mean of recorded values.
+        :const:`None` if there's no value yet.
+
+        """
+        if self.count:
+            return self.total / self.count
+
+    def percentile(self, ratio):
+        """Estimate the value at the given percentile.  The upper bound of
+        the bucket which contains it is returned, so the actual value is
+        less than or equal to it.
+
+        :param ratio: the percentile between 0 and 1 e.g. 0.99
+        :type ratio: :class:`numbers.Real`
+        :returns: the estimated value.  :const:`None` if there's no
+                  value yet
+        :rtype: :class:`numbers.Real`
+
+        """
+        if not 0 <= ratio <= 1:
+            raise ValueError('ratio must be between 0 and 1, not ' +
+                             repr(ratio))
+        elif not self.count:
+            return None
+        rank = max(1, ratio * self.count)
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                break
+        return self.max
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} count={1} mean={2!r}>'.format(
+            type(self), self.count, self.mean
+        )
+
+
+class Meter(object):
+    """Measurements of an operation on a key prefix.
+
+    .. note::
+
+       Meters are made by :class:`MeteredRepository`, and you would get
+       copies of them through :meth:`MeteredRepository.snapshot()`.
+
+    """
+
+    #: (:class:`numbers.Integral`) The number of calls.
+    calls = 0
+
+    #: (:class:`numbers.Integral`) The number of calls which raised errors.
+    errors = 0
+
+    #: (:class:`numbers.Integral`) The number of bytes read or written.
+    bytes = 0
+
+    #: (:class:`Histogram`) Latencies in seconds.
+    latency = None
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.latency = Histogram(bounds)
+
+    def __repr__(self):
+        return ('<{0.__module__}.{0.__name__} calls={1} errors={2} '
+                'bytes={3}>').format(type(self), self.calls, self.errors,
+                                     self.bytes)
+
+
+class MeteredRepository(Repository):
+    """:class:`~libearth.repository.Repository` wrapper which measures
+    operations of the ``inner`` repository.
+
+    :param inner: the repository to actually store values
+    :type inner: :class:`~libearth.repository.Repository`
+    :param prefix_depth: the number of leading names of keys to group
+                         measurements by.  e.g. if it's 1 (default),
+                         ``['feeds', 'abc', 'session.xml']`` is
+                         counted into ``('feeds',)`` prefix
+    :type prefix_depth: :class:`numbers.Integral`
+    :param log_interval: the interval in seconds to log measurements
+                         through :mod:`logging`.  periodic logging is
+                         turned off if it's :const:`None` (default)
+    :type log_interval: :class:`numbers.Real`
+    :param bounds: the upper bounds of latency histogram buckets.
+                   :const:`DEFAULT_BOUNDS` by default
+    :type bounds: :class:`collections.Sequence`
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to actually
+    #: store values.
+    inner = None
+
+    #: (:class:`numbers.Integral`) The number of leading names of keys
+    #: to group measurements by.
+    prefix_depth = None
+
+    def __init__(self, inner, prefix_depth=1, log_interval=None,
+                 bounds=DEFAULT_BOUNDS):
+        if not isinstance(inner, Repository):
+            raise TypeError(
+                'inner must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(Repository, inner)
+            )
+        elif prefix_depth < 0:
+            raise ValueError('prefix_depth must not be negative, not ' +
+                             repr(prefix_depth))
+        self.inner = inner
+        self.prefix_depth = prefix_depth
+        self.bounds = tuple(bounds)
+        self.lock = threading.Lock()
+        self.meters = {}
+        self.closing = threading.Event()
+        if log_interval is None:
+            self.logging_thread = None
+        else:
+            self.logging_thread = threading.Thread(
+                target=self._log_periodically,
+                args=(log_interval,)
+            )
+            self.logging_thread.daemon = True
+            self.logging_thread.start()
+
+    def _record(self, operation, key, elapsed, size=0, error=False):
+        meter_key = operation, tuple(key[:self.prefix_depth])
+        with self.lock:
+            meter = self.meters.get(meter_key)
+            if meter is None:
+                meter = self.meters[meter_key] = Meter(self.bounds)
+            meter.calls += 1
+            meter.bytes += size
+            if error:
+                meter.errors += 1
+            meter.latency.add(elapsed)
+
+    def snapshot(self, reset=False):
+        """Get the copy of current measurements.
+
+        :param reset: reset measurements after the snapshot is taken.
+                      :const:`False` by default
+        :type reset: :class:`bool`
+        :returns: the mapping of pairs of (operation name, key prefix tuple)
+                  to :class:`Meter` objects.  operation names are
+                  ``'read'``, ``'read.first_chunk'``, ``'write'``,
+                  ``'exists'``, and ``'list'``.  writes and existence
+                  checks done at once through :meth:`write_many()` and
+                  :meth:`exists_many()` are recorded as ``'write_many'``
+                  and ``'exists_many'`` for each prefix, with the latency
+                  of the whole batch
+        :rtype: :class:`collections.Mapping`
+
+        """
+        with self.lock:
+            meters = copy.deepcopy(self.meters)
+            if reset:
+                self.meters = {}
+        return meters
+
+    def reset(self):
+        """Reset all measurements."""
+        with self.lock:
+            self.meters = {}
+
+    def to_url(self, scheme):
+        return self.inner.to_url(scheme)
+
+    def read(self, key):
+        super(MeteredRepository, self).read(key)
+        started_at = time.time()
+        try:
+            chunks = self.inner.read(key)
+        except Exception:
+            self._record('read', key, time.time() - started_at, error=True)
+            raise
+        return self._measure_chunks(key, chunks, started_at)
+
+    def read_many(self, keys):
+        super(MeteredRepository, self).read_many(keys)
+        keys = list(keys)
+        started_at = time.time()
+        try:
+            chunks_list = self.inner.read_many(keys)
+        except Exception:
+            elapsed = time.time() - started_at
+            for key in keys:
+                self._record('read', key, elapsed, error=True)
+            raise
+        return [self._measure_chunks(key, chunks, started_at)
+                for key, chunks in zip(keys, chunks_list)]
+
+    def _measure_chunks(self, key, chunks, started_at):
+        size = 0
+        first = True
+        error = False
+        # Note that iter() must be called only once, because FileIterator
+        # reopens the file every time iter() is called on it.
+        iterator = iter(chunks)
+        try:
+            while True:
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                except Exception:
+                    error = True
+                    raise
+                if first:
+                    self._record('read.first_chunk', key,
+                                 time.time() - started_at)
+                    first = False
+                size += len(chunk)
+                yield chunk
+        finally:
+            # Also recorded when the consumer stops iterating halfway,
+            # e.g. closes the generator or it's garbage-collected.
+            elapsed = time.time() - started_at
+            if first and not error:
+                self._record('read.first_chunk', key, elapsed)
+            self._record('read', key, elapsed, size, error=error)
+            close = getattr(iterator, 'close', None)
+            if callable(close):
+                close()
+
+    def write(self, key, iterable):
+        super(MeteredRepository, self).write(key, iterable)
+        sizes = []
+        started_at = time.time()
+        try:
+            self.inner.write(key, self._count_bytes(iterable, sizes))
+        except Exception:
+            self._record('write', key, time.time() - started_at, sum(sizes),
+                         error=True)
+            raise
+        self._record('write', key, time.time() - started_at, sum(sizes))
+
+    def write_many(self, items):
+        super(MeteredRepository, self).write_many(items)
+        pairs = []
+        sizes = {}
+        for key, iterable in items:
+            super(MeteredRepository, self).write(key, iterable)
+            prefix = tuple(key[:self.prefix_depth])
+            pairs.append((key,
+                          self._count_bytes(iterable,
+                                            sizes.setdefault(prefix, []))))
+        started_at = time.time()
+        error = True
+        try:
+            self.inner.write_many(pairs)
+            error = False
+        finally:
+            elapsed = time.time() - started_at
+            for prefix, prefix_sizes in sizes.items():
+                self._record('write_many', prefix, elapsed,
+                             sum(prefix_sizes), error)
+
+    def _count_bytes(self, iterable, sizes):
+        for chunk in iterable:
+            sizes.append(len(chunk))
+            yield chunk
+
+    def exists(self, key):
+        super(MeteredRepository, self).exists(key)
+        return self._measure('exists', key, self.inner.exists, key)
+
+    def exists_many(self, keys):
+        super(MeteredRepository, self).exists_many(keys)
+        keys = list(keys)
+        prefixes = set(tuple(key[:self.prefix_depth]) for key in keys)
+        started_at = time.time()
+        error = True
+        try:
+            result = self.inner.exists_many(keys)
+            error = False
+        finally:
+            elapsed = time.time() - started_at
+            for prefix in prefixes:
+                self._record('exists_many', prefix, elapsed, error=error)
+        return result
+
+    def list(self, key):
+        super(MeteredRepository, self).list(key)
+        return self._measure('list', key, self.inner.list, key)
+
+    def _measure(self, operation, key, function, *args):
+        started_at = time.time()
+        try:
+            result = function(*args)
+        except Exception:
+            self._record(operation, key, time.time() - started_at,
+                         error=True)
+            raise
+        self._record(operation, key, time.time() - started_at)
+        return result
+
+    def watch(self, key, interval=1.0):
+        super(MeteredRepository, self).watch(key, interval)
+        return self.inner.watch(key, interval)
+
+    def lock_keys(self, keys):
+        super(MeteredRepository, self).lock_keys(keys)
+        return self.inner.lock_keys(keys)
+
+    def _log_periodically(self, interval):
+        """Log measurements every ``interval`` seconds until
+        :meth:`close()` is called.  Measurements are reset every time
+        these are logged.
+
+        """
+        logger = logging.getLogger(__name__ + '.MeteredRepository')
+        while True:
+            self.closing.wait(interval)
+            if self.closing.is_set():
+                break
+            meters = self.snapshot(reset=True)
+            for (operation, prefix), meter in sorted(meters.items()):
+                latency = meter.latency
+                logger.info(
+                    '%s %s: %d calls, %d errors, %d bytes, '
+                    'mean %.6fs, p50 %.6fs, p99 %.6fs, max %.6fs',
+                    operation, '/'.join(prefix), meter.calls, meter.errors,
+                    meter.bytes, latency.mean, latency.percentile(0.5),
+                    latency.percentile(0.99), latency.max
+                )
+
+    def close(self):
+        """Stop periodic logging."""
+        self.closing.set()
+        thread = self.logging_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.inner)
@@ -0,0 +1,551 @@
+""":mod:`libearth.repositories.pack` --- Log-structured pack repository
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`PackRepository` doesn't make a file per key.  Instead it appends
+every written value to the end of large *segment* files, and maintains
+an *index* which maps keys to the position of their latest values
+in segments.  So rewriting a document is always a sequential append,
+and reading a document is always a single positioned read.
+
+Since old values are never overwritten, segments get filled with dead
+values over time.  :meth:`PackRepository.compact()` reclaims the space
+by moving live values out of mostly dead segments and then removing
+these segments.  It can be done periodically in background as well.
+
+It's registered as ``pack`` entry point of ``libearth.repositories``
+group:
+
+.. code-block:: text
+
+   pack:///home/dahlia/.earthreader/
+
+.. versionadded:: 0.4.0
+
+"""
+import errno
+import io
+import json
+import logging
+import os
+import os.path
+import re
+import sys
+import tempfile
+import threading
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from ..compat import xrange
+from ..repository import (FileNotFoundError, NotADirectoryError,
+                          PollingWatcher, Repository, RepositoryKeyError,
+                          fsync_directory, iterate_chunks, remove_quietly,
+                          replace_file)
+
+__all__ = 'PackRepository',
+
+
+class PackRepository(Repository):
+    """:class:`~libearth.repository.Repository` implementation which
+    appends values to segment files and indexes them.
+
+    .. note::
+
+       Only one :class:`PackRepository` instance (and so only one process)
+       should open the same ``path`` at a time.
+
+    :param path: the directory path to store segment files and the index
+    :type path: :class:`str`
+    :param mkdir: create the directory if it doesn't exist yet.
+                  :const:`True` by default
+    :type mkdir: :class:`bool`
+    :param segment_size: a new segment file is started when the current
+                         segment becomes larger than this.
+                         64 MiB by default
+    :type segment_size: :class:`numbers.Integral`
+    :param buffer_size: the size of chunks that :meth:`read()` produces.
+                        65536 bytes by default
+    :type buffer_size: :class:`numbers.Integral`
+    :param fsync: flush appended values and the index to the disk
+                  before :meth:`write()` returns.  :const:`False` by default
+    :type fsync: :class:`bool`
+    :param compaction_interval: the interval in seconds to :meth:`compact()`
+                                segments in background.  background
+                                compaction is turned off if it's
+                                :const:`None` (default)
+    :type compaction_interval: :class:`numbers.Real`
+    :param compaction_threshold: the ratio of dead bytes in a segment to
+                                 be compacted.  0.5 by default
+    :type compaction_threshold: :class:`numbers.Real`
+    :raises FileNotFoundError: when the ``path`` doesn't exist
+    :raises NotADirectoryError: when the ``path`` is not a directory
+
+    """
+
+    #: (:class:`str`) The filename of the index.
+    INDEX_FILENAME = 'index'
+
+    #: (:class:`re.RegexObject`) The pattern of segment filenames.
+    SEGMENT_PATTERN = re.compile(r'^(\d+)\.seg$')
+
+    #: (:class:`str`) The path of the directory to store segments and
+    #: the index.
+    path = None
+
+    #: (:class:`collections.Mapping`) The index which maps key tuples to
+    #: triples of (segment number, offset, length).
+    index = None
+
+    #: (:class:`numbers.Integral`) The number of the segment that values
+    #: are appended to.
+    active_segment = None
+
+    #: (:class:`numbers.Integral`) The generation of the index.  It's
+    #: increased whenever a new key is added to the index.
+    generation = 0
+
+    @classmethod
+    def from_url(cls, url):
+        if not isinstance(url, urlparse.ParseResult):
+            raise TypeError(
+                'url must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(urlparse.ParseResult, url)
+            )
+        if url.scheme != 'pack':
+            raise ValueError('{0.__module__}.{0.__name__} only accepts '
+                             'pack:// scheme'.format(PackRepository))
+        elif url.netloc or url.params or url.query or url.fragment:
+            raise ValueError('pack:// must not contain any host/port/user/'
+                             'password/parameters/query/fragment')
+        if sys.platform == 'win32':
+            if not url.path.startswith('/'):
+                raise ValueError('invalid file path: ' + repr(url.path))
+            parts = url.path.lstrip('/').split('/')
+            path = os.path.join(parts[0] + os.path.sep, *parts[1:])
+        else:
+            path = url.path
+        return cls(path)
+
+    def __init__(self, path, mkdir=True, segment_size=64 * 1024 * 1024,
+                 buffer_size=65536, fsync=False, compaction_interval=None,
+                 compaction_threshold=0.5):
+        if not os.path.exists(path):
+            if mkdir:
+                try:
+                    os.makedirs(path)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            else:
+                raise FileNotFoundError(repr(path) + ' does not exist')
+        if not os.path.isdir(path):
+            raise NotADirectoryError(repr(path) + ' is not a directory')
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be a positive integer, not ' +
+                             repr(buffer_size))
+        elif not 0 <= compaction_threshold <= 1:
+            raise ValueError('compaction_threshold must be between 0 and 1, '
+                             'not ' + repr(compaction_threshold))
+        self.path = path
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.fsync = bool(fsync)
+        self.compaction_threshold = compaction_threshold
+        self.lock = threading.RLock()
+        self.index = {}
+        self.directories = {(): set()}
+        self.segment_sizes = {}
+        self.live_sizes = {}
+        self.read_files = {}
+        self.generation = 0
+        self._load_index()
+        if self.segment_sizes:
+            self.active_segment = max(self.segment_sizes)
+        else:
+            self.active_segment = 1
+            self.segment_sizes[1] = self.live_sizes[1] = 0
+        self.active_file = io.open(self.get_segment_path(self.active_segment),
+                                   'ab')
+        self.index_file = io.open(os.path.join(path, self.INDEX_FILENAME),
+                                  'ab')
+        self.closing = threading.Event()
+        if compaction_interval is None:
+            self.compaction_thread = None
+        else:
+            self.compaction_thread = threading.Thread(
+                target=self._compact_periodically,
+                args=(compaction_interval,)
+            )
+            self.compaction_thread.daemon = True
+            self.compaction_thread.start()
+
+    def to_url(self, scheme):
+        super(PackRepository, self).to_url(scheme)
+        if sys.platform == 'win32':
+            drive, path = os.path.splitdrive(self.path)
+            path = '/'.join(path.lstrip(os.path.sep).split(os.path.sep))
+            return '{0}:///{1}/{2}'.format(scheme, drive, path)
+        return '{0}://{1}'.format(scheme, self.path)
+
+    def get_segment_path(self, segment):
+        """Get the file path of the given ``segment`` number.
+
+        :param segment: the segment number
+        :type segment: :class:`numbers.Integral`
+        :returns: the path of the segment file
+        :rtype: :class:`str`
+
+        """
+        return os.path.join(self.path, '{0:08d}.seg'.format(segment))
+
+    def _load_index(self):
+        """Load segments and the index from the disk.  Index records that
+        refer incompletely written values (e.g. because of crash) are
+        ignored, and an incompletely written record at the end of
+        the index is truncated, so that records appended later aren't
+        glued to it.
+
+        """
+        for name in os.listdir(self.path):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                segment = int(match.group(1))
+                size = os.path.getsize(os.path.join(self.path, name))
+                self.segment_sizes[segment] = size
+                self.live_sizes[segment] = 0
+        index_path = os.path.join(self.path, self.INDEX_FILENAME)
+        try:
+            f = io.open(index_path, 'rb')
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        complete_size = 0
+        with f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                complete_size += len(line)
+                try:
+                    key, segment, offset, length = json.loads(
+                        line.decode('utf-8')
+                    )
+                except (TypeError, ValueError):
+                    continue
+                if offset + length > self.segment_sizes.get(segment, -1):
+                    continue
+                self._update_index(tuple(key), (segment, offset, length))
+            torn = complete_size < os.fstat(f.fileno()).st_size
+        if torn:
+            with io.open(index_path, 'r+b') as f:
+                f.truncate(complete_size)
+
+    def _update_index(self, key, entry):
+        """Make the ``key`` to refer the given ``entry`` in memory.
+
+        """
+        prev = self.index.get(key)
+        if prev is None:
+            self.generation += 1
+        else:
+            self.live_sizes[prev[0]] -= prev[2]
+        self.index[key] = entry
+        self.live_sizes[entry[0]] += entry[2]
+        directories = self.directories
+        for i in xrange(len(key)):
+            directories.setdefault(key[:i], set()).add(key[i])
+
+    def _check_keys(self, keys):
+        """Check whether the given ``keys`` can be written.
+
+        :raises libearth.repository.RepositoryKeyError: when any key
+            is a directory or any upper key is a file
+
+        """
+        files = set()
+        directories = set()
+        for key in keys:
+            for i in xrange(1, len(key)):
+                prefix = key[:i]
+                if prefix in self.index or prefix in files:
+                    raise RepositoryKeyError(
+                        key, '{0!r} is not a directory'.format(prefix)
+                    )
+                directories.add(prefix)
+            if key in self.directories or key in directories:
+                raise RepositoryKeyError(key, 'key is a directory')
+            files.add(key)
+
+    def _append(self, value):
+        """Append the ``value`` to the active segment.
+
+        :returns: the triple of (segment number, offset, length)
+        :rtype: :class:`tuple`
+
+        """
+        segment = self.active_segment
+        offset = self.segment_sizes[segment]
+        if offset and offset + len(value) > self.segment_size:
+            self.active_file.flush()
+            if self.fsync:
+                os.fsync(self.active_file.fileno())
+            self.active_file.close()
+            segment += 1
+            offset = 0
+            self.active_segment = segment
+            self.segment_sizes[segment] = self.live_sizes[segment] = 0
+            self.active_file = io.open(self.get_segment_path(segment), 'ab')
+        self.active_file.write(value)
+        self.segment_sizes[segment] += len(value)
+        return segment, offset, len(value)
+
+    def _pread(self, segment, offset, length):
+        """Read ``length`` bytes from the ``offset`` of the ``segment``.
+
+        """
+        try:
+            f = self.read_files[segment]
+        except KeyError:
+            f = io.open(self.get_segment_path(segment), 'rb', buffering=0)
+            self.read_files[segment] = f
+        if hasattr(os, 'pread'):
+            data = os.pread(f.fileno(), length, offset)
+        else:
+            f.seek(offset)
+            data = f.read(length)
+        if len(data) < length:
+            raise IOError('segment {0} is truncated'.format(segment))
+        return data
+
+    def read(self, key):
+        super(PackRepository, self).read(key)
+        with self.lock:
+            try:
+                segment, offset, length = self.index[tuple(key)]
+            except KeyError:
+                raise RepositoryKeyError(key)
+            data = self._pread(segment, offset, length)
+        return iterate_chunks(data, self.buffer_size)
+
+    def read_many(self, keys):
+        """Read several values at once.  Values are read in the order of
+        their positions in segments, so that the disk is read sequentially
+        as much as possible.
+
+        """
+        super(PackRepository, self).read_many(keys)
+        keys = list(keys)
+        for key in keys:
+            super(PackRepository, self).read(key)
+        values = [None] * len(keys)
+        with self.lock:
+            positions = []
+            for i, key in enumerate(keys):
+                try:
+                    positions.append((self.index[tuple(key)], i))
+                except KeyError:
+                    raise RepositoryKeyError(key)
+            positions.sort()
+            for (segment, offset, length), i in positions:
+                values[i] = iterate_chunks(
+                    self._pread(segment, offset, length),
+                    self.buffer_size
+                )
+        return values
+
+    def write(self, key, iterable):
+        super(PackRepository, self).write(key, iterable)
+        self.write_many([(key, iterable)])
+
+    def write_many(self, items):
+        """Append several values at once, and then append their index
+        records at once.  If any of keys cannot be written nothing
+        is written.
+
+        """
+        super(PackRepository, self).write_many(items)
+        pairs = []
+        for key, iterable in items:
+            super(PackRepository, self).write(key, iterable)
+            pairs.append((tuple(key), b''.join(iterable)))
+        with self.lock:
+            self._check_keys(key for key, _ in pairs)
+            entries = [(key, self._append(value)) for key, value in pairs]
+            self.active_file.flush()
+            if self.fsync:
+                os.fsync(self.active_file.fileno())
+            # The index is written after the values are completely written,
+            # so that it never refers incompletely written values.
+            records = b''.join(
+                json.dumps([list(key)] + list(entry)).encode('utf-8') + b'\n'
+                for key, entry in entries
+            )
+            self.index_file.write(records)
+            self.index_file.flush()
+            if self.fsync:
+                os.fsync(self.index_file.fileno())
+            for key, entry in entries:
+                self._update_index(key, entry)
+
+    def exists(self, key):
+        super(PackRepository, self).exists(key)
+        key = tuple(key)
+        with self.lock:
+            return key in self.index or key in self.directories
+
+    def list(self, key):
+        super(PackRepository, self).list(key)
+        with self.lock:
+            try:
+                return frozenset(self.directories[tuple(key)])
+            except KeyError:
+                raise RepositoryKeyError(key)
+
+    def stamp(self, key):
+        """Stamp the ``key`` with the :attr:`generation` of the index.
+        Since only one instance can open the same ``path`` at a time,
+        the index in memory always knows every key.
+
+        """
+        super(PackRepository, self).stamp(key)
+        with self.lock:
+            if tuple(key) not in self.directories:
+                raise RepositoryKeyError(key)
+            return self.generation
+
+    def watch(self, key, interval=1.0):
+        """Watch changes by comparing positions of values in the index.
+        Since only one instance can open the same ``path`` at a time,
+        only changes made through the instance are noticed.
+
+        """
+        super(PackRepository, self).watch(key, interval)
+        return PollingWatcher(self, key, interval, stamp=self._get_positions)
+
+    def _get_positions(self, keys):
+        with self.lock:
+            return [self.index.get(tuple(key)) for key in keys]
+
+    def get_dead_ratio(self, segment):
+        """Get the ratio of dead bytes in the given ``segment``.
+
+        :param segment: the segment number
+        :type segment: :class:`numbers.Integral`
+        :returns: the ratio between 0 and 1
+        :rtype: :class:`numbers.Real`
+
+        """
+        with self.lock:
+            size = self.segment_sizes[segment]
+            if not size:
+                return 1.0
+            return (size - self.live_sizes[segment]) / float(size)
+
+    def compact(self, threshold=None):
+        """Move live values out of segments that have too many dead
+        values, and then remove these segments.  The active segment is
+        never compacted.
+
+        :param threshold: the ratio of dead bytes in a segment to be
+                          compacted.  :attr:`compaction_threshold` is
+                          used if omitted
+        :type threshold: :class:`numbers.Real`
+        :returns: the number of reclaimed bytes
+        :rtype: :class:`numbers.Integral`
+
+        """
+        if threshold is None:
+            threshold = self.compaction_threshold
+        with self.lock:
+            segments = frozenset(
+                segment for segment in self.segment_sizes
+                if segment != self.active_segment and
+                self.get_dead_ratio(segment) >= threshold
+            )
+            if not segments:
+                return 0
+            moved = sorted(
+                ((entry, key) for key, entry in self.index.items()
+                 if entry[0] in segments)
+            )
+            for (segment, offset, length), key in moved:
+                value = self._pread(segment, offset, length)
+                self._update_index(key, self._append(value))
+            self.active_file.flush()
+            if self.fsync:
+                os.fsync(self.active_file.fileno())
+            self._rewrite_index()
+            reclaimed = 0
+            for segment in segments:
+                reclaimed += self.segment_sizes.pop(segment)
+                del self.live_sizes[segment]
+                f = self.read_files.pop(segment, None)
+                if f is not None:
+                    f.close()
+                remove_quietly(self.get_segment_path(segment))
+            return reclaimed - sum(length for (_, _, length), _ in moved)
+
+    def _rewrite_index(self):
+        """Rewrite the index file to contain only live records.
+
+        """
+        fd, tempname = tempfile.mkstemp(prefix='.index.', dir=self.path)
+        try:
+            with io.open(fd, 'wb') as f:
+                for key, entry in self.index.items():
+                    f.write(json.dumps([list(key)] + list(entry))
+                            .encode('utf-8'))
+                    f.write(b'\n')
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.index_file.close()
+            replace_file(tempname, os.path.join(self.path,
+                                                self.INDEX_FILENAME))
+        except BaseException:
+            remove_quietly(tempname)
+            raise
+        finally:
+            self.index_file = io.open(
+                os.path.join(self.path, self.INDEX_FILENAME),
+                'ab'
+            )
+        if self.fsync:
+            fsync_directory(self.path)
+
+    def _compact_periodically(self, interval):
+        """Call :meth:`compact()` every ``interval`` seconds until
+        :meth:`close()` is called.
+
+        """
+        logger = logging.getLogger(__name__ + '.PackRepository.compact')
+        while True:
+            self.closing.wait(interval)
+            if self.closing.is_set():
+                break
+            try:
+                reclaimed = self.compact()
+            except Exception as e:
+                logger.exception(e)
+            else:
+                if reclaimed:
+                    logger.info('reclaimed %d bytes from %r',
+                                reclaimed, self)
+
+    def close(self):
+        """Stop background compaction, and close all opened files."""
+        self.closing.set()
+        thread = self.compaction_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self.lock:
+            self.active_file.close()
+            self.index_file.close()
+            for f in self.read_files.values():
+                f.close()
+            self.read_files.clear()
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.path)
@@ -0,0 +1,308 @@
+""":mod:`libearth.repositories.sqlite` --- SQLite repository
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`SQLiteRepository` stores every key as a row of a single SQLite_
+database file instead of a file per key, so it doesn't hit inode and
+directory size limits even if there are a lot of keys.  It's registered
+as ``sqlite`` entry point of ``libearth.repositories`` group, so
+the following url loads the repository which stores data to
+:file:`/home/dahlia/earthreader.db`:
+
+.. code-block:: text
+
+   sqlite:///home/dahlia/earthreader.db
+
+.. _SQLite: http://sqlite.org/
+
+.. versionadded:: 0.4.0
+
+"""
+import os.path
+import sqlite3
+import sys
+import threading
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from ..compat import xrange
+from ..repository import Repository, RepositoryKeyError, iterate_chunks
+
+__all__ = 'SQLiteRepository',
+
+
+class SQLiteRepository(Repository):
+    """:class:`~libearth.repository.Repository` implementation which
+    stores data into the SQLite database.
+
+    Every key is a row which consists of its parent key, its last name,
+    and its value.  Directories (upper keys) are also stored as rows
+    without any value, so :meth:`list()` is a simple index lookup
+    regardless of the number of keys in the repository.
+
+    :param path: the path of the database file.  the database is created
+                 if it doesn't exist yet.  an in-memory database is used
+                 if it's omitted
+    :type path: :class:`str`
+    :param buffer_size: the size of chunks that :meth:`read()` produces.
+                        65536 bytes by default
+    :type buffer_size: :class:`numbers.Integral`
+
+    """
+
+    #: (:class:`str`) The name of the table to store keys.
+    TABLE_NAME = 'libearth_repository'
+
+    #: (:class:`numbers.Integral`) The maximum number of keys to look up
+    #: in a single query of :meth:`read_many()` and :meth:`exists_many()`.
+    #: SQLite limits the number of query parameters to 999 by default.
+    SELECT_BATCH_SIZE = 400
+
+    #: (:class:`str`) The path of the database file.
+    path = None
+
+    #: (:class:`numbers.Integral`) The size of chunks that :meth:`read()`
+    #: produces.
+    buffer_size = None
+
+    #: (:class:`sqlite3.Connection`) The database connection.
+    connection = None
+
+    @classmethod
+    def from_url(cls, url):
+        if not isinstance(url, urlparse.ParseResult):
+            raise TypeError(
+                'url must be an instance of {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(urlparse.ParseResult, url)
+            )
+        if url.scheme != 'sqlite':
+            raise ValueError('{0.__module__}.{0.__name__} only accepts '
+                             'sqlite:// scheme'.format(SQLiteRepository))
+        elif url.netloc or url.params or url.query or url.fragment:
+            raise ValueError('sqlite:// must not contain any host/port/user/'
+                             'password/parameters/query/fragment')
+        if not url.path:
+            return cls()
+        if sys.platform == 'win32':
+            parts = url.path.lstrip('/').split('/')
+            path = os.path.join(parts[0] + os.path.sep, *parts[1:])
+        else:
+            path = url.path
+        return cls(path)
+
+    def __init__(self, path=':memory:', buffer_size=65536):
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be a positive integer, not ' +
+                             repr(buffer_size))
+        self.path = path
+        self.buffer_size = buffer_size
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {0} ('
+                    'parent TEXT NOT NULL, '
+                    'name TEXT NOT NULL, '
+                    'value BLOB, '
+                    'PRIMARY KEY (parent, name))'.format(self.TABLE_NAME)
+                )
+
+    def to_url(self, scheme):
+        super(SQLiteRepository, self).to_url(scheme)
+        if self.path == ':memory:':
+            return '{0}://'.format(scheme)
+        elif sys.platform == 'win32':
+            drive, path = os.path.splitdrive(self.path)
+            path = '/'.join(path.lstrip(os.path.sep).split(os.path.sep))
+            return '{0}:///{1}/{2}'.format(scheme, drive, path)
+        return '{0}://{1}'.format(scheme, self.path)
+
+    def _split_key(self, key):
+        if not key:
+            raise RepositoryKeyError(key, 'key cannot be empty')
+        for name in key:
+            if '/' in name:
+                raise RepositoryKeyError(key, 'key cannot contain slashes')
+        return '/'.join(key[:-1]), key[-1]
+
+    def _select(self, key):
+        """Find the row of the ``key``.  It returns a pair of whether
+        the row is found and its value (which is :const:`None` for
+        directories).
+
+        """
+        if not key:
+            return True, None
+        parent, name = self._split_key(key)
+        row = self.connection.execute(
+            'SELECT value FROM {0} WHERE parent = ? AND name = ?'.format(
+                self.TABLE_NAME
+            ),
+            (parent, name)
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, row[0]
+
+    def read(self, key):
+        super(SQLiteRepository, self).read(key)
+        with self.lock:
+            found, value = self._select(key)
+        if value is None:
+            raise RepositoryKeyError(key)
+        return iterate_chunks(value, self.buffer_size)
+
+    def _select_many(self, keys):
+        """Find the rows of the ``keys``.  It returns a mapping of
+        (parent, name) pairs to their values.  Keys that cannot be found
+        are missing from the mapping.
+
+        """
+        pairs = []
+        for key in keys:
+            try:
+                pairs.append(self._split_key(key))
+            except RepositoryKeyError:
+                continue
+        rows = {}
+        size = self.SELECT_BATCH_SIZE
+        for offset in xrange(0, len(pairs), size):
+            batch = pairs[offset:offset + size]
+            cursor = self.connection.execute(
+                'SELECT parent, name, value FROM {0} WHERE {1}'.format(
+                    self.TABLE_NAME,
+                    ' OR '.join(['(parent = ? AND name = ?)'] * len(batch))
+                ),
+                [arg for pair in batch for arg in pair]
+            )
+            for parent, name, value in cursor:
+                rows[parent, name] = value
+        return rows
+
+    def read_many(self, keys):
+        """Read several values in a single query (per
+        :const:`SELECT_BATCH_SIZE` keys).
+
+        """
+        super(SQLiteRepository, self).read_many(keys)
+        keys = list(keys)
+        for key in keys:
+            super(SQLiteRepository, self).read(key)
+        with self.lock:
+            rows = self._select_many(keys)
+        values = []
+        for key in keys:
+            value = rows.get(self._split_key(key))
+            if value is None:
+                raise RepositoryKeyError(key)
+            values.append(iterate_chunks(value, self.buffer_size))
+        return values
+
+    def write(self, key, iterable):
+        super(SQLiteRepository, self).write(key, iterable)
+        self.write_many([(key, iterable)])
+
+    def write_many(self, items):
+        """Write several values in a single SQL transaction.  If any of
+        them fails nothing is written.
+
+        """
+        super(SQLiteRepository, self).write_many(items)
+        pairs = []
+        for key, iterable in items:
+            super(SQLiteRepository, self).write(key, iterable)
+            pairs.append((key, sqlite3.Binary(b''.join(iterable))))
+        with self.lock:
+            with self.connection:
+                for key, value in pairs:
+                    self._insert(key, value)
+
+    def _insert(self, key, value):
+        table = self.TABLE_NAME
+        execute = self.connection.execute
+        for i in xrange(len(key) - 1):
+            found, dir_value = self._select(key[:i + 1])
+            if not found:
+                parent, name = self._split_key(key[:i + 1])
+                execute(
+                    'INSERT INTO {0} (parent, name, value) '
+                    'VALUES (?, ?, NULL)'.format(table),
+                    (parent, name)
+                )
+            elif dir_value is not None:
+                raise RepositoryKeyError(key, '{0!r} is not a directory'
+                                              .format(key[:i + 1]))
+        found, prev_value = self._select(key)
+        if found and prev_value is None:
+            raise RepositoryKeyError(key, 'key is a directory')
+        parent, name = self._split_key(key)
+        execute(
+            'INSERT OR REPLACE INTO {0} (parent, name, value) '
+            'VALUES (?, ?, ?)'.format(table),
+            (parent, name, value)
+        )
+
+    def exists(self, key):
+        super(SQLiteRepository, self).exists(key)
+        try:
+            with self.lock:
+                found, _ = self._select(key)
+        except RepositoryKeyError:
+            return False
+        return found
+
+    def exists_many(self, keys):
+        """Find several keys in a single query (per
+        :const:`SELECT_BATCH_SIZE` keys).
+
+        """
+        super(SQLiteRepository, self).exists_many(keys)
+        keys = list(keys)
+        for key in keys:
+            super(SQLiteRepository, self).exists(key)
+        with self.lock:
+            rows = self._select_many([key for key in keys if key])
+        result = []
+        for key in keys:
+            try:
+                result.append(not key or self._split_key(key) in rows)
+            except RepositoryKeyError:
+                result.append(False)
+        return result
+
+    def list(self, key):
+        super(SQLiteRepository, self).list(key)
+        with self.lock:
+            found, value = self._select(key)
+            if not found or value is not None:
+                raise RepositoryKeyError(key)
+            cursor = self.connection.execute(
+                'SELECT name FROM {0} WHERE parent = ?'.format(
+                    self.TABLE_NAME
+                ),
+                ('/'.join(key),)
+            )
+            return frozenset(name for name, in cursor)
+
+    def stamp(self, key):
+        """Stamp the ``key`` with the largest row id of the table.
+        Every new key gets a larger row id than existing ones, so it
+        changes whenever a key is added, though it also changes when
+        values are updated.
+
+        """
+        super(SQLiteRepository, self).stamp(key)
+        with self.lock:
+            found, value = self._select(key)
+            if not found or value is not None:
+                raise RepositoryKeyError(key)
+            row = self.connection.execute(
+                'SELECT max(rowid) FROM {0}'.format(self.TABLE_NAME)
+            ).fetchone()
+            return row[0]
+
+    def __repr__(self):
+        return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
+                                                           self.path)
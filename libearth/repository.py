@@ -37,26 +37,46 @@ __ https://pythonhosted.org/setuptools/pkg_resources.html#entry-points
 
 """
 import collections
+import contextlib
 import errno
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import hashlib
 import io
+try:
+    import mmap
+except ImportError:
+    mmap = None
 import os
 import os.path
 import pipes
+import select
 import shutil
+import stat
 import sys
 import tempfile
 import threading
+import time
 try:
     from urllib import parse as urlparse
 except ImportError:
     import urlparse
-import weakref
 
-from .compat import IRON_PYTHON, string_type, xrange
+from .compat import IRON_PYTHON, PY3, string_type, text_type, xrange
+from .compat import inotify
+from .compat.parallel import parallel_map
 
 __all__ = ('FileIterator', 'FileNotFoundError', 'FileSystemRepository',
-           'NotADirectoryError', 'Repository', 'RepositoryKeyError',
-           'from_url')
+           'InotifyWatcher', 'MappedFileIterator', 'NotADirectoryError',
+           'PollingWatcher', 'Repository', 'RepositoryKeyError', 'Watcher',
+           'from_url', 'get_shard_name', 'migrate_layout')
+
+# The process umask.  It can be read only by setting a new one, so it's
+# read once at import time.
+_umask = os.umask(0o022)
+os.umask(_umask)
 
 
 def from_url(url):
@@ -193,6 +213,28 @@ class Repository(object):
                 'implement read() method'.format(Repository)
             )
 
+    def read_many(self, keys):
+        """Read the contents of several keys at once.  The default
+        implementation simply calls :meth:`read()` for each key, but
+        subclasses may override it to read them more efficiently
+        e.g. in parallel or in a single query.
+
+        :param keys: the keys to read
+        :type keys: :class:`collections.Iterable`
+        :returns: the list of byte string chunks of each key, in the same
+                  order to the given ``keys``.  see also :meth:`read()`
+        :rtype: :class:`collections.Sequence`
+        :raises RepositoryKeyError: any of ``keys`` cannot be found in
+                                    the repository, or it's not a file
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(keys, collections.Iterable):
+            raise TypeError('expected an iterable object, not ' + repr(keys))
+        if hash(type(self).read_many) == hash(Repository.read_many):
+            return [self.read(key) for key in keys]
+
     def write(self, key, iterable):
         """Write the ``iterable`` into the ``key``.
 
@@ -221,6 +263,24 @@ class Repository(object):
                 'implement write() method'.format(Repository)
             )
 
+    def write_many(self, items):
+        """Write several values at once.  The default implementation
+        simply calls :meth:`write()` for each pair, but subclasses may
+        override it to write them more efficiently e.g. in a single
+        transaction.
+
+        :param items: pairs of (key, iterable).  see also :meth:`write()`
+        :type items: :class:`collections.Iterable`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(items, collections.Iterable):
+            raise TypeError('expected an iterable object, not ' + repr(items))
+        if hash(type(self).write_many) == hash(Repository.write_many):
+            for key, iterable in items:
+                self.write(key, iterable)
+
     def exists(self, key):
         """Return whether the ``key`` exists or not.  It returns :const:`False`
         if it doesn't exist instead of raising :exc:`RepositoryKeyError`.
@@ -245,6 +305,26 @@ class Repository(object):
                 'implement exists() method'.format(Repository)
             )
 
+    def exists_many(self, keys):
+        """Return whether several keys exist or not at once.
+        The default implementation simply calls :meth:`exists()` for
+        each key, but subclasses may override it to find them more
+        efficiently e.g. in a single query.
+
+        :param keys: the keys to find whether they exist
+        :type keys: :class:`collections.Iterable`
+        :returns: the list of :class:`bool` values of each key, in the same
+                  order to the given ``keys``
+        :rtype: :class:`collections.Sequence`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(keys, collections.Iterable):
+            raise TypeError('expected an iterable object, not ' + repr(keys))
+        if hash(type(self).exists_many) == hash(Repository.exists_many):
+            return [self.exists(key) for key in keys]
+
     def list(self, key):
         """List all subkeys in the ``key``.
 
@@ -269,6 +349,87 @@ class Repository(object):
                 'implement list() method'.format(Repository)
             )
 
+    def stamp(self, key):
+        """Get a token which changes whenever subkeys are added to or
+        removed from the ``key``.  It's used for validating caches of
+        listings e.g. :attr:`BaseStage.directory_indices
+        <libearth.stage.BaseStage.directory_indices>`.
+
+        The default implementation returns :const:`None` which means
+        it can't tell whether subkeys were changed or not, so caches should
+        not be trusted.  Subclasses may override it to return something
+        cheaper than listing the ``key``, e.g. the modification time of
+        the directory.
+
+        :param key: the incomplete key that might have subkeys
+        :type key: :class:`collections.Sequence`
+        :returns: the comparable token, or :const:`None`
+        :raises RepositoryKeyError: the ``key`` cannot be found in
+                                    the repository, or it's not a directory
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(key, collections.Sequence):
+            raise TypeError('key must be a sequence, not ' + repr(key))
+
+    def watch(self, key, interval=1.0):
+        """Watch changes of the ``key`` and its subkeys.  The default
+        implementation returns a :class:`PollingWatcher` which compares
+        digests of every value in the ``key`` at each ``interval``,
+        but subclasses may override it to be notified more efficiently.
+
+        .. code-block:: python
+
+           with repository.watch(['feeds']) as watcher:
+               for key in watcher:
+                   print(key)  # e.g. ['feeds', 'abc', 'session.xml']
+
+        :param key: the key to watch.  it can be an upper key (directory)
+        :type key: :class:`collections.Sequence`
+        :param interval: the polling interval in seconds, if the changes
+                         are polled.  1 second by default
+        :type interval: :class:`numbers.Real`
+        :returns: the iterator of changed keys
+        :rtype: :class:`Watcher`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(key, collections.Sequence):
+            raise TypeError('key must be a sequence, not ' + repr(key))
+        if hash(type(self).watch) == hash(Repository.watch):
+            return PollingWatcher(self, key, interval)
+
+    def lock_keys(self, keys):
+        """Lock the given ``keys`` against other processes that share
+        the same repository, so that a read-modify-write cycle of them
+        can be done safely e.g.:
+
+        .. code-block:: python
+
+           with repository.lock_keys([key]):
+               value = merge(repository.read(key), new_value)
+               repository.write(key, value)
+
+        Upper keys (directories) can be also locked, and they lock all of
+        their subkeys as well.  The default implementation does nothing,
+        but subclasses which can be shared by several processes may
+        override it.
+
+        :param keys: the keys to lock
+        :type keys: :class:`collections.Iterable`
+        :returns: the context manager which holds locks until it exits
+        :rtype: context manager
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(keys, collections.Iterable):
+            raise TypeError('expected an iterable object, not ' + repr(keys))
+        if hash(type(self).lock_keys) == hash(Repository.lock_keys):
+            return _hold_nothing()
+
     def __repr__(self):
         return '{0.__module__}.{0.__name__}()'.format(type(self))
 
@@ -296,17 +457,141 @@ class FileSystemRepository(Repository):
     :param mkdir: create the directory if it doesn't exist yet.
                   :const:`True` by default
     :type mkdir: :class:`bool`
-    :param atomic: make the update invisible until it's complete.
-                   :const:`False` by default
+    :param atomic: deprecated and ignored.  every update is atomic
+    :param buffer_size: the size of the first chunk that :meth:`read()`
+                        produces.  4096 bytes by default
+    :type buffer_size: :class:`numbers.Integral`
+    :param max_buffer_size: the size of chunks that :meth:`read()` produces
+                            doubles every step until it reaches this.
+                            65536 bytes by default.  if it's :const:`None`
+                            every chunk is ``buffer_size``
+    :type max_buffer_size: :class:`numbers.Integral`
+    :param mmap_threshold: files at least this size are memory-mapped
+                           when these are :meth:`read()`.  smaller files
+                           are read through ordinary :meth:`io.RawIOBase.read`
+                           calls.  memory-mapping is turned off
+                           if it's :const:`None` (default).  it's ignored
+                           on Windows and IronPython
+    :type mmap_threshold: :class:`numbers.Integral`
+    :param fsync: flush written files and their directories to the disk
+                  before it returns.  :const:`False` by default
+    :type fsync: :class:`bool`
+    :param shard_width: the number of hexadecimal digits of shard
+                        directory names.  if it's set every file and
+                        directory is stored under a shard directory named
+                        by the hash of its name, so that no directory
+                        becomes too large.  the layout is recorded in the
+                        repository, so it can be omitted for existing
+                        repositories.  see also :func:`migrate_layout()`
+                        to convert existing repositories
+    :type shard_width: :class:`numbers.Integral`
+    :param process_lock: make :meth:`lock_keys()` to actually lock keys
+                         against other processes using :manpage:`flock(2)`.
+                         it's available only on platforms which provide
+                         :mod:`fcntl` module.  :const:`False` by default
+    :type process_lock: :class:`bool`
     :raises FileNotFoundError: when the ``path`` doesn't exist
     :raises NotADirectoryError: when the ``path`` is not a directory
+    :raises ValueError: when the ``shard_width`` doesn't match to
+                        the layout of the existing repository,
+                        or ``process_lock`` is unavailable
+
+    .. versionadded:: 0.4.0
+       Added ``buffer_size``, ``max_buffer_size``, ``mmap_threshold``,
+       ``fsync``, ``shard_width``, and ``process_lock`` parameters.
+
+    .. versionchanged:: 0.4.0
+       Every update became atomic.  A new file is written next to the old
+       one, and then renamed to replace the old one.  Readers that already
+       opened the old file keep reading the old content.
+
+    .. deprecated:: 0.4.0
+       The ``atomic`` parameter became ignored.
 
     """
 
+    #: (:class:`str`) The suffix of temporary files that are being written.
+    #: These are hidden from :meth:`list()`.
+    #:
+    #: .. versionadded:: 0.4.0
+    TEMPORARY_SUFFIX = '.libearth-tmp'
+
+    #: (:class:`str`) The name of the file which records the
+    #: :attr:`shard_width` of the sharded repository.
+    #:
+    #: .. versionadded:: 0.4.0
+    SHARD_MARKER = '.libearth-shard'
+
+    #: (:class:`str`) The name of the directory which contains lock files
+    #: of :meth:`lock_keys()`.  It's hidden from :meth:`list()`.
+    #:
+    #: .. versionadded:: 0.4.0
+    LOCK_DIRECTORY = '.libearth-locks'
+
+    #: (:class:`numbers.Real`) Directories modified within this seconds
+    #: aren't stamped by :meth:`stamp()`, because file systems of coarse
+    #: timestamp resolution can't tell later changes in the same time apart.
+    #:
+    #: .. versionadded:: 0.4.0
+    MTIME_RESOLUTION = 2
+
     #: (:class:`str`) The path of the directory to read and write data files.
     #: It should be readable and writable.
     path = None
 
+    #: (:class:`numbers.Integral`) The size of the first chunk that
+    #: :meth:`read()` produces.
+    #:
+    #: .. versionadded:: 0.4.0
+    buffer_size = None
+
+    #: (:class:`numbers.Integral`) The maximum size of chunks that
+    #: :meth:`read()` produces.  It might be :const:`None` if the size of
+    #: chunks doesn't grow.
+    #:
+    #: .. versionadded:: 0.4.0
+    max_buffer_size = None
+
+    #: (:class:`numbers.Integral`) Files at least this size are
+    #: memory-mapped when these are :meth:`read()`.  It might be
+    #: :const:`None` if memory-mapping is turned off.
+    #:
+    #: .. versionadded:: 0.4.0
+    mmap_threshold = None
+
+    #: (:class:`bool`) Whether to flush written files and their directories
+    #: to the disk.
+    #:
+    #: .. versionadded:: 0.4.0
+    fsync = None
+
+    #: (:class:`numbers.Integral`) The number of threads to read files
+    #: in parallel in :meth:`read_many()`.
+    #:
+    #: .. versionadded:: 0.4.0
+    pool_size = 8
+
+    #: (:class:`numbers.Integral`) The number of hexadecimal digits of
+    #: shard directory names.  It's :const:`None` if the repository
+    #: is not sharded.
+    #:
+    #: .. versionadded:: 0.4.0
+    shard_width = None
+
+    #: (:class:`bool`) Whether :meth:`lock_keys()` locks keys against
+    #: other processes.
+    #:
+    #: .. versionadded:: 0.4.0
+    process_lock = None
+
+    #: (:class:`numbers.Integral`) The number of lock files.  Keys are
+    #: mapped to lock files by their hash, so the number of lock files
+    #: doesn't grow along with the number of keys.  Unrelated keys could
+    #: share the same lock file, but it only makes them wait a little.
+    #:
+    #: .. versionadded:: 0.4.0
+    lock_stripes = 1024
+
     @classmethod
     def from_url(cls, url):
         if not isinstance(url, urlparse.ParseResult):
@@ -329,7 +614,15 @@ class FileSystemRepository(Repository):
             path = url.path
         return cls(path)
 
-    def __init__(self, path, mkdir=True, atomic=IRON_PYTHON):
+    def __init__(self, path, mkdir=True, atomic=True,
+                 buffer_size=4096, mmap_threshold=None, fsync=False,
+                 shard_width=None, process_lock=False,
+                 max_buffer_size=65536):
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be a positive integer, not ' +
+                             repr(buffer_size))
+        elif process_lock and fcntl is None:
+            raise ValueError('process_lock is unavailable on this platform')
         if not os.path.exists(path):
             if mkdir:
                 try:
@@ -344,9 +637,44 @@ class FileSystemRepository(Repository):
         if not os.path.isdir(path):
             raise NotADirectoryError(repr(path) + ' is not a directory')
         self.path = path
-        self.atomic = atomic
+        self.atomic = True
+        self.buffer_size = buffer_size
+        self.max_buffer_size = max_buffer_size
+        if mmap is None or IRON_PYTHON or sys.platform == 'win32':
+            # Mapped files cannot be replaced on Windows
+            mmap_threshold = None
+        self.mmap_threshold = mmap_threshold
+        self.fsync = bool(fsync)
         self.lock = threading.RLock()
-        self.file_iterators = {}
+        self.process_lock = bool(process_lock)
+        if self.process_lock:
+            try:
+                os.mkdir(os.path.join(path, self.LOCK_DIRECTORY))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        marker = os.path.join(path, self.SHARD_MARKER)
+        try:
+            with open(marker) as f:
+                stored_width = int(f.read().strip())
+        except (IOError, OSError):
+            stored_width = None
+        if shard_width is None or shard_width == stored_width:
+            self.shard_width = stored_width
+            return
+        elif not 0 < shard_width <= 8:
+            raise ValueError('shard_width must be between 1 and 8, not ' +
+                             repr(shard_width))
+        elif stored_width is not None or self.list([]):
+            raise ValueError(
+                '{0!r} is not an empty repository of the same layout; '
+                'use {1.__module__}.{1.__name__}() to convert it'.format(
+                    path, migrate_layout
+                )
+            )
+        with open(marker, 'w') as f:
+            f.write(str(shard_width))
+        self.shard_width = shard_width
 
     def to_url(self, scheme):
         super(FileSystemRepository, self).to_url(scheme)
@@ -356,27 +684,119 @@ class FileSystemRepository(Repository):
             return '{0}:///{1}/{2}'.format(scheme, drive, path)
         return '{0}://{1}'.format(scheme, self.path)
 
+    def get_path(self, key):
+        """Get the file path of the given ``key``.
+
+        :param key: the key
+        :type key: :class:`collections.Sequence`
+        :returns: the path of the file or the directory of the ``key``
+        :rtype: :class:`str`
+
+        .. versionadded:: 0.4.0
+
+        """
+        return os.path.join(self.path, *self._get_path_parts(key))
+
+    def _get_path_parts(self, key):
+        width = self.shard_width
+        if width is None:
+            return list(key)
+        parts = []
+        for name in key:
+            parts.append(get_shard_name(name, width))
+            parts.append(name)
+        return parts
+
     def read(self, key):
         super(FileSystemRepository, self).read(key)
-        path = os.path.join(self.path, *key)
+        path = self.get_path(key)
         if not os.path.isfile(path):
             raise RepositoryKeyError(key)
-        with self.lock:
-            iterator = FileIterator(path, buffer_size=4096)
-            try:
-                iterator_set = self.file_iterators[path]
-            except KeyError:
-                # weakref.WeakSet was introduced since Python 2.7,
-                # so workaround it on Python 2.6 by using WeakKeyDictionary
-                iterator_set = weakref.WeakKeyDictionary({iterator: 1})
-                self.file_iterators[path] = iterator_set
-            else:
-                iterator_set[iterator] = len(iterator_set) + 1
-            return iterator
+        threshold = self.mmap_threshold
+        if threshold is not None and os.path.getsize(path) >= threshold:
+            return MappedFileIterator(path, self.buffer_size,
+                                      self.max_buffer_size)
+        return FileIterator(path, self.buffer_size, self.max_buffer_size)
+
+    def read_many(self, keys):
+        """Read several files in parallel using :attr:`pool_size` threads.
+
+        .. note::
+
+           Unlike :meth:`read()`, each of several files is completely read
+           into memory by a single call, so it takes as much memory as
+           the total size of the files.  A single key is read through
+           :meth:`read()` instead.
+
+        """
+        super(FileSystemRepository, self).read_many(keys)
+        keys = list(keys)
+        for key in keys:
+            super(FileSystemRepository, self).read(key)
+        if len(keys) < 2:
+            return [self.read(key) for key in keys]
+        values = [None] * len(keys)
+        pairs = parallel_map(
+            min(self.pool_size, len(keys)),
+            lambda i: (i, self._read_whole(keys[i])),
+            xrange(len(keys))
+        )
+        for i, value in pairs:
+            values[i] = value,
+        return values
+
+    def _read_whole(self, key):
+        try:
+            f = open_for_reading(self.get_path(key))
+        except (IOError, OSError) as e:
+            raise RepositoryKeyError(key, str(e))
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            chunks = []
+            while True:
+                # Raw reads might be shorter than requested, so read
+                # until EOF.
+                chunk = f.read(max(size, self.buffer_size))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b''.join(chunks)
 
     def write(self, key, iterable):
         super(FileSystemRepository, self).write(key, iterable)
-        dirpath = list(key)[:-1]
+        self._write_files([(key, iterable)])
+
+    def write_many(self, items):
+        super(FileSystemRepository, self).write_many(items)
+        pairs = []
+        for key, iterable in items:
+            super(FileSystemRepository, self).write(key, iterable)
+            pairs.append((key, iterable))
+        self._write_files(pairs)
+
+    def _write_files(self, pairs):
+        directories = set()
+        written = []
+        try:
+            for key, iterable in pairs:
+                filename = self._make_directories(key, directories)
+                tempname = self._write_file(filename, iterable)
+                written.append((tempname, filename))
+        except BaseException:
+            for tempname, _ in written:
+                remove_quietly(tempname)
+            raise
+        # Every file is completely written before any of them is replaced,
+        # so a failure in the middle doesn't publish a partial batch.
+        for tempname, filename in written:
+            replace_file(tempname, filename)
+            directories.add(os.path.dirname(filename))
+        if self.fsync:
+            for dirname in directories:
+                fsync_directory(dirname)
+
+    def _make_directories(self, key, created_parents):
+        dirpath = self._get_path_parts(key)[:-1]
         dirpath.insert(0, self.path)
         for i in xrange(len(dirpath)):
             p = os.path.join(*dirpath[:i + 1])
@@ -388,43 +808,166 @@ class FileSystemRepository(Repository):
                         pass
                     else:
                         raise
+                else:
+                    created_parents.add(os.path.dirname(p))
             elif not os.path.isdir(p):
                 raise RepositoryKeyError(key)
-        filename = os.path.join(self.path, *key)
-        with self.lock:
-            already_opened_iterators = self.file_iterators.get(filename, {})
-            for iterator in already_opened_iterators.keys():
-                iterator.preload_all()
-        if self.atomic:
-            f = tempfile.NamedTemporaryFile('wb', delete=False)
-        else:
-            f = io.open(filename, 'wb')
-        with f:
-            for chunk in iterable:
-                f.write(chunk)
-        if self.atomic:
-            if IRON_PYTHON:
-                # FIXME: no mv in windows
-                cmd = '/bin/mv {0} {1}'.format(
-                    pipes.quote(f.name),
-                    pipes.quote(filename)
-                )
-                with os.popen(cmd) as pf:
-                    pf.read()
-            else:
-                shutil.move(f.name, filename)
+        return self.get_path(key)
+
+    def _write_file(self, filename, iterable):
+        # Files are never overwritten in place.  A new file is written next
+        # to the old one and then renamed to replace it, so that readers
+        # that opened the old one keep reading its original inode.
+        dirname, basename = os.path.split(filename)
+        fd, tempname = tempfile.mkstemp(prefix='.' + basename + '.',
+                                        suffix=self.TEMPORARY_SUFFIX,
+                                        dir=dirname)
+        try:
+            with io.open(fd, 'wb') as f:
+                for chunk in iterable:
+                    f.write(chunk)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # mkstemp() creates files of 0600, so new files take the same
+            # mode as open() would have given them.
+            try:
+                mode = stat.S_IMODE(os.stat(filename).st_mode)
+            except OSError:
+                mode = 0o666 & ~_umask
+            os.chmod(tempname, mode)
+        except BaseException:
+            remove_quietly(tempname)
+            raise
+        return tempname
 
     def exists(self, key):
         super(FileSystemRepository, self).exists(key)
-        return os.path.exists(os.path.join(self.path, *key))
+        return os.path.exists(self.get_path(key))
 
     def list(self, key):
         super(FileSystemRepository, self).list(key)
+        path = self.get_path(key)
         try:
-            names = os.listdir(os.path.join(self.path, *key))
+            names = os.listdir(path)
+            if self.shard_width is not None:
+                names = [name
+                         for shard in names if self._is_shard_name(shard)
+                         for name in os.listdir(os.path.join(path, shard))]
         except (IOError, OSError) as e:
             raise RepositoryKeyError(key, str(e))
-        return frozenset(name for name in names if name != '..' or name != '.')
+        suffix = self.TEMPORARY_SUFFIX
+        hidden = '.', '..', self.LOCK_DIRECTORY
+        return frozenset(name for name in names
+                         if name not in hidden and not name.endswith(suffix))
+
+    def stamp(self, key):
+        """Stamp the directory of the ``key`` with its modification time
+        (and ones of its shards) instead of listing it.
+
+        """
+        super(FileSystemRepository, self).stamp(key)
+        path = self.get_path(key)
+        try:
+            paths = [path]
+            if self.shard_width is not None:
+                paths.extend(os.path.join(path, name)
+                             for name in sorted(os.listdir(path))
+                             if self._is_shard_name(name))
+            stats = [os.stat(p) for p in paths]
+        except (IOError, OSError) as e:
+            raise RepositoryKeyError(key, str(e))
+        threshold = time.time() - self.MTIME_RESOLUTION
+        if any(st.st_mtime >= threshold for st in stats):
+            return None
+        return tuple((st.st_ino, st.st_mtime, st.st_size) for st in stats)
+
+    def watch(self, key, interval=1.0):
+        """Watch changes of files through Linux inotify if it's available.
+        Otherwise it falls back to polling the modification time and
+        the size of files.
+
+        """
+        super(FileSystemRepository, self).watch(key, interval)
+        if inotify.available:
+            try:
+                return InotifyWatcher(self, key)
+            except (IOError, OSError):
+                pass
+        return PollingWatcher(self, key, interval, stamp=self._stat_files)
+
+    def _stat_files(self, keys):
+        stamps = []
+        for key in keys:
+            try:
+                st = os.stat(self.get_path(key))
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((st.st_ino, st.st_mtime, st.st_size))
+        return stamps
+
+    def lock_keys(self, keys):
+        """Lock the given ``keys`` against other processes if
+        :attr:`process_lock` is turned on.  Otherwise it does nothing.
+
+        A key is locked exclusively, and its upper keys are locked in
+        shared mode, so that locking an upper key waits for every lock of
+        its subkeys and vice versa.  Lock files are always acquired in
+        the same order, hence two processes locking several keys at once
+        never deadlock.
+
+        .. note::
+
+           Locks aren't reentrant.  Keys which are already locked by
+           the current thread must not be locked again.
+
+        .. versionadded:: 0.4.0
+
+        """
+        super(FileSystemRepository, self).lock_keys(keys)
+        if not self.process_lock:
+            return _hold_nothing()
+        modes = {}
+        for key in keys:
+            key = tuple(key)
+            for i in xrange(len(key)):
+                modes.setdefault(self._get_lock_stripe(key[:i]),
+                                 fcntl.LOCK_SH)
+            modes[self._get_lock_stripe(key)] = fcntl.LOCK_EX
+        return self._hold_lock_files(sorted(modes.items()))
+
+    def _get_lock_stripe(self, key):
+        name = '/'.join(key)
+        if isinstance(name, text_type):
+            name = name.encode('utf-8')
+        digest = hashlib.sha1(name).hexdigest()
+        return int(digest[:8], 16) % self.lock_stripes
+
+    @contextlib.contextmanager
+    def _hold_lock_files(self, stripes):
+        directory = os.path.join(self.path, self.LOCK_DIRECTORY)
+        fds = []
+        try:
+            for stripe, mode in stripes:
+                filename = os.path.join(directory,
+                                        '{0:04x}.lock'.format(stripe))
+                fds.append(os.open(filename, os.O_RDONLY | os.O_CREAT, 0o644))
+                fcntl.flock(fds[-1], mode)
+            yield
+        finally:
+            # Closing the file descriptor releases its lock.
+            for fd in reversed(fds):
+                os.close(fd)
+
+    def _is_shard_name(self, name):
+        if len(name) != self.shard_width:
+            return False
+        try:
+            int(name, 16)
+        except ValueError:
+            return False
+        return True
 
     def __repr__(self):
         return '{0.__module__}.{0.__name__}({1!r})'.format(type(self),
@@ -435,34 +978,78 @@ class FileIterator(collections.Iterator):
     """Read a file through :class:`~collections.Iterator` protocol,
     with automatic closing of the file when it ends.
 
+    If ``max_buffer_size`` is given the size of chunks grows adaptively:
+    it starts from ``buffer_size``, and doubles every step until it
+    reaches ``max_buffer_size``.  So consumers which read only the head
+    of the file (e.g. :func:`~libearth.session.parse_revision()`) don't
+    have to read a large chunk, and consumers which read the whole file
+    take only a few large reads.
+
     :param path: the path of file
     :type path: :class:`str`
-    :param buffer_size: the size of bytes that would be produced each step
+    :param buffer_size: the size of bytes that would be produced each step.
+                        if ``max_buffer_size`` is given it's the size of
+                        the first chunk
     :type buffer_size: :class:`numbers.Integral`
+    :param max_buffer_size: the maximum size of chunks.  the size of
+                            chunks doesn't grow if it's :const:`None`
+                            (default)
+    :type max_buffer_size: :class:`numbers.Integral`
+    :param reuse_buffer: read chunks into the same preallocated
+                         :class:`bytearray` using
+                         :meth:`~io.RawIOBase.readinto()` instead of
+                         allocating a new byte string for every chunk.
+                         produced chunks are :class:`memoryview` slices
+                         which are valid only until the next chunk is
+                         read, so consumers have to copy them if they
+                         keep chunks, e.g. ``b''.join(chunks)`` doesn't
+                         work.  therefore repositories never turn it on
+                         for :meth:`Repository.read()`, of which chunks
+                         have to be byte strings.  it's ignored on
+                         Python 2.  :const:`False` by default
+    :type reuse_buffer: :class:`bool`
+
+    .. versionadded:: 0.4.0
+       Added ``max_buffer_size`` and ``reuse_buffer`` parameters.
 
     """
 
-    def __init__(self, path, buffer_size):
+    def __init__(self, path, buffer_size, max_buffer_size=None,
+                 reuse_buffer=False):
         self.path = path
         self.buffer_size = buffer_size
+        self.max_buffer_size = max(buffer_size,
+                                   max_buffer_size or buffer_size)
+        self.reuse_buffer = bool(reuse_buffer)
+        self.next_size = buffer_size
+        self.buffer_ = None
         self.file_ = None
 
     def __iter__(self):
-        self.file_ = io.open(self.path, 'rb', buffering=0)
+        self.file_ = open_for_reading(self.path)
+        self.next_size = self.buffer_size
         return self
 
+    def _grow(self):
+        """Get the size of the next chunk, and grow it for the next time."""
+        size = self.next_size
+        self.next_size = min(size * 2, self.max_buffer_size)
+        return size
+
     def __next__(self):
         f = self.file_
         if f is None:
             f = self.__iter__().file_
         elif f.closed:
-            if hasattr(self, 'preloaded'):
-                rest = self.preloaded
-                del self.preloaded
-                return rest
             raise StopIteration
+        size = self._grow()
         try:
-            chunk = f.read(self.buffer_size)
+            if self.reuse_buffer and PY3:
+                if self.buffer_ is None:
+                    self.buffer_ = memoryview(bytearray(self.max_buffer_size))
+                chunk = self.buffer_[:f.readinto(self.buffer_[:size])]
+            else:
+                chunk = f.read(size)
         except:
             self.file_.close()
             raise
@@ -473,6 +1060,15 @@ class FileIterator(collections.Iterator):
 
     next = __next__
 
+    def close(self):
+        """Close the file even if it's not completely read.
+
+        .. versionadded:: 0.4.0
+
+        """
+        if self.file_ is not None:
+            self.file_.close()
+
     def tell(self):
         return self.file_ and self.file_.tell()
 
@@ -484,13 +1080,620 @@ class FileIterator(collections.Iterator):
         if self.file_ is not None:
             return self.file_.read(*args)
 
-    def preload_all(self):
-        f = self.file_
-        if f is None:
-            f = self.__iter__().file_
-        elif not f.closed:
-            self.preloaded = f.read()
-            f.close()
+
+class MappedFileIterator(FileIterator):
+    """Read a file through :class:`~collections.Iterator` protocol
+    using :mod:`mmap`.  It produces :class:`memoryview` slices of
+    the mapped file (or byte string slices on Python 2) so that
+    chunks are not copied until the consumer needs to.
+
+    The mapping is unmapped when it ends and every produced slice
+    is released.
+
+    :param path: the path of file
+    :type path: :class:`str`
+    :param buffer_size: the size of bytes that would be produced each step.
+                        if ``max_buffer_size`` is given it's the size of
+                        the first chunk
+    :type buffer_size: :class:`numbers.Integral`
+    :param max_buffer_size: the maximum size of chunks.  the size of
+                            chunks doesn't grow if it's :const:`None`
+                            (default)
+    :type max_buffer_size: :class:`numbers.Integral`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self, path, buffer_size, max_buffer_size=None):
+        super(MappedFileIterator, self).__init__(path, buffer_size,
+                                                 max_buffer_size)
+        self.mapping = None
+        self.view = None
+        self.offset = 0
+        self.closed = False
+
+    def __iter__(self):
+        if self.mapping is None and not self.closed:
+            with io.open(self.path, 'rb') as f:
+                try:
+                    mapping = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+                except ValueError:
+                    # mmap cannot map an empty file
+                    self.closed = True
+                    return self
+            self.mapping = mapping
+            self.view = memoryview(mapping) if PY3 else mapping
+            self.offset = 0
+            self.next_size = self.buffer_size
+        return self
+
+    def __next__(self):
+        if self.mapping is None and not self.closed:
+            self.__iter__()
+        if self.closed:
+            raise StopIteration
+        offset = self.offset
+        end = offset + self._grow()
+        chunk = self.view[offset:end]
+        if not len(chunk):
+            self.close()
+            raise StopIteration
+        self.offset = min(end, len(self.mapping))
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        """Unmap the file.  If any produced slices are still alive
+        the file is unmapped when they are all released.
+
+        """
+        mapping = self.mapping
+        self.mapping = self.view = None
+        self.closed = True
+        if mapping is not None:
+            try:
+                mapping.close()
+            except BufferError:
+                pass
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.offset
+        elif whence == os.SEEK_END:
+            offset += len(self.mapping) if self.mapping is not None else 0
+        self.offset = max(0, offset)
+
+    def read(self, size=-1):
+        mapping = self.mapping
+        if mapping is None:
+            return
+        offset = self.offset
+        end = len(mapping) if size is None or size < 0 else offset + size
+        chunk = mapping[offset:end]
+        self.offset += len(chunk)
+        return chunk
+
+
+class Watcher(collections.Iterator):
+    """Iterator which yields keys that have changed in the repository.
+    Iterating it blocks until any change is found, and it stops when
+    it's closed.  Use :meth:`poll()` to wait for changes with timeout.
+    See also :meth:`Repository.watch()`.
+
+    .. note::
+
+       Every subclass of :class:`Watcher` has to override :meth:`poll()`
+       method to implement details.
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`bool`) Whether it's closed or not.
+    closed = False
+
+    def __init__(self):
+        self.pending = collections.deque()
+
+    def poll(self, timeout=None):
+        """Wait for changes, and return changed keys.
+
+        :param timeout: the maximum seconds to wait.  wait until any change
+                        is found if it's :const:`None` (default)
+        :type timeout: :class:`numbers.Real`
+        :returns: the list of changed keys.  it's empty if no change is
+                  found within ``timeout`` or the watcher is closed
+        :rtype: :class:`collections.Sequence`
+
+        """
+        raise NotImplementedError(
+            'every subclass of {0.__module__}.{0.__name__} has to '
+            'implement poll() method'.format(Watcher)
+        )
+
+    def close(self):
+        """Stop watching.  Ongoing :meth:`poll()` call returns and
+        iteration stops.
+
+        """
+        self.closed = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.pending:
+            if self.closed:
+                raise StopIteration
+            self.pending.extend(self.poll())
+        return self.pending.popleft()
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """:class:`Watcher` which periodically takes snapshots of
+    the repository and compares them.  It works with every repository.
+
+    :param repository: the repository to watch
+    :type repository: :class:`Repository`
+    :param key: the key to watch
+    :type key: :class:`collections.Sequence`
+    :param interval: the polling interval in seconds.  1 second by default
+    :type interval: :class:`numbers.Real`
+    :param stamp: the function that takes the list of keys and returns
+                  the list of their stamps to compare e.g. modification
+                  times.  :const:`None` for missing keys.  digests of
+                  values are compared if it's omitted
+    :type stamp: :class:`collections.Callable`
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    def __init__(self, repository, key, interval=1.0, stamp=None):
+        super(PollingWatcher, self).__init__()
+        self.repository = repository
+        self.key = list(key)
+        self.interval = interval
+        self.stamp = stamp or self._digest_values
+        self.closing = threading.Event()
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        """Take a snapshot of the current stamps of values.
+
+        :returns: the mapping of key tuples to their stamps
+        :rtype: :class:`collections.Mapping`
+
+        """
+        keys = []
+        self._walk(self.key, keys)
+        return dict((tuple(key), stamp)
+                    for key, stamp in zip(keys, self.stamp(keys))
+                    if stamp is not None)
+
+    def _walk(self, key, keys):
+        try:
+            names = self.repository.list(key)
+        except RepositoryKeyError:
+            if key and self.repository.exists(key):
+                keys.append(key)
+            return
+        for name in names:
+            self._walk(key + [name], keys)
+
+    def _digest_values(self, keys):
+        stamps = []
+        for key in keys:
+            try:
+                value = b''.join(self.repository.read(key))
+            except (IOError, OSError):
+                # RepositoryKeyError is also a subtype of IOError
+                stamps.append(None)
+            else:
+                stamps.append(hashlib.sha1(value).digest())
+        return stamps
+
+    def poll(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.closed:
+            previous = self.snapshot
+            snapshot = self.take_snapshot()
+            self.snapshot = snapshot
+            changed = sorted(
+                key for key in frozenset(previous).union(snapshot)
+                if previous.get(key) != snapshot.get(key)
+            )
+            if changed:
+                return [list(key) for key in changed]
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    break
+            self.closing.wait(wait)
+        return []
+
+    def close(self):
+        super(PollingWatcher, self).close()
+        self.closing.set()
+
+
+class InotifyWatcher(Watcher):
+    """:class:`Watcher` for :class:`FileSystemRepository` which uses
+    Linux inotify.  Every subdirectory of the watched ``key`` is also
+    watched.  If the kernel drops events because of the queue overflow
+    the watched ``key`` itself is yielded.
+
+    :param repository: the repository to watch
+    :type repository: :class:`FileSystemRepository`
+    :param key: the key of the directory to watch
+    :type key: :class:`collections.Sequence`
+    :raises NotADirectoryError: when the ``key`` is not a directory
+    :raises OSError: when inotify is unavailable
+
+    .. versionadded:: 0.4.0
+
+    """
+
+    #: (:class:`numbers.Integral`) The mask of inotify events to watch.
+    MASK = (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_FROM |
+            inotify.IN_MOVED_TO | inotify.IN_CREATE | inotify.IN_DELETE |
+            inotify.IN_DELETE_SELF)
+
+    def __init__(self, repository, key):
+        super(InotifyWatcher, self).__init__()
+        path = repository.get_path(key)
+        if not os.path.isdir(path):
+            raise NotADirectoryError(repr(path) + ' is not a directory')
+        self.repository = repository
+        self.key = list(key)
+        self.lock = threading.Lock()
+        self.polling = False
+        self.watches = {}
+        self.fd = inotify.init()
+        self.pipe = os.pipe()
+        try:
+            self._add_watches(repository._get_path_parts(key))
+        except BaseException:
+            self._close_files()
+            raise
+
+    def _add_watches(self, parts, changed=None):
+        if parts[:1] == [self.repository.LOCK_DIRECTORY]:
+            return
+        path = os.path.join(self.repository.path, *parts)
+        try:
+            wd = inotify.add_watch(self.fd, path, self.MASK)
+            names = os.listdir(path)
+        except OSError:
+            return  # removed in the meantime
+        self.watches[wd] = parts
+        for name in names:
+            if os.path.isdir(os.path.join(path, name)):
+                self._add_watches(parts + [name], changed)
+            elif changed is not None:
+                # Files could be written before the directory is watched.
+                self._report(parts + [name], changed)
+
+    def _report(self, parts, changed):
+        name = parts[-1]
+        repository = self.repository
+        if name.endswith(repository.TEMPORARY_SUFFIX) or \
+           name == repository.SHARD_MARKER or \
+           parts[0] == repository.LOCK_DIRECTORY:
+            return
+        if repository.shard_width is not None:
+            if len(parts) % 2:
+                return  # shard directories
+            parts = parts[1::2]
+        if parts not in changed:
+            changed.append(parts)
+
+    def poll(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.lock:
+            if self.closed:
+                return []
+            self.polling = True
+        try:
+            while not self.closed:
+                wait = None
+                if deadline is not None:
+                    wait = max(0, deadline - time.time())
+                readable, _, _ = select.select([self.fd, self.pipe[0]],
+                                               [], [], wait)
+                if self.closed:
+                    break
+                changed = []
+                for wd, mask, _, name in inotify.read_events(self.fd):
+                    self._handle_event(wd, mask, name, changed)
+                if changed:
+                    return changed
+                elif deadline is not None and time.time() >= deadline:
+                    break
+            return []
+        finally:
+            with self.lock:
+                self.polling = False
+                if self.closed:
+                    self._close_files()
+
+    def _handle_event(self, wd, mask, name, changed):
+        if mask & inotify.IN_Q_OVERFLOW:
+            if self.key not in changed:
+                changed.append(list(self.key))
+            return
+        elif mask & inotify.IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        parts = self.watches.get(wd)
+        if parts is None or name is None:
+            return
+        parts = parts + [name]
+        if mask & inotify.IN_ISDIR and \
+           mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+            self._add_watches(parts, changed)
+        elif not mask & inotify.IN_CREATE:
+            # Created files are reported when they are closed.
+            self._report(parts, changed)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            super(InotifyWatcher, self).close()
+            if self.polling:
+                # Wake up the ongoing poll() call; it closes files.
+                os.write(self.pipe[1], b'x')
+            else:
+                self._close_files()
+
+    def _close_files(self):
+        os.close(self.fd)
+        os.close(self.pipe[0])
+        os.close(self.pipe[1])
+
+
+if sys.platform == 'win32' and not IRON_PYTHON:
+    import ctypes
+    import ctypes.wintypes
+    import msvcrt
+
+    def open_for_reading(path):
+        """Open the file of the given ``path`` for reading.  On Windows
+        the file is opened with ``FILE_SHARE_DELETE`` so that it can be
+        replaced while it's being read.
+
+        :param path: the path of file
+        :type path: :class:`str`
+        :returns: an unbuffered binary file object
+        :rtype: :class:`io.RawIOBase`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if not isinstance(path, text_type):
+            path = path.decode(sys.getfilesystemencoding())
+        create_file = ctypes.windll.kernel32.CreateFileW
+        create_file.restype = ctypes.wintypes.HANDLE
+        handle = create_file(
+            path,
+            0x80000000,  # GENERIC_READ
+            0x1 | 0x2 | 0x4,  # FILE_SHARE_READ | _WRITE | _DELETE
+            None,
+            3,  # OPEN_EXISTING
+            0x80,  # FILE_ATTRIBUTE_NORMAL
+            None
+        )
+        if handle == ctypes.wintypes.HANDLE(-1).value:
+            raise ctypes.WinError()
+        fd = msvcrt.open_osfhandle(handle, os.O_RDONLY | os.O_BINARY)
+        return io.open(fd, 'rb', buffering=0)
+else:
+    def open_for_reading(path):
+        """Open the file of the given ``path`` for reading.  On Windows
+        the file is opened with ``FILE_SHARE_DELETE`` so that it can be
+        replaced while it's being read.
+
+        :param path: the path of file
+        :type path: :class:`str`
+        :returns: an unbuffered binary file object
+        :rtype: :class:`io.RawIOBase`
+
+        .. versionadded:: 0.4.0
+
+        """
+        return io.open(path, 'rb', buffering=0)
+
+
+def replace_file(source, destination):
+    """Rename the ``source`` file to the ``destination`` path.  If
+    the ``destination`` already exists it's atomically replaced
+    (except on Windows before Python 3.3).
+
+    :param source: the path of the file to rename
+    :type source: :class:`str`
+    :param destination: the path to rename the file to
+    :type destination: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if IRON_PYTHON:
+        # FIXME: no mv in windows
+        cmd = '/bin/mv {0} {1}'.format(
+            pipes.quote(source),
+            pipes.quote(destination)
+        )
+        with os.popen(cmd) as pf:
+            pf.read()
+    elif hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        if sys.platform == 'win32':
+            # os.rename() cannot overwrite the existing file on Windows
+            # (and os.replace() is unavailable before Python 3.3)
+            remove_quietly(destination)
+        os.rename(source, destination)
+
+
+def iterate_chunks(value, buffer_size):
+    """Produce chunks of the given bytes-like ``value`` without copying it.
+
+    :param value: the bytes-like value to split
+    :param buffer_size: the size of each chunk
+    :type buffer_size: :class:`numbers.Integral`
+    :returns: :class:`memoryview` slices of the ``value`` (or byte string
+              slices on Python 2)
+    :rtype: :class:`collections.Iterable`
+
+    .. versionadded:: 0.4.0
+
+    """
+    view = memoryview(value) if PY3 else bytes(value)
+    for offset in xrange(0, len(view), buffer_size):
+        yield view[offset:offset + buffer_size]
+
+
+def get_shard_name(name, width):
+    """Get the name of the shard directory that the ``name`` belongs to.
+
+    :param name: the name of a file or a directory
+    :type name: :class:`str`
+    :param width: the number of hexadecimal digits of the shard name
+    :type width: :class:`numbers.Integral`
+    :returns: the shard directory name
+    :rtype: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if isinstance(name, text_type):
+        name = name.encode('utf-8')
+    return hashlib.md5(name).hexdigest()[:width]
+
+
+def migrate_layout(path, shard_width=None):
+    """Convert the layout of the existing :class:`FileSystemRepository`
+    on the ``path``, e.g. from flat to sharded.  Files are moved into
+    a new directory next to the ``path`` and then it replaces the ``path``.
+
+    .. note::
+
+       The repository must not be used by other processes while it's
+       being converted.
+
+    :param path: the directory path of the repository to convert
+    :type path: :class:`str`
+    :param shard_width: the new :attr:`~FileSystemRepository.shard_width`.
+                        it's converted to the flat layout if it's
+                        :const:`None` (default)
+    :type shard_width: :class:`numbers.Integral`
+    :returns: the converted repository
+    :rtype: :class:`FileSystemRepository`
+    :raises OSError: when some entries, e.g. files that don't belong to
+                     any key of the layout, could not be moved.  they are
+                     left in the ``path + '.libearth-old'`` directory, and
+                     the converted repository is on the ``path`` anyway
+
+    .. versionadded:: 0.4.0
+
+    """
+    source = FileSystemRepository(path, mkdir=False)
+    if source.shard_width == shard_width:
+        return source
+    path = path.rstrip(os.path.sep) or path
+    staging = path + '.libearth-migrating'
+    os.mkdir(staging)
+    target = FileSystemRepository(staging, shard_width=shard_width)
+
+    def move(key):
+        for name in source.list(key):
+            subkey = key + [name]
+            filename = source.get_path(subkey)
+            if os.path.isdir(filename):
+                move(subkey)
+            else:
+                replace_file(filename,
+                             target._make_directories(subkey, set()))
+    move([])
+    # Only internal files of the repository and emptied directories are
+    # removed.  Anything else, e.g. entries that aren't keys of the layout,
+    # is left in the backup directory rather than deleted.
+    lock_directory = os.path.join(path, source.LOCK_DIRECTORY)
+    if os.path.isdir(lock_directory):
+        shutil.rmtree(lock_directory)
+    remove_quietly(os.path.join(path, source.SHARD_MARKER))
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for filename in filenames:
+            if filename.endswith(source.TEMPORARY_SUFFIX):
+                remove_quietly(os.path.join(dirpath, filename))
+        if dirpath != path:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+    backup = path + '.libearth-old'
+    os.rename(path, backup)
+    os.rename(staging, path)
+    try:
+        os.rmdir(backup)
+    except OSError as e:
+        raise OSError(
+            e.errno,
+            'some entries could not be moved; they are left in ' + backup
+        )
+    return FileSystemRepository(path)
+
+
+@contextlib.contextmanager
+def _hold_nothing():
+    yield
+
+
+def remove_quietly(path):
+    """Remove the file of the given ``path`` if it exists.
+
+    .. versionadded:: 0.4.0
+
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def fsync_directory(path):
+    """Flush the directory entries of the given ``path`` to the disk.
+    It does nothing on Windows which cannot open directories.
+
+    :param path: the directory path to flush
+    :type path: :class:`str`
+
+    .. versionadded:: 0.4.0
+
+    """
+    if sys.platform == 'win32' or IRON_PYTHON:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 try:
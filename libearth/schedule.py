@@ -0,0 +1,384 @@
+""":mod:`libearth.schedule` --- Crawl scheduling
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Most feeds don't change between two crawls, and some feeds change several
+times a day while others change once a month.  :class:`FeedScheduler`
+estimates when each feed is likely to change from its crawler hints
+(see :attr:`CrawlResult.hints <libearth.crawler.CrawlResult.hints>`) and
+how often its entries have been published, so that a periodic job can
+crawl only feeds which are due:
+
+.. code-block:: python
+
+   scheduler = FeedScheduler(repository, ['.schedule'])
+   for feed_url in subscribed_feed_urls:
+       if feed_url not in scheduler:
+           scheduler.add(feed_url)
+   # crawl_stream() yields failures as CrawlError objects instead of
+   # raising them, so failed feeds are backed off as well.
+   for result in crawl_stream(scheduler.due_feeds(), 4):
+       scheduler.update(result)
+   scheduler.save()
+
+.. versionadded:: 0.4.0
+
+"""
+import datetime
+import json
+import threading
+
+from .codecs import Rfc3339
+from .crawler import CrawlError, CrawlResult
+from .parser.util import UPDATE_PERIODS, WEEKDAYS
+from .repository import Repository, RepositoryKeyError
+from .tz import now as utcnow, utc
+
+__all__ = ('BACKOFF', 'DEFAULT_INTERVAL', 'MAX_INTERVAL', 'MIN_INTERVAL',
+           'FeedScheduler', 'estimate_interval', 'get_hinted_interval',
+           'skip_hinted_times')
+
+
+#: (:class:`datetime.timedelta`) The default minimum interval between
+#: two crawls of a feed.  15 minutes.
+MIN_INTERVAL = datetime.timedelta(minutes=15)
+
+#: (:class:`datetime.timedelta`) The default maximum interval between
+#: two crawls of a feed.  A day.
+MAX_INTERVAL = datetime.timedelta(days=1)
+
+#: (:class:`datetime.timedelta`) The interval used when there's nothing
+#: to estimate the interval of a feed from.  An hour.
+DEFAULT_INTERVAL = datetime.timedelta(hours=1)
+
+#: (:class:`numbers.Real`) The factor to multiply the interval by when
+#: a feed turns out to be not modified or fails to be crawled.
+BACKOFF = 2
+
+
+# Crawler hints which affect scheduling, and whether their values are sets.
+_SCHEDULING_HINTS = {
+    'ttl': False,
+    'skipHours': True,
+    'skipDays': True,
+    'updatePeriod': False,
+    'updateFrequency': False
+}
+
+
+def _seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def _filter_hints(hints):
+    """Take only hints that affect scheduling, so that they can be kept
+    and serialized into JSON.
+
+    """
+    if not hints:
+        return
+    filtered = {}
+    for name, is_set in _SCHEDULING_HINTS.items():
+        value = hints.get(name)
+        if value:
+            filtered[name] = frozenset(value) if is_set else value
+    return filtered or None
+
+
+def _serialize_hints(hints):
+    if hints is None:
+        return
+    return dict((name, sorted(value) if _SCHEDULING_HINTS[name] else value)
+                for name, value in hints.items())
+
+
+def _check_aware(name, value):
+    if value is not None and value.tzinfo is None:
+        raise ValueError(name + ' must be timezone-aware, not ' +
+                         repr(value))
+
+
+def estimate_interval(entries, samples=10):
+    """Estimate the average interval between publishing of the ``entries``
+    from the recent ``samples`` of them.
+
+    :param entries: entries of a feed
+    :type entries: :class:`collections.Iterable`
+    :param samples: the number of the most recent entries to look at.
+                    10 by default
+    :type samples: :class:`numbers.Integral`
+    :returns: the estimated interval.  :const:`None` if there are less
+              than two entries to estimate from
+    :rtype: :class:`datetime.timedelta`
+
+    """
+    times = sorted(
+        (entry.published_at or entry.updated_at for entry in entries
+         if entry.published_at or entry.updated_at),
+        reverse=True
+    )[:samples]
+    if len(times) < 2 or times[0] == times[-1]:
+        return
+    return (times[0] - times[-1]) // (len(times) - 1)
+
+
+def get_hinted_interval(hints):
+    """Get the minimum interval that the publisher of a feed requests
+    from its crawler ``hints``: ``ttl`` or ``updatePeriod`` divided by
+    ``updateFrequency``.
+
+    :param hints: crawler hints.  it can be :const:`None`
+    :type hints: :class:`collections.Mapping`
+    :returns: the hinted interval.  :const:`None` if there's no hint
+    :rtype: :class:`datetime.timedelta`
+
+    """
+    if not hints:
+        return
+    intervals = []
+    if hints.get('ttl'):
+        intervals.append(datetime.timedelta(minutes=hints['ttl']))
+    if hints.get('updatePeriod') in UPDATE_PERIODS:
+        seconds = UPDATE_PERIODS[hints['updatePeriod']]
+        frequency = hints.get('updateFrequency') or 1
+        intervals.append(datetime.timedelta(seconds=seconds // frequency))
+    if intervals:
+        return max(intervals)
+
+
+def skip_hinted_times(when, hints):
+    """Postpone the ``when`` to the first time that neither ``skipHours``
+    nor ``skipDays`` of crawler ``hints`` excludes.  Both are interpreted
+    in GMT.
+
+    :param when: the time to postpone
+    :type when: :class:`datetime.datetime`
+    :param hints: crawler hints.  it can be :const:`None`
+    :type hints: :class:`collections.Mapping`
+    :returns: the postponed time.  it's the same to ``when`` if it isn't
+              excluded by hints
+    :rtype: :class:`datetime.datetime`
+
+    """
+    if not hints:
+        return when
+    skip_hours = hints.get('skipHours') or ()
+    skip_days = hints.get('skipDays') or ()
+    if not (skip_hours or skip_days):
+        return when
+    tzinfo = when.tzinfo
+    when = when.astimezone(utc)
+    # Give up if hints exclude every hour of the week.
+    for _ in range(7 * 24):
+        if when.hour not in skip_hours and \
+           WEEKDAYS[when.weekday()] not in skip_days:
+            break
+        when = when.replace(minute=0, second=0, microsecond=0) + \
+            datetime.timedelta(hours=1)
+    return when.astimezone(tzinfo)
+
+
+class FeedScheduler(object):
+    """Schedule when feeds should be crawled next.
+
+    After each crawl the interval to the next crawl is estimated as half
+    the observed interval between its entries (see
+    :func:`estimate_interval()`), but not shorter than what the publisher
+    hints (see :func:`get_hinted_interval()`).  When a feed is not modified
+    or fails to be crawled, the interval is multiplied by :const:`BACKOFF`
+    instead.  Intervals are bounded by ``min_interval`` and
+    ``max_interval``, and then the next crawl is postponed by
+    :func:`skip_hinted_times()`.  Hints of the last successful crawl are
+    kept, so that they are respected even while the feed is not modified
+    or fails to be crawled.
+
+    The schedule is kept in memory.  If ``repository`` and ``key`` are
+    given it's loaded from and :meth:`save()`\ d to the repository as well.
+
+    :param repository: the optional repository to persist the schedule
+    :type repository: :class:`~libearth.repository.Repository`
+    :param key: the key to store the schedule in the ``repository``
+    :type key: :class:`collections.Sequence`
+    :param min_interval: the minimum interval between two crawls of a feed.
+                         :const:`MIN_INTERVAL` by default
+    :type min_interval: :class:`datetime.timedelta`
+    :param max_interval: the maximum interval between two crawls of a feed.
+                         :const:`MAX_INTERVAL` by default
+    :type max_interval: :class:`datetime.timedelta`
+
+    """
+
+    #: (:class:`~libearth.repository.Repository`) The repository to persist
+    #: the schedule.  It might be :const:`None`.
+    repository = None
+
+    #: (:class:`collections.Sequence`) The key to store the schedule in
+    #: the :attr:`repository`.
+    key = None
+
+    def __init__(self, repository=None, key=None, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        if repository is not None:
+            if not isinstance(repository, Repository):
+                raise TypeError(
+                    'repository must be an instance of {0.__module__}.'
+                    '{0.__name__}, not {1!r}'.format(Repository, repository)
+                )
+            elif key is None:
+                raise TypeError('key is required when repository is given')
+        if min_interval > max_interval:
+            raise ValueError('min_interval cannot be greater than '
+                             'max_interval')
+        self.repository = repository
+        self.key = key
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lock = threading.Lock()
+        #: (:class:`collections.MutableMapping`) The mapping of feed urls
+        #: to triples of (next due time, current interval, the last crawler
+        #: hints which affect scheduling).
+        self.schedule = {}
+        if repository is not None:
+            try:
+                data = b''.join(repository.read(key))
+            except RepositoryKeyError:
+                pass
+            else:
+                codec = Rfc3339()
+                for row in json.loads(data.decode('utf-8')):
+                    url, due, interval = row[:3]
+                    self.schedule[url] = (
+                        codec.decode(due),
+                        datetime.timedelta(seconds=interval),
+                        _filter_hints(row[3] if len(row) > 3 else None)
+                    )
+
+    def add(self, feed_url, due=None):
+        """Add the ``feed_url`` to schedule.  If it's already scheduled
+        its due time is replaced.
+
+        :param feed_url: the feed url to add
+        :type feed_url: :class:`str`
+        :param due: when to crawl the feed first.  now if omitted
+        :type due: :class:`datetime.datetime`
+        :raises ValueError: when ``due`` is naive (not timezone-aware)
+
+        """
+        _check_aware('due', due)
+        with self.lock:
+            _, interval, hints = self.schedule.get(
+                feed_url, (None, DEFAULT_INTERVAL, None)
+            )
+            self.schedule[feed_url] = due or utcnow(), interval, hints
+
+    def remove(self, feed_url):
+        """Remove the ``feed_url`` from the schedule.
+
+        :param feed_url: the feed url to remove
+        :type feed_url: :class:`str`
+        :raises KeyError: when the ``feed_url`` is not scheduled
+
+        """
+        with self.lock:
+            del self.schedule[feed_url]
+
+    def get_next_due(self, feed_url):
+        """Get when the ``feed_url`` should be crawled next.
+
+        :param feed_url: the feed url
+        :type feed_url: :class:`str`
+        :returns: the next due time
+        :rtype: :class:`datetime.datetime`
+        :raises KeyError: when the ``feed_url`` is not scheduled
+
+        """
+        return self.schedule[feed_url][0]
+
+    def due_feeds(self, now=None):
+        """List feed urls which are due to be crawled.
+
+        :param now: the time to compare due times to.  the current time
+                    if omitted
+        :type now: :class:`datetime.datetime`
+        :returns: feed urls in the order of their due times
+        :rtype: :class:`collections.Sequence`
+
+        """
+        if now is None:
+            now = utcnow()
+        with self.lock:
+            due = [(due, url)
+                   for url, (due, _, _) in self.schedule.items()
+                   if due <= now]
+        due.sort()
+        return [url for _, url in due]
+
+    def update(self, result, crawled_at=None):
+        """Reschedule a feed by the crawl ``result``.
+
+        :param result: the crawl result or error of the feed
+        :type result: :class:`~libearth.crawler.CrawlResult`,
+                      :class:`~libearth.crawler.CrawlError`
+        :param crawled_at: when the feed was crawled.  now if omitted
+        :type crawled_at: :class:`datetime.datetime`
+        :returns: the next due time of the feed
+        :rtype: :class:`datetime.datetime`
+        :raises ValueError: when ``crawled_at`` is naive
+                            (not timezone-aware)
+
+        """
+        if isinstance(result, CrawlError):
+            feed_url = result.feed_uri
+        elif isinstance(result, CrawlResult):
+            feed_url = result.url
+        else:
+            raise TypeError(
+                'expected an instance of {0.__module__}.{0.__name__} or '
+                '{1.__module__}.{1.__name__}, not {2!r}'.format(
+                    CrawlResult, CrawlError, result
+                )
+            )
+        _check_aware('crawled_at', crawled_at)
+        crawled_at = crawled_at or utcnow()
+        with self.lock:
+            _, interval, hints = self.schedule.get(
+                feed_url, (None, DEFAULT_INTERVAL, None)
+            )
+            if isinstance(result, CrawlError) or result.not_modified:
+                # Hints of the last successful crawl are still respected.
+                interval = datetime.timedelta(
+                    seconds=_seconds(interval) * BACKOFF
+                )
+            else:
+                hints = _filter_hints(result.hints)
+                observed = estimate_interval(result.feed.entries)
+                interval = observed // 2 if observed else DEFAULT_INTERVAL
+            hinted = get_hinted_interval(hints)
+            if hinted is not None:
+                interval = max(interval, hinted)
+            interval = max(self.min_interval, min(self.max_interval, interval))
+            due = skip_hinted_times(crawled_at + interval, hints)
+            self.schedule[feed_url] = due, interval, hints
+        return due
+
+    def save(self):
+        """Write the schedule to the :attr:`repository`.
+
+        :raises TypeError: when there's no :attr:`repository` to save to
+
+        """
+        if self.repository is None:
+            raise TypeError('there is no repository to save the schedule to')
+        codec = Rfc3339()
+        with self.lock:
+            data = sorted(
+                [url, codec.encode(due), _seconds(interval),
+                 _serialize_hints(hints)]
+                for url, (due, interval, hints) in self.schedule.items()
+            )
+        self.repository.write(self.key, [json.dumps(data).encode('utf-8')])
+
+    def __len__(self):
+        return len(self.schedule)
+
+    def __contains__(self, feed_url):
+        return feed_url in self.schedule
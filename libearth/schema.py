@@ -985,6 +985,46 @@ class Element(object):
         raise TypeError('expected an instance of {0.__module__}.{0.__name__}, '
                         'not {1!r}'.format(cls, value))
 
+    def __reduce__(self):
+        """Elements can be pickled, e.g. to be sent to other processes.
+        They are unpickled by being constructed with the values of their
+        descriptors.  Hints of their children (e.g. lengths) are kept
+        as well.
+
+        .. versionadded:: 0.4.0
+
+        """
+        cls = type(self)
+        child_tags = inspect_child_tags(cls).values()
+        names = [name for name, _ in inspect_attributes(cls).values()]
+        names.extend(name for name, _ in child_tags)
+        content = inspect_content_tag(cls)
+        if content is not None:
+            names.append(content[0])
+        values = {}
+        for name in names:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            elif (isinstance(value, collections.Sequence) and
+                  not isinstance(value, (string_type, binary_type))):
+                value = list(value)
+            values[name] = value
+        # Descriptors are keyed by their attribute names, since descriptors
+        # themselves can't be pickled.
+        hints = dict((name, dict(self._hints[desc]))
+                     for name, desc in child_tags if desc in self._hints)
+        return _reconstruct_element, (cls, values, hints)
+
+
+def _reconstruct_element(cls, values, hints=None):
+    element = cls(**values)
+    if hints:
+        for name, desc in inspect_child_tags(cls).values():
+            if name in hints:
+                element._hints[desc] = hints[name]
+    return element
+
 
 class DocumentElement(Element):
     """The root element of the document.
@@ -24,6 +24,7 @@ processes, so *you have to use different session ids when there are multiple
 processes.*
 
 """
+import bisect
 import collections
 import contextlib
 import io
@@ -123,6 +124,18 @@ class BaseStage(object):
     #: when the transaction is committed, and stack information.
     transactions = None
 
+    #: (:class:`collections.MutableMapping`) Cached indices of
+    #: :class:`Directory` objects.  Keys are pairs of the directory key
+    #: (:class:`tuple`) and the format string of its children, and values
+    #: are pairs of the :meth:`Repository.stamp()
+    #: <libearth.repository.Repository.stamp>` token of the directory and
+    #: the sorted list of indices.  These are incrementally updated when
+    #: transactions are committed, and rebuilt when the stamp of
+    #: the directory has changed e.g. by other stages or processes.
+    #:
+    #: .. versionadded:: 0.4.0
+    directory_indices = None
+
     def __init__(self, session, repository):
         if not isinstance(session, Session):
             raise TypeError('session must be an instance of {0.__module__}.'
@@ -135,6 +148,7 @@ class BaseStage(object):
         self.session = session
         self.repository = repository
         self.transactions = {}
+        self.directory_indices = {}
         self.lock = threading.RLock()
 
     def __enter__(self):
@@ -159,7 +173,8 @@ class BaseStage(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         dirty_buffer = self.get_current_transaction(pop=True)
         if exc_type is None:
-            dirty_buffer.flush()
+            written_keys = dirty_buffer.flush()
+            self.update_directory_indices(written_keys)
         self.touch()
 
     def get_current_transaction(self, pop=False):
@@ -199,6 +214,89 @@ class BaseStage(object):
             return frozenset()
         return frozenset(Session(identifier=ident) for ident in identifiers)
 
+    def update_directory_indices(self, keys):
+        """Incrementally update cached :attr:`directory_indices` with
+        the given written ``keys``.
+
+        :param keys: the keys that were written to the :attr:`repository`
+        :type keys: :class:`collections.Iterable`
+
+        .. note::
+
+           This method is intended to be internal.
+
+        .. versionadded:: 0.4.0
+
+        """
+        with self.lock:
+            indices = self.directory_indices
+            if not indices:
+                return
+            for key in keys:
+                key = tuple(key)
+                for (dir_key, fmt), (_, index_list) in indices.items():
+                    size = len(dir_key)
+                    if len(key) <= size or key[:size] != dir_key:
+                        continue
+                    match = compile_format_to_pattern(fmt).match(key[size])
+                    if not match:
+                        continue
+                    index = match.group(1)
+                    i = bisect.bisect_left(index_list, index)
+                    if i >= len(index_list) or index_list[i] != index:
+                        index_list.insert(i, index)
+
+    def invalidate_directory_indices(self, key=None):
+        """Drop cached :attr:`directory_indices` related to the given
+        ``key``.  If ``key`` is omitted all cached indices are dropped.
+        It's useful when the :attr:`repository` is changed by other
+        stages or processes.
+
+        :param key: the key that was changed.  drop every cached index
+                    if it's omitted
+        :type key: :class:`collections.Sequence`
+
+        .. versionadded:: 0.4.0
+
+        """
+        with self.lock:
+            if key is None:
+                self.directory_indices.clear()
+                return
+            key = tuple(key)
+            for pair in list(self.directory_indices):
+                dir_key = pair[0]
+                size = min(len(dir_key), len(key))
+                if dir_key[:size] == key[:size]:
+                    del self.directory_indices[pair]
+
+    def apply_changes(self, keys):
+        """Update caches of the stage e.g. :attr:`directory_indices`
+        with the ``keys`` changed by other stages or processes.
+        Only caches related to the ``keys`` are invalidated.  Changed keys
+        can be found using :meth:`Repository.watch()
+        <libearth.repository.Repository.watch>`:
+
+        .. code-block:: python
+
+           with stage.repository.watch([]) as watcher:
+               for key in watcher:
+                   stage.apply_changes([key])
+
+        :param keys: the changed keys
+        :type keys: :class:`collections.Iterable`
+
+        .. versionadded:: 0.4.0
+
+        """
+        written_keys = []
+        for key in keys:
+            if self.repository.exists(key):
+                written_keys.append(key)
+            else:
+                self.invalidate_directory_indices(key)
+        self.update_directory_indices(written_keys)
+
     def touch(self):
         """Touch the latest staged time of the current :attr:`session`
         into the :attr:`repository`.
@@ -218,7 +316,7 @@ class BaseStage(object):
 
     def read(self, document_type, key):
         """Read a document of ``document_type`` by the given ``key``
-        in the staged :attr:`repository`.
+        in the staged :attr:`repository`.  See also :meth:`read_many()`.
 
         :param document_type:
             the type of document to read. it has to be a subclass of
@@ -237,9 +335,46 @@ class BaseStage(object):
            rather than this.  See also :class:`Route`.
 
         """
+        self._check_document_type(document_type)
+        repository = self.get_current_transaction()
+        return self._load_document(document_type, key, repository.read(key))
+
+    def read_many(self, document_type, keys):
+        """Read several documents of ``document_type`` by the given ``keys``
+        at once in the staged :attr:`repository`.  Documents are read
+        through :meth:`Repository.read_many()
+        <libearth.repository.Repository.read_many>`.
+
+        :param document_type:
+            the type of documents to read. it has to be a subclass of
+            :class:`~libearth.session.MergeableDocumentElement`
+        :type document_type: :class:`type`
+        :param keys: the keys to find documents in the :attr:`repository`
+        :type keys: :class:`collections.Iterable`
+        :returns: the list of found document instances in the same order
+                  to the ``keys``
+        :rtype: :class:`collections.Sequence`
+        :raises libearth.repository.RepositoryKeyError: when any of keys
+                                                        cannot be found
+
+        .. note::
+
+           This method is intended to be internal.  Use routed properties
+           rather than this.  See also :class:`Route`.
+
+        .. versionadded:: 0.4.0
+
+        """
+        self._check_document_type(document_type)
+        keys = list(keys)
+        repository = self.get_current_transaction()
+        return [self._load_document(document_type, key, chunks)
+                for key, chunks in zip(keys, repository.read_many(keys))]
+
+    def _check_document_type(self, document_type):
         if not isinstance(document_type, type):
             raise TypeError('document_type must be a type object, '
-                            'not {1!r}'.format(document_type))
+                            'not {0!r}'.format(document_type))
         elif not issubclass(document_type, MergeableDocumentElement):
             raise TypeError(
                 'document_type must be a subtype of {0.__module__}.'
@@ -248,16 +383,74 @@ class BaseStage(object):
                     document_type
                 )
             )
-        repository = self.get_current_transaction()
-        chunks = repository.read(key)
+
+    def _load_document(self, document_type, key, chunks):
         document = read(document_type, chunks)
         assert isinstance(document, MergeableDocumentElement)
         not_stamped = document.__revision__ is None
         if not_stamped:
-            return self.write(key, document, merge=False)
+            document = self.write(key, document, merge=False)
         return document
 
     def read_merged_document(self, document_type, key_spec, key):
+        keys = self.find_document_keys(key_spec, key)
+        docs = self.read_many(document_type, [k for _, k in keys])
+        return self.merge_documents(
+            [(session_id, doc, k) for (session_id, k), doc in zip(keys, docs)],
+            key_spec, key
+        )
+
+    def read_merged_documents(self, document_type, key_spec, keys):
+        """Read merged documents of several ``keys`` at once.  Every session
+        document of them is read through a single :meth:`read_many()` call.
+
+        :param document_type:
+            the type of documents to read. it has to be a subclass of
+            :class:`~libearth.session.MergeableDocumentElement`
+        :type document_type: :class:`type`
+        :param key_spec: the same to :attr:`Route.key_spec` value
+        :type key_spec: :class:`collections.Sequence`
+        :param keys: the keys of directories that contain session documents
+        :type keys: :class:`collections.Sequence`
+        :returns: the list of merged documents in the same order to
+                  the ``keys``.  it might contain :const:`None` for keys
+                  that have no documents
+        :rtype: :class:`collections.Sequence`
+
+        .. note::
+
+           This method is intended to be internal.  Use routed properties
+           rather than this.  See also :class:`Route`.
+
+        .. versionadded:: 0.4.0
+
+        """
+        key_lists = [self.find_document_keys(key_spec, key) for key in keys]
+        docs = iter(self.read_many(
+            document_type,
+            [k for doc_keys in key_lists for _, k in doc_keys]
+        ))
+        return [
+            self.merge_documents(
+                [(session_id, next(docs), k) for session_id, k in doc_keys],
+                key_spec, key
+            )
+            for key, doc_keys in zip(keys, key_lists)
+        ]
+
+    def find_document_keys(self, key_spec, key):
+        """Find keys of session documents in the directory of the ``key``.
+
+        :returns: the list of pairs of (session identifier, key)
+        :rtype: :class:`collections.Sequence`
+
+        .. note::
+
+           This method is intended to be internal.
+
+        .. versionadded:: 0.4.0
+
+        """
         # FIXME: remove assumption that it always takes Session.identifier
         complete_size = len(key)
         pattern = compile_format_to_pattern(key_spec[complete_size])
@@ -267,14 +460,31 @@ class BaseStage(object):
             except IndexError:
                 raise  # FIXME: should return Directory instead
         repository = self.get_current_transaction()
-        docs = []
+        keys = []
         for subkey in repository.list(key):
             match = pattern.match(subkey)
             if match:
                 k = key + [subkey] + key_spec[complete_size + 1:]
-                doc = self.read(document_type, k)
-                triple = match.group(1), doc, k
-                docs.append(triple)
+                keys.append((match.group(1), k))
+        return keys
+
+    def merge_documents(self, docs, key_spec, key):
+        """Merge documents of several sessions into one.
+
+        :param docs: the list of triples of (session identifier,
+                     document, key)
+        :type docs: :class:`collections.Sequence`
+        :returns: the merged document.  :const:`None` if ``docs`` is empty
+        :rtype: :class:`~libearth.session.MergeableDocumentElement`
+
+        .. note::
+
+           This method is intended to be internal.
+
+        .. versionadded:: 0.4.0
+
+        """
+        complete_size = len(key)
         session = self.session
         if len(docs) == 1:
             _, doc, __ = docs[0]
@@ -392,6 +602,33 @@ class DirtyBuffer(Repository):
                     return self.repository.read(key)
         return d[1],
 
+    def read_many(self, keys):
+        super(DirtyBuffer, self).read_many(keys)
+        keys = list(keys)
+        values = [None] * len(keys)
+        missed = []
+        for i, key in enumerate(keys):
+            super(DirtyBuffer, self).read(key)
+            d = self.dictionary
+            for k in key:
+                if not isinstance(d, dict):
+                    raise RepositoryKeyError(key)
+                try:
+                    d = d[k]
+                except KeyError:
+                    missed.append(i)
+                    break
+            else:
+                values[i] = d[1],
+        if missed:
+            with self.lock:
+                chunks_list = self.repository.read_many(
+                    [keys[i] for i in missed]
+                )
+            for i, chunks in zip(missed, chunks_list):
+                values[i] = chunks
+        return values
+
     def write(self, key, iterable, _type_hint=None):
         super(DirtyBuffer, self).write(key, iterable)
         d = self.dictionary
@@ -423,6 +660,29 @@ class DirtyBuffer(Repository):
                     return self.repository.exists(key)
         return True
 
+    def exists_many(self, keys):
+        super(DirtyBuffer, self).exists_many(keys)
+        keys = list(keys)
+        result = [True] * len(keys)
+        missed = []
+        for i, key in enumerate(keys):
+            super(DirtyBuffer, self).exists(key)
+            d = self.dictionary
+            for k in key:
+                if not isinstance(d, dict):
+                    raise RepositoryKeyError(key)
+                try:
+                    d = d[k]
+                except KeyError:
+                    missed.append(i)
+                    break
+        if missed:
+            with self.lock:
+                found = self.repository.exists_many([keys[i] for i in missed])
+            for i, exists in zip(missed, found):
+                result[i] = exists
+        return result
+
     def list(self, key):
         super(DirtyBuffer, self).list(key)
         d = self.dictionary
@@ -443,48 +703,88 @@ class DirtyBuffer(Repository):
             return d
         return frozenset(d).union(src)
 
-    def flush(self, _dictionary=None, _key=None):
-        """Flush all buffered updates to the :attr:`repository`."""
-        with self.lock if _dictionary is None else self.dump_context():
-            if _dictionary is None:
-                _dictionary = self.dictionary
-                _key = ()
-            items = getattr(_dictionary, 'iteritems', _dictionary.items)()
-            read_from_repository = self.repository.read
-            write_to_repository = self.repository.write
-            for key, value in items:
-                key = _key + (key,)
-                if isinstance(value, dict):
-                    self.flush(_dictionary=value, _key=key)
+    def flush(self):
+        """Flush all buffered updates to the :attr:`repository`.
+        Updates are written at once through
+        :meth:`Repository.write_many()
+        <libearth.repository.Repository.write_many>`.
+
+        :returns: the list of flushed keys
+        :rtype: :class:`collections.Sequence`
+
+        .. versionchanged:: 0.4.0
+           It became to return the list of flushed keys, and to write
+           all updates at once.  Keys to be written are locked through
+           :meth:`Repository.lock_keys()
+           <libearth.repository.Repository.lock_keys>` while they are
+           merged and written, so that several processes can share
+           the same repository.
+
+        """
+        with self.lock:
+            keys = list(self._iterate_keys(self.dictionary, ()))
+            with self.repository.lock_keys(keys):
+                pairs = list(self._merge_items(self.dictionary, ()))
+                self.repository.write_many(pairs)
+            self.dictionary.clear()
+        return [key for key, _ in pairs]
+
+    def _iterate_keys(self, dictionary, parent_key):
+        for key, value in dictionary.items():
+            key = parent_key + (key,)
+            if isinstance(value, dict):
+                for subkey in self._iterate_keys(value, key):
+                    yield subkey
+            else:
+                yield key
+
+    def _merge_items(self, dictionary, parent_key):
+        items = getattr(dictionary, 'iteritems', dictionary.items)()
+        read_from_repository = self.repository.read
+        for key, value in items:
+            key = parent_key + (key,)
+            if isinstance(value, dict):
+                with self.dump_context():
+                    for pair in self._merge_items(value, key):
+                        yield pair
+                continue
+            type_hint, bytearray = value
+            bytearray = bytearray,
+            if type_hint is not None:
+                try:
+                    prev_iterable = read_from_repository(key)
+                except RepositoryKeyError:
+                    pass
                 else:
-                    type_hint, bytearray = value
-                    bytearray = bytearray,
-                    if type_hint is not None:
-                        try:
-                            prev_iterable = read_from_repository(key)
-                        except RepositoryKeyError:
+                    # Only the head of the previous document is read
+                    # unless it has to be merged.
+                    iterator = iter(prev_iterable)
+                    prev_iterable = []
+                    prev = parse_revision(
+                        _copy_chunks(iterator, prev_iterable)
+                    )
+                    crev = parse_revision(bytearray)
+                    if prev is not None and \
+                        (crev is None or crev[0] is None or
+                         not crev[1].contains(prev[0])):
+                        for _ in _copy_chunks(iterator, prev_iterable):
                             pass
-                        else:
-                            prev_iterable = list(prev_iterable)
-                            prev = parse_revision(prev_iterable)
-                            crev = parse_revision(bytearray)
-                            if prev is not None and \
-                                (crev is None or crev[0] is None or
-                                 not crev[1].contains(prev[0])):
-                                prev_doc = read(type_hint, prev_iterable)
-                                doc = read(type_hint, bytearray)
-                                merged_doc = prev[0].session.merge(
-                                    doc,
-                                    prev_doc,
-                                    force=True
-                                )
-                                bytearray = write(
-                                    merged_doc,
-                                    canonical_order=True,
-                                    as_bytes=True
-                                )
-                    write_to_repository(key, bytearray)
-            _dictionary.clear()
+                        prev_doc = read(type_hint, prev_iterable)
+                        doc = read(type_hint, bytearray)
+                        merged_doc = prev[0].session.merge(
+                            doc,
+                            prev_doc,
+                            force=True
+                        )
+                        bytearray = write(
+                            merged_doc,
+                            canonical_order=True,
+                            as_bytes=True
+                        )
+                    close = getattr(iterator, 'close', None)
+                    if close is not None:
+                        close()
+            yield key, bytearray
 
     @contextlib.contextmanager
     def dump_context(self):
@@ -495,6 +795,21 @@ class DirtyBuffer(Repository):
                                                            self.repository)
 
 
+def _copy_chunks(iterator, chunks):
+    """Yield chunks of the ``iterator`` while appending their copies to
+    the ``chunks`` list, since chunks could be slices of a reused buffer.
+
+    """
+    while True:
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        chunk = bytes(chunk)
+        chunks.append(chunk)
+        yield chunk
+
+
 class TransactionError(RuntimeError):
     """The error that rises if there's no ongoing transaction while it's
     needed to update the stage, or if there's already begun ongoing transaction
@@ -576,6 +891,13 @@ class Route(object):
     #: might contain some format strings.
     key_spec = None
 
+    #: (:class:`tuple`) The precompiled regular expression patterns of
+    #: each :attr:`key_spec` part.  See also
+    #: :func:`compile_format_to_pattern()`.
+    #:
+    #: .. versionadded:: 0.4.0
+    key_patterns = None
+
     def __init__(self, document_type, key_spec):
         if not isinstance(document_type, type):
             raise TypeError('document_type must be a type object, '
@@ -593,6 +915,8 @@ class Route(object):
                             repr(key_spec))
         self.document_type = document_type
         self.key_spec = key_spec
+        self.key_patterns = tuple(compile_format_to_pattern(fmt)
+                                  for fmt in key_spec)
 
     def __get__(self, obj, cls=None):
         if obj is None or isinstance(obj, type):
@@ -605,7 +929,7 @@ class Route(object):
                 chunk = fmt.format(session=obj.session)
             except IndexError:
                 return Directory(obj, self.document_type,
-                                 self.key_spec, (), key)
+                                 self.key_spec, (), key, self.key_patterns)
             try:
                 fmt.format()
             except KeyError:
@@ -628,12 +952,22 @@ def compile_format_to_pattern(format_string):
     For example, ``'string{0}like{1}this{{2}}'`` will be compiled to
     ``/^string(.*?)like(.*?)this\{2\}$/``.
 
+    Compiled patterns are cached, so it's cheap to call this function
+    several times with the same ``format_string``.
+
     :param format_string: format string to compile
     :type format_string: :class:`str`
     :returns: compiled pattern object
     :rtype: :class:`re.RegexObject`
 
+    .. versionchanged:: 0.4.0
+       Compiled patterns became cached.
+
     """
+    try:
+        return _compiled_patterns[format_string]
+    except KeyError:
+        pass
     pattern = ['^']
     i = 0
     for match in re.finditer(r'(^|[^{])\{[^}]+\}|(\{\{)|(\}\})', format_string):
@@ -652,7 +986,12 @@ def compile_format_to_pattern(format_string):
     if len(format_string) > i:
         pattern.append(re.escape(format_string[i:]))
     pattern.append('$')
-    return re.compile(''.join(pattern))
+    compiled = re.compile(''.join(pattern))
+    _compiled_patterns[format_string] = compiled
+    return compiled
+
+
+_compiled_patterns = {}
 
 
 class Directory(collections.Mapping):
@@ -668,15 +1007,30 @@ class Directory(collections.Mapping):
     :type indices: :class:`collections.Sequence`
     :param key: the upper key that are already completed
     :type key: :class:`collections.Sequence`
+    :param key_patterns: the same to :attr:`Route.key_patterns` value.
+                         compiled from ``key_spec`` if omitted
+    :type key_patterns: :class:`collections.Sequence`
+
+    Its indices are cached in the :attr:`BaseStage.directory_indices`
+    so that :func:`len()` and :meth:`paginate()` don't have to list
+    the repository every time.  The cache is validated against
+    :meth:`Repository.stamp() <libearth.repository.Repository.stamp>`
+    of the directory, so keys written by other stages or processes
+    are listed as well.  Iterating it yields indices in
+    sorted order.
 
     .. note::
 
        The constructor is intended to be internal, so don't instantiate
        it directory.  Use :class:`Route` instead.
 
+    .. versionchanged:: 0.4.0
+       Indices became cached and sorted.
+
     """
 
-    def __init__(self, stage, document_type, key_spec, indices, key):
+    def __init__(self, stage, document_type, key_spec, indices, key,
+                 key_patterns=None):
         if not isinstance(stage, BaseStage):
             raise TypeError('stage must be an instance of {0.__module__}.'
                             '{0.__name__}, not {1!r}'.format(BaseStage, stage))
@@ -700,34 +1054,49 @@ class Directory(collections.Mapping):
             raise TypeError('key must be a sequence, not ' + repr(key))
         elif len(key) >= len(key_spec):
             raise ValueError('key seems already complete')
+        if key_patterns is None:
+            key_patterns = tuple(compile_format_to_pattern(fmt)
+                                 for fmt in key_spec)
         self.stage = stage
         self.document_type = document_type
         self.key_spec = key_spec
+        self.key_patterns = key_patterns
         self.indices = tuple(indices)
         self.key = key
 
     def __len__(self):
-        return sum(1 for _ in self)
+        return len(self.get_indices())
 
-    def __getitem__(self, index):
+    def _get_key(self, index):
+        """Get the key of the given ``index``.  It returns a triple of
+        the key, indices, and whether the key refers a subdirectory.
+
+        """
         key = list(self.key)
         indices = self.indices + (index,)
-        stage = self.stage
-        session = stage.session
+        session = self.stage.session
         for fmt in self.key_spec[len(key):]:
             try:
                 chunk = fmt.format(*indices, session=session)
             except IndexError:
-                if stage.repository.exists(key):
-                    return Directory(stage, self.document_type,
-                                     self.key_spec, indices, key)
-                raise KeyError(index)
+                return key, indices, True
             try:
                 fmt.format(*indices)
             except KeyError:
                 break
             else:
                 key.append(chunk)
+        return key, indices, False
+
+    def __getitem__(self, index):
+        key, indices, is_directory = self._get_key(index)
+        stage = self.stage
+        if is_directory:
+            if stage.repository.exists(key):
+                return Directory(stage, self.document_type,
+                                 self.key_spec, indices, key,
+                                 self.key_patterns)
+            raise KeyError(index)
         try:
             doc = stage.read_merged_document(self.document_type,
                                              self.key_spec,
@@ -738,6 +1107,45 @@ class Directory(collections.Mapping):
             return doc
         raise KeyError(index)
 
+    def get_many(self, indices):
+        """Get documents of several ``indices`` at once.  Unlike getting
+        them one by one using subscription operator, session documents of
+        all ``indices`` are read through a single
+        :meth:`Repository.read_many()
+        <libearth.repository.Repository.read_many>` call.
+
+        :param indices: the indices to get
+        :type indices: :class:`collections.Iterable`
+        :returns: the mapping of found indices to their documents
+                  (or subdirectories).  indices that cannot be found
+                  are missing from the mapping
+        :rtype: :class:`collections.Mapping`
+
+        .. versionadded:: 0.4.0
+
+        """
+        stage = self.stage
+        result = {}
+        keys = []
+        for index in indices:
+            key, _, is_directory = self._get_key(index)
+            if is_directory:
+                try:
+                    result[index] = self[index]
+                except KeyError:
+                    pass
+            else:
+                keys.append((index, key))
+        repository = stage.get_current_transaction()
+        found = repository.exists_many([key for _, key in keys])
+        keys = [pair for pair, exists in zip(keys, found) if exists]
+        docs = stage.read_merged_documents(self.document_type, self.key_spec,
+                                           [key for _, key in keys])
+        for (index, _), doc in zip(keys, docs):
+            if doc:
+                result[index] = doc
+        return result
+
     def __setitem__(self, index, doc):
         indices = self.indices + (index,)
         session = self.stage.session
@@ -749,16 +1157,70 @@ class Directory(collections.Mapping):
         self.stage.write(key, doc)
 
     def __iter__(self):
-        it = self.stage.repository.list(self.key)
-        pattern = compile_format_to_pattern(self.key_spec[len(self.key)])
-        indices = set()
-        for key in it:
-            match = pattern.match(key)
-            if match:
-                index = match.group(1)
-                if index not in indices:
-                    yield index
-                    indices.add(index)
+        return iter(self.get_indices()[:])
+
+    def get_indices(self):
+        """Get the sorted list of its indices.  The list is cached in
+        the :attr:`BaseStage.directory_indices`, and the repository is
+        listed only when it's not cached yet or the :meth:`Repository.stamp()
+        <libearth.repository.Repository.stamp>` of the directory has
+        changed since.
+
+        .. note::
+
+           The returned list is shared with the cache, so don't mutate it.
+
+        :returns: the sorted list of indices
+        :rtype: :class:`collections.Sequence`
+
+        .. versionadded:: 0.4.0
+
+        """
+        stage = self.stage
+        size = len(self.key)
+        cache_key = tuple(self.key), self.key_spec[size]
+        stamp = stage.repository.stamp(self.key)
+        with stage.lock:
+            try:
+                cached_stamp, index_list = stage.directory_indices[cache_key]
+            except KeyError:
+                pass
+            else:
+                if stamp is not None and stamp == cached_stamp:
+                    return index_list
+            pattern = self.key_patterns[size]
+            indices = set()
+            for key in stage.repository.list(self.key):
+                match = pattern.match(key)
+                if match:
+                    indices.add(match.group(1))
+            index_list = sorted(indices)
+            stage.directory_indices[cache_key] = stamp, index_list
+            return index_list
+
+    def paginate(self, offset=0, limit=None):
+        """Get the slice of sorted indices without listing the whole
+        repository every time.
+
+        :param offset: the number of indices to skip.  0 by default
+        :type offset: :class:`numbers.Integral`
+        :param limit: the maximum number of indices to return.
+                      no limit if omitted
+        :type limit: :class:`numbers.Integral`
+        :returns: the sorted list of indices
+        :rtype: :class:`collections.Sequence`
+
+        .. versionadded:: 0.4.0
+
+        """
+        if offset < 0:
+            raise ValueError('offset cannot be negative')
+        elif limit is not None and limit < 0:
+            raise ValueError('limit cannot be negative')
+        indices = self.get_indices()
+        if limit is None:
+            return indices[offset:]
+        return indices[offset:offset + limit]
 
     def __repr__(self):
         return '<{0.__module__}.{0.__name__} {1!r}>'.format(
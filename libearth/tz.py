@@ -73,6 +73,11 @@ class FixedOffset(datetime.tzinfo):
     def tzname(self, dt):
         return self.name
 
+    def __getinitargs__(self):
+        # Used by datetime.tzinfo.__reduce__() for pickling.
+        minutes = self.offset.days * 24 * 60 + self.offset.seconds // 60
+        return minutes, self.name
+
     def __repr__(self):
         cls = type(self)
         return '<{0.__module__}.{0.__name__} {1}>'.format(cls, self.name)
@@ -37,7 +37,10 @@ setup(
     packages=find_packages(exclude=['tests']),
     entry_points='''
         [libearth.repositories]
+        dedup = libearth.repositories.dedup:DedupRepository
         file = libearth.repository:FileSystemRepository
+        pack = libearth.repositories.pack:PackRepository
+        sqlite = libearth.repositories.sqlite:SQLiteRepository
     ''',
     install_requires=install_requires,
     tests_require=['pytest >= 2.4.0'],
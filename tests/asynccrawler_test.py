@@ -0,0 +1,248 @@
+import sys
+import threading
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from pytest import fixture, mark
+
+from libearth.crawler import (CrawlError, CrawlResult, FaviconCache,
+                              ValidatorCache)
+
+from .crawler_test import atom_xml, gzip_compress
+
+if sys.version_info >= (3, 4):
+    import asyncio
+    from libearth.asynccrawler import ConnectionPool, crawl_async, fetch
+
+
+pytestmark = mark.skipif('sys.version_info < (3, 4)',
+                         reason='asyncio is available since Python 3.4')
+
+
+local_atom_xml = b'''
+<feed xmlns="http://www.w3.org/2005/Atom">
+    <title type="text">Local Test</title>
+    <id>urn:local</id>
+    <updated>2013-08-19T07:49:20+07:00</updated>
+    <link type="text/html" rel="alternate" href="/index.html" />
+    <entry>
+        <title>Entry</title>
+        <id>urn:local:1</id>
+        <updated>2013-08-19T07:49:20+07:00</updated>
+    </entry>
+</feed>
+'''
+
+local_html = b'''<html><head>
+<link rel="icon" href="/images/icon.png">
+</head></html>'''
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    routes = {
+        '/atom.xml': (200, 'application/atom+xml', atom_xml),
+        '/local.xml': (200, 'application/atom+xml', local_atom_xml),
+        '/index.html': (200, 'text/html; charset=utf-8', local_html),
+        '/broken.xml': (200, 'text/xml', b'<broken'),
+    }
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, self.headers))
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/atom.xml')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        elif self.path == '/chunked.xml':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/atom+xml')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.write_chunked(atom_xml)
+            return
+        elif self.path == '/gzip.xml':
+            assert 'gzip' in self.headers['Accept-Encoding']
+            body = gzip_compress(atom_xml)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/atom+xml')
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.write_chunked(body)
+            return
+        elif self.path == '/conditional.xml':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/atom+xml')
+            self.send_header('Content-Length', str(len(atom_xml)))
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            self.wfile.write(atom_xml)
+            return
+        try:
+            status, content_type, body = self.routes[self.path]
+        except KeyError:
+            status, content_type, body = 404, 'text/plain', b'not found'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def write_chunked(self, body):
+        for offset in range(0, len(body), 100):
+            chunk = body[offset:offset + 100]
+            self.wfile.write('{0:x}\r\n'.format(len(chunk)).encode())
+            self.wfile.write(chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def fx_server(request):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    server.connections = 0
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def finalize():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(finalize)
+    server.url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    return server
+
+
+@fixture
+def fx_loop(request):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    request.addfinalizer(loop.close)
+    return loop
+
+
+def test_crawl_async(fx_server, fx_loop):
+    urls = [fx_server.url + path
+            for path in ['/atom.xml', '/local.xml', '/chunked.xml',
+                         '/redirect', '/broken.xml', '/nonexistent.xml']]
+    results = fx_loop.run_until_complete(crawl_async(urls, concurrency=2))
+    assert [type(result) for result in results] == [
+        CrawlResult, CrawlResult, CrawlResult, CrawlResult,
+        CrawlError, CrawlError
+    ]
+    assert results[0].url == urls[0]
+    assert results[0].feed.title.value == 'Atom Test'
+    assert results[0].icon_url == 'http://vio.atomtest.com/favicon.ico'
+    entries = results[0].feed.entries
+    assert entries[0].updated_at > entries[1].updated_at
+    assert results[1].feed.title.value == 'Local Test'
+    assert results[1].icon_url == fx_server.url + '/images/icon.png'
+    assert results[2].feed.title.value == 'Atom Test'
+    assert results[3].feed.title.value == 'Atom Test'
+    assert results[4].feed_uri == urls[4]
+    assert results[5].feed_uri == urls[5]
+    # Connections are kept alive and reused.
+    assert len(fx_server.requests) == 8
+    assert fx_server.connections <= 2
+
+
+def test_fetch_reconnect(fx_server, fx_loop):
+    pool = ConnectionPool()
+    url = fx_server.url + '/atom.xml'
+    first = fx_loop.run_until_complete(fetch(pool, url))
+    # Simulate the server closing the idle connection.
+    for connections in pool.idle.values():
+        for reader, writer in connections:
+            writer.transport.abort()
+    second = fx_loop.run_until_complete(fetch(pool, url))
+    pool.close()
+    assert first.body == second.body == atom_xml
+    assert pool.connections == 2
+
+
+def test_fetch_head(fx_server, fx_loop):
+    pool = ConnectionPool()
+    response = fx_loop.run_until_complete(
+        fetch(pool, fx_server.url + '/index.html', method='HEAD',
+              headers={'X-Test': 'yes'})
+    )
+    pool.close()
+    assert response.status == 200
+    assert response.body == b''
+    assert response.headers['content-type'] == 'text/html; charset=utf-8'
+    method, path, headers = fx_server.requests[0]
+    assert method == 'HEAD'
+    assert headers['X-Test'] == 'yes'
+    assert headers['User-Agent'].startswith('libearth/')
+
+
+def test_crawl_async_not_modified(fx_server, fx_loop):
+    urls = [fx_server.url + '/conditional.xml', fx_server.url + '/atom.xml']
+    validators = ValidatorCache()
+    first = fx_loop.run_until_complete(
+        crawl_async(urls, validators=validators)
+    )
+    assert [r.not_modified for r in first] == [False, False]
+    assert validators.get(urls[0]) == ('"v1"', None)
+    assert urls[1] not in validators
+    second = fx_loop.run_until_complete(
+        crawl_async(urls, validators=validators)
+    )
+    assert [r.not_modified for r in second] == [True, False]
+    assert second[0].feed is None
+    conditional_headers = [headers
+                           for _, path, headers in fx_server.requests
+                           if path == '/conditional.xml']
+    assert conditional_headers[-1]['If-None-Match'] == '"v1"'
+
+
+def test_fetch_compressed(fx_server, fx_loop):
+    pool = ConnectionPool()
+    response = fx_loop.run_until_complete(
+        fetch(pool, fx_server.url + '/gzip.xml')
+    )
+    pool.close()
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.body == atom_xml
+
+
+def test_crawl_async_favicon_cache(fx_server, fx_loop):
+    urls = [fx_server.url + '/local.xml']
+    favicons = FaviconCache()
+    results = fx_loop.run_until_complete(
+        crawl_async(urls, favicons=favicons)
+    )
+    assert results[0].icon_url is None
+    favicons.wait()
+    results = fx_loop.run_until_complete(
+        crawl_async(urls, favicons=favicons)
+    )
+    assert results[0].icon_url == fx_server.url + '/images/icon.png'
+    assert [path for _, path, _ in fx_server.requests].count('/index.html') == 1
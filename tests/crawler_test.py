@@ -1,24 +1,40 @@
 import datetime
 import functools
+import hashlib
 try:
     import httplib
 except ImportError:
     from http import client as httplib
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = ThreadPoolExecutor = None
+import gzip
 import io
 import os.path
+import threading
 import time
 try:
     import urllib2
 except ImportError:
     from urllib import request as urllib2
+import zlib
 
 from pytest import fixture, mark, raises
 
 from libearth.compat import IRON_PYTHON, text_type
-from libearth.crawler import CrawlError, CrawlResult, crawl, get_feed
-from libearth.feed import Feed, Link, Text
-from libearth.subscribe import Category, SubscriptionList
-from libearth.tz import utc
+from libearth.crawler import (CrawlError, CrawlReport, CrawlResult,
+                              CrawlStream, Decompressor, FaviconCache,
+                              HostScheduler, ValidatorCache, crawl, crawl_into,
+                              crawl_pipelined, crawl_stream, get_feed,
+                              parse_feed)
+from libearth.feed import Feed, Link, Mark, Text
+from libearth.repository import FileSystemRepository
+from libearth.schema import write
+from libearth.session import Session
+from libearth.stage import Stage
+from libearth.subscribe import Category, Subscription, SubscriptionList
+from libearth.tz import now, utc
 
 
 atom_xml = b"""
@@ -216,18 +232,68 @@ mock_urls = {
     'http://nofavicontest.com/': (200, 'text/html',
                                   no_favicon_test_website_xml),
     'http://nofavicontest.com/favicon.ico': (404, 'text/plain', ''),
-    'http://brokenrss.com/rss': (200, 'application/rss+xml', broken_rss)
+    'http://brokenrss.com/rss': (200, 'application/rss+xml', broken_rss),
+    'http://conditionaltest.com/atom.xml': (200, 'application/atom+xml',
+                                            atom_xml),
+    'http://truncatedtest.com/atom.xml': (200, 'application/atom+xml',
+                                          atom_xml[:len(atom_xml) // 2])
+}
+
+
+def gzip_compress(data):
+    buffer_ = io.BytesIO()
+    f = gzip.GzipFile(fileobj=buffer_, mode='wb')
+    f.write(data)
+    f.close()
+    return buffer_.getvalue()
+
+
+def raw_deflate_compress(data):
+    compressobj = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressobj.compress(data) + compressobj.flush()
+
+
+compressed_urls = {
+    'http://gziptest.com/atom.xml': ('gzip', gzip_compress(atom_xml)),
+    'http://deflatetest.com/atom.xml': ('deflate', zlib.compress(atom_xml)),
+    'http://rawdeflatetest.com/atom.xml': ('deflate',
+                                           raw_deflate_compress(atom_xml)),
+}
+
+
+conditional_urls = {
+    'http://conditionaltest.com/atom.xml': (
+        '"v1"', 'Mon, 19 Aug 2013 07:49:20 GMT'
+    ),
+    'http://truncatedtest.com/atom.xml': ('"v1"', None)
 }
 
 
+requested_urls = []
+
+
 class TestHTTPHandler(urllib2.HTTPHandler):
 
     def http_open(self, req):
         url = req.get_full_url()
-        try:
-            status_code, mimetype, content = mock_urls[url]
-        except KeyError:
-            return urllib2.HTTPHandler.http_open(self, req)
+        requested_urls.append(url)
+        headers = {}
+        if url in compressed_urls:
+            assert 'gzip' in req.get_header('Accept-encoding')
+            encoding, content = compressed_urls[url]
+            status_code, mimetype = 200, 'application/atom+xml'
+            headers['content-encoding'] = encoding
+        else:
+            try:
+                status_code, mimetype, content = mock_urls[url]
+            except KeyError:
+                return urllib2.HTTPHandler.http_open(self, req)
+        headers['content-type'] = mimetype
+        if url in conditional_urls:
+            etag, last_modified = conditional_urls[url]
+            if req.get_header('If-none-match') == etag:
+                status_code, content = 304, b''
+            headers.update({'etag': etag, 'last-modified': last_modified})
         if IRON_PYTHON:
             from StringIO import StringIO
             buffer_ = StringIO(content)
@@ -235,7 +301,7 @@ class TestHTTPHandler(urllib2.HTTPHandler):
             buffer_ = io.StringIO(content)
         else:
             buffer_ = io.BytesIO(content)
-        resp = urllib2.addinfourl(buffer_, {'content-type': mimetype}, url)
+        resp = urllib2.addinfourl(buffer_, headers, url)
         resp.code = status_code
         resp.msg = httplib.responses[status_code]
         return resp
@@ -248,6 +314,7 @@ def fx_opener(request):
     )
     opener = urllib2.build_opener(TestHTTPHandler)
     urllib2.install_opener(opener)
+    del requested_urls[:]
     return opener
 
 
@@ -326,6 +393,509 @@ def test_crawl_error(fx_opener):
             raise
 
 
+def test_crawl_stream(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://brokenrss.com/rss',
+             'http://not-exists.com/rss']
+    called = []
+    stream = crawl_stream(feeds, 2, callback=called.append)
+    assert isinstance(stream, CrawlStream)
+    assert len(stream) == 4
+    results = list(stream)
+    assert len(results) == 4
+    assert set(map(id, results)) == set(map(id, called))
+    errors = dict((r.feed_uri, r) for r in results
+                  if isinstance(r, CrawlError))
+    assert sorted(errors) == sorted(feeds[2:])
+    parsed = dict((r.url, r.feed) for r in results
+                  if isinstance(r, CrawlResult))
+    assert parsed['http://vio.atomtest.com/feed/atom'].title.value == \
+        'Atom Test'
+    assert stream.completed == 4
+    assert not stream.pending
+    with raises(TypeError):
+        crawl_stream(feeds, 2, callback='not callable')
+
+
+def test_crawl_stream_cancel(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    ready = threading.Event()
+
+    def callback(result):
+        ready.wait()
+        stream.cancel()
+    stream = crawl_stream(feeds, 1, callback=callback)
+    ready.set()
+    results = list(stream)
+    assert len(results) == 1
+    assert results[0].url == feeds[0]
+    assert stream.cancelled.is_set()
+    assert stream.pending == frozenset(feeds[1:])
+    assert list(stream) == []
+
+
+def test_crawl_stream_fail_fast(fx_opener):
+    feeds = ['http://brokenrss.com/rss',
+             'http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom']
+    results = list(crawl_stream(feeds, 1, fail_fast=True))
+    assert len(results) == 1
+    assert isinstance(results[0], CrawlError)
+    assert results[0].feed_uri == feeds[0]
+
+
+def test_crawl_stream_deadline(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    # The first feed takes longer than the deadline.
+    stream = crawl_stream(feeds, 1, deadline=0.1,
+                          callback=lambda result: time.sleep(0.3))
+    results = list(stream)
+    assert [result.url for result in results] == feeds[:1]
+    assert stream.pending == frozenset(feeds[1:])
+
+
+def test_crawl_stream_queue_size(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    stream = crawl_stream(feeds, 3, queue_size=1)
+    time.sleep(0.2)
+    # Workers wait until the stream is consumed.
+    assert stream.results.qsize() == 1
+    assert len(list(stream)) == 3
+
+
+def test_crawl_into(fx_opener, tmpdir, monkeypatch):
+    stage = Stage(Session(identifier='a'),
+                  FileSystemRepository(str(tmpdir)))
+    urls = ['http://vio.atomtest.com/feed/atom',
+            'http://reversedentries.com/feed/atom',
+            'http://conditionaltest.com/atom.xml',
+            'http://brokenrss.com/rss']
+    feed_ids = dict((url, hashlib.sha1(url.encode('utf-8')).hexdigest())
+                    for url in urls)
+    subscriptions = SubscriptionList()
+    category = Category(label='Test')
+    subscriptions.add(category)
+    for url in urls:
+        category.add(Subscription(label=url, feed_uri=url,
+                                  feed_id=feed_ids[url]))
+    validators = ValidatorCache()
+    reports = []
+    report = crawl_into(stage, subscriptions, 2, validators=validators,
+                        batch_size=2, callback=reports.append)
+    assert isinstance(report, CrawlReport)
+    assert report.crawled == report.updated == 3
+    assert report.unchanged == report.not_modified == 0
+    assert [e.feed_uri for e in report.errors] == ['http://brokenrss.com/rss']
+    assert report.batches == 2
+    assert reports == [report, report]
+    assert not report.pending
+    assert report.throughput > 0
+    url = urls[0]
+    with stage:
+        feed = stage.feeds[feed_ids[url]]
+        assert feed.title.value == 'Atom Test'
+        assert len(feed.entries) == 2
+        feed.entries[0].read = Mark(marked=True, updated_at=now())
+        stage.feeds[feed_ids[url]] = feed
+    # Nothing changed; nothing is written.
+    report = crawl_into(stage, subscriptions, 2, validators=validators,
+                        batch_size=2)
+    assert report.crawled == report.unchanged == 2
+    assert report.not_modified == 1
+    assert report.updated == 0
+    assert report.batches == 1
+    # New entries are merged into the stored feed.
+    status, mimetype, content = mock_urls[url]
+    content = content.replace(b'</feed>', b'''
+    <entry>
+        <title>New Entry</title>
+        <id>http://vio.atomtest.com/new</id>
+        <updated>2013-08-20T00:00:00Z</updated>
+    </entry>
+</feed>''')
+    monkeypatch.setitem(mock_urls, url, (status, mimetype, content))
+    report = crawl_into(stage, subscriptions, 2, validators=validators)
+    assert report.updated == report.unchanged == 1
+    with stage:
+        feed = stage.feeds[feed_ids[url]]
+        assert len(feed.entries) == 3
+        assert feed.entries[0].id == 'http://vio.atomtest.com/new'
+        assert sum(1 for entry in feed.entries if entry.read) == 1
+    with raises(TypeError):
+        crawl_into(stage.repository, subscriptions, 2)
+    with raises(TypeError):
+        crawl_into(stage, urls, 2)
+    with raises(ValueError):
+        crawl_into(stage, subscriptions, 2, batch_size=0)
+
+
+@mark.skipif('ProcessPoolExecutor is None',
+             reason='concurrent.futures is unavailable')
+def test_crawl_pipelined(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml',
+             'http://nofavicontest.com/atom.xml',
+             'http://gziptest.com/atom.xml',
+             'http://brokenrss.com/rss',
+             'http://not-exists.com/rss']
+    results = list(crawl_pipelined(feeds, 3, parse_workers=2, queue_size=1))
+    assert sorted(result.feed_uri if isinstance(result, CrawlError)
+                  else result.url for result in results) == sorted(feeds)
+    results = dict((result.feed_uri, result)
+                   if isinstance(result, CrawlError)
+                   else (result.url, result)
+                   for result in results)
+    assert isinstance(results['http://brokenrss.com/rss'], CrawlError)
+    assert isinstance(results['http://not-exists.com/rss'], CrawlError)
+    expected = dict((result.url, result) for result in crawl(feeds[:5], 3))
+    for url, result in expected.items():
+        assert (list(write(results[url].feed, canonical_order=True,
+                           hints=False)) ==
+                list(write(result.feed, canonical_order=True, hints=False)))
+        assert results[url].icon_url == result.icon_url
+    entries = results['http://reversedentries.com/feed/atom'].feed.entries
+    assert entries[0].updated_at > entries[1].updated_at
+
+
+@mark.skipif('ThreadPoolExecutor is None',
+             reason='concurrent.futures is unavailable')
+def test_crawl_pipelined_executor(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    executor = ThreadPoolExecutor(1)
+    try:
+        results = crawl_pipelined(feeds, 2, queue_size=1, executor=executor)
+        result = next(iter(results))
+        assert result.url in feeds
+        results.close()
+        # The given executor is not shut down.
+        assert executor.submit(len, 'abc').result() == 3
+    finally:
+        executor.shutdown()
+
+
+@mark.skipif('ThreadPoolExecutor is None',
+             reason='concurrent.futures is unavailable')
+def test_crawl_pipelined_shutdown_executor(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    executor = ThreadPoolExecutor(1)
+    executor.shutdown()
+    results = list(crawl_pipelined(feeds, 2, queue_size=1,
+                                   executor=executor))
+    assert len(results) == 3
+    assert all(isinstance(result, CrawlError) for result in results)
+    assert sorted(result.feed_uri for result in results) == sorted(feeds)
+
+
+@mark.skipif('ThreadPoolExecutor is None',
+             reason='concurrent.futures is unavailable')
+def test_crawl_pipelined_dead_workers(fx_opener, monkeypatch):
+    def die(*args):
+        raise SystemExit()
+    monkeypatch.setattr('libearth.crawler._get_favicon', die)
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    executor = ThreadPoolExecutor(1)
+    try:
+        results = list(crawl_pipelined(feeds, 2, queue_size=1,
+                                       executor=executor))
+    finally:
+        executor.shutdown()
+    assert len(results) == 3
+    assert all(isinstance(result, CrawlError) for result in results)
+    assert sorted(result.feed_uri for result in results) == sorted(feeds)
+
+
+@mark.skipif('ThreadPoolExecutor is None',
+             reason='concurrent.futures is unavailable')
+def test_crawl_pipelined_dead_worker(fx_opener, monkeypatch):
+    from libearth.crawler import _get_favicon as get_favicon
+    died = []
+
+    def die_once(*args):
+        if not died:
+            died.append(threading.current_thread())
+            raise SystemExit()
+        return get_favicon(*args)
+    monkeypatch.setattr('libearth.crawler._get_favicon', die_once)
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://favicontest.com/atom.xml']
+    executor = ThreadPoolExecutor(1)
+    try:
+        results = list(crawl_pipelined(feeds, 3, queue_size=1,
+                                       executor=executor))
+    finally:
+        executor.shutdown()
+    assert len(died) == 1
+    assert sorted(result.feed_uri if isinstance(result, CrawlError)
+                  else result.url for result in results) == sorted(feeds)
+    assert len([result for result in results
+                if isinstance(result, CrawlError)]) == 1
+
+
+def test_crawl_host_concurrency(fx_opener):
+    feeds = ['http://vio.atomtest.com/feed/atom',
+             'http://reversedentries.com/feed/atom',
+             'http://rsstest.com/rss.xml',
+             'http://favicontest.com/atom.xml']
+    results = crawl(feeds, 4, host_concurrency=1, host_delay=0.01)
+    assert sorted(result.url for result in results) == sorted(feeds)
+
+
+def run_scheduler(scheduler, workers, duration):
+    lock = threading.Lock()
+    running = {}
+    log = []
+
+    def work():
+        while True:
+            url = scheduler.acquire()
+            if url is None:
+                break
+            host = scheduler.get_host(url)
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                log.append((time.time(), host, running[host], url))
+            time.sleep(duration)
+            with lock:
+                running[host] -= 1
+            scheduler.release(url)
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return log
+
+
+def test_host_scheduler_concurrency():
+    urls = ['http://a.com/{0}'.format(i) for i in range(6)]
+    urls.extend('http://B.com/{0}'.format(i) for i in range(2))
+    urls.extend('http://c.com/{0}'.format(i) for i in range(2))
+    scheduler = HostScheduler(urls, host_concurrency=2)
+    assert len(scheduler) == 10
+    log = run_scheduler(scheduler, 6, 0.05)
+    assert sorted(url for _, _, _, url in log) == sorted(urls)
+    assert max(count for _, _, count, _ in log) == 2
+    assert set(host for _, host, _, _ in log) == set(['a.com', 'b.com',
+                                                      'c.com'])
+    # Other hosts are not starved by a.com.
+    assert set(host for _, host, _, _ in log[:6]) == set(['a.com', 'b.com',
+                                                          'c.com'])
+    assert scheduler.acquire() is None
+
+
+def test_host_scheduler_delay():
+    urls = ['http://a.com/{0}'.format(i) for i in range(3)]
+    urls.append('http://b.com/')
+    scheduler = HostScheduler(urls, host_concurrency=3, host_delay=0.1)
+    log = run_scheduler(scheduler, 4, 0)
+    times = [t for t, host, _, _ in log if host == 'a.com']
+    assert len(times) == 3
+    for previous, next_ in zip(times, times[1:]):
+        assert next_ - previous >= 0.09
+    # b.com doesn't wait for a.com.
+    assert [t for t, host, _, _ in log if host == 'b.com'][0] < times[1]
+
+
+def test_host_scheduler_invalid():
+    with raises(ValueError):
+        HostScheduler([], host_concurrency=0)
+    with raises(ValueError):
+        HostScheduler([], host_delay=-1)
+
+
+def test_get_feed_not_modified(fx_opener):
+    url = 'http://conditionaltest.com/atom.xml'
+    validators = ValidatorCache()
+    result = get_feed(url, validators=validators)
+    assert not result.not_modified
+    assert result.feed.title.value == 'Atom Test'
+    assert validators.get(url) == conditional_urls[url]
+    assert validators.get_headers(url) == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Mon, 19 Aug 2013 07:49:20 GMT'
+    }
+    result = get_feed(url, validators=validators)
+    assert result.not_modified
+    assert result.url == url
+    assert result.feed is None
+    results = list(crawl([url, 'http://vio.atomtest.com/feed/atom'], 2,
+                         validators=validators))
+    assert sorted(r.not_modified for r in results) == [False, True]
+    assert url in validators
+    assert len(validators) == 1
+    with raises(ValueError):
+        result.add_as_subscription(SubscriptionList())
+
+
+def test_get_feed_truncated(fx_opener):
+    url = 'http://truncatedtest.com/atom.xml'
+    validators = ValidatorCache()
+    with raises(CrawlError):
+        get_feed(url, validators=validators)
+    # Validators of the broken response must not be cached; otherwise
+    # the feed would be never fetched again until it changes.
+    assert url not in validators
+    if ThreadPoolExecutor is not None:
+        executor = ThreadPoolExecutor(1)
+        result, = crawl_pipelined([url], 1, executor=executor,
+                                  validators=validators)
+        executor.shutdown()
+        assert isinstance(result, CrawlError)
+        assert url not in validators
+
+
+def test_parse_feed_closes_chunks():
+    closed = []
+
+    def chunks():
+        try:
+            yield b'<feed xmlns="http://www.w3.org/2005/Atom"><<'
+            yield b'</feed>'
+        finally:
+            closed.append(True)
+    with raises(CrawlError):
+        parse_feed('http://brokentest.com/atom.xml', chunks())
+    assert closed == [True]
+
+
+@mark.parametrize('url', sorted(compressed_urls))
+def test_get_feed_compressed(fx_opener, url):
+    result = get_feed(url)
+    assert result.feed.title.value == 'Atom Test'
+    assert len(result.feed.entries) == 2
+
+
+@mark.parametrize(('encoding', 'compress'), [
+    (None, lambda data: data),
+    ('identity', lambda data: data),
+    ('gzip', gzip_compress),
+    ('x-gzip', gzip_compress),
+    ('deflate', zlib.compress),
+    ('deflate', raw_deflate_compress),
+])
+def test_decompressor(encoding, compress):
+    compressed = compress(atom_xml)
+    for size in 1, 2, 7, len(compressed):
+        decompressor = Decompressor(encoding)
+        chunks = [decompressor.decompress(compressed[i:i + size])
+                  for i in range(0, len(compressed), size)]
+        chunks.append(decompressor.flush())
+        assert b''.join(chunks) == atom_xml
+
+
+def test_decompressor_error():
+    with raises(ValueError):
+        Decompressor('br')
+    decompressor = Decompressor('gzip')
+    with raises(IOError):
+        decompressor.decompress(b'not gzipped')
+
+
+def test_get_feed_favicon_cache(fx_opener):
+    favicons = FaviconCache()
+    urls = ['http://favicontest.com/atom.xml',
+            'http://nofavicontest.com/atom.xml',
+            'http://vio.atomtest.com/feed/atom']
+    # The feed fetch doesn't wait for probing favicons.
+    results = dict((r.url, r) for r in crawl(urls, 3, favicons=favicons))
+    assert results[urls[0]].icon_url is None
+    assert results[urls[1]].icon_url is None
+    assert results[urls[2]].icon_url == 'http://vio.atomtest.com/favicon.ico'
+    favicons.wait()
+    assert len(favicons) == 2
+    assert favicons.lookup('http://favicontest.com/other/page') == (
+        True, 'http://favicontest.com/favicon.ico'
+    )
+    # Negatively cached.
+    assert favicons.lookup('http://nofavicontest.com/') == (True, None)
+    del requested_urls[:]
+    results = dict((r.url, r) for r in crawl(urls, 3, favicons=favicons))
+    assert results[urls[0]].icon_url == 'http://favicontest.com/favicon.ico'
+    assert results[urls[1]].icon_url is None
+    assert sorted(requested_urls) == sorted(urls)
+
+
+def test_favicon_cache_ttl():
+    favicons = FaviconCache(ttl=100, negative_ttl=10)
+    assert favicons.lookup('http://a.com/') == (False, None)
+    favicons.store('http://a.com/', 'http://a.com/favicon.ico', now=1000)
+    favicons.store('http://B.com:80/page', None, now=1000)
+    assert favicons.lookup('http://a.com/x', now=1099) == (
+        True, 'http://a.com/favicon.ico'
+    )
+    assert favicons.lookup('http://a.com/x', now=1100) == (False, None)
+    assert favicons.lookup('https://a.com/', now=1000) == (False, None)
+    assert favicons.lookup('http://b.com/', now=1009) == (True, None)
+    assert favicons.lookup('http://b.com/', now=1010) == (False, None)
+
+
+@mark.parametrize(('url', 'origin'), [
+    ('http://example.com/a/b?c', 'http://example.com'),
+    ('HTTP://Example.COM:80/', 'http://example.com'),
+    ('https://example.com:443/', 'https://example.com'),
+    ('https://example.com:8443/', 'https://example.com:8443'),
+    ('http://user@example.com:8080', 'http://example.com:8080'),
+])
+def test_favicon_cache_origin(url, origin):
+    assert FaviconCache.get_origin(url) == origin
+
+
+def test_favicon_cache_persistence(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    with raises(TypeError):
+        FaviconCache(repo)
+    with raises(TypeError):
+        FaviconCache().save()
+    favicons = FaviconCache(repo, ['favicons'])
+    favicons.store('http://a.com/', 'http://a.com/favicon.ico')
+    favicons.store('http://b.com/', None)
+    favicons.store('http://c.com/', None, now=0)
+    favicons.save()
+    loaded = FaviconCache(repo, ['favicons'])
+    assert len(loaded) == 2
+    assert loaded.lookup('http://a.com/') == (True,
+                                              'http://a.com/favicon.ico')
+    assert loaded.lookup('http://b.com/') == (True, None)
+
+
+def test_validator_cache_persistence(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    with raises(TypeError):
+        ValidatorCache(repo)
+    validators = ValidatorCache(repo, ['validators'])
+    assert len(validators) == 0
+    validators.update('http://a.com/', '"a"', None)
+    validators.update('http://b.com/', None, 'Mon, 19 Aug 2013 07:49:20 GMT')
+    validators.update('http://c.com/', '"c"', None)
+    validators.update('http://c.com/', None, None)
+    validators.save()
+    loaded = ValidatorCache(repo, ['validators'])
+    assert len(loaded) == 2
+    assert loaded.get('http://a.com/') == ('"a"', None)
+    assert loaded.get('http://b.com/') == (
+        None, 'Mon, 19 Aug 2013 07:49:20 GMT'
+    )
+    assert loaded.get('http://c.com/') == (None, None)
+    assert loaded.get_headers('http://c.com/') == {}
+    with raises(TypeError):
+        ValidatorCache().save()
+
+
 @mark.parametrize('subs', [
     SubscriptionList(),
     Category()
@@ -2,6 +2,7 @@
 import datetime
 import functools
 import hashlib
+import pickle
 import uuid
 
 from pytest import fixture, raises
@@ -354,6 +355,22 @@ def fx_feed():
     '''])
 
 
+def test_feed_pickle(fx_feed):
+    feed = pickle.loads(pickle.dumps(fx_feed, pickle.HIGHEST_PROTOCOL))
+    assert isinstance(feed, Feed)
+    assert feed.title == Text(value='Example Feed')
+    assert feed.id == fx_feed.id
+    assert [a.name for a in feed.authors] == ['John Doe', 'Jane Doe']
+    assert len(feed.entries) == 2
+    assert feed.entries[0].read
+    assert feed.entries[0].read.updated_at == fx_feed.entries[0].read.updated_at
+    assert not feed.entries[1].read
+    assert list(write(feed, canonical_order=True, hints=False)) == \
+        list(write(fx_feed, canonical_order=True, hints=False))
+    assert list(write(feed, canonical_order=True)) == \
+        list(write(fx_feed, canonical_order=True))
+
+
 def test_feed_read(fx_feed):
     feed = fx_feed
     assert feed.title == Text(value='Example Feed')
@@ -21,7 +21,8 @@ from libearth.parser.autodiscovery import (AutoDiscovery, FeedLink,
                                            FeedUrlNotFoundError,
                                            autodiscovery, get_format)
 from libearth.parser.rss2 import parse_rss
-from libearth.parser.util import normalize_xml_encoding
+from libearth.parser.util import (normalize_xml_encoding,
+                                  normalize_xml_encoding_chunks, parse_xml)
 from libearth.schema import read, write
 from libearth.tz import utc
 
@@ -646,3 +647,100 @@ def test_normalize_xml_encoding():
         b'<doc title="\xec\x9d\xb8\xec\xbd\x94\xeb\x94\xa9 '
         b'\xed\x85\x8c\xec\x8a\xa4\xed\x8a\xb8" />'
     )
+
+
+def split_chunks(document, size):
+    if not isinstance(document, bytes):
+        document = document.encode('utf-8')
+    return (document[i:i + size] for i in range(0, len(document), size))
+
+
+@mark.parametrize('size', [1, 3, 7, 4096])
+def test_normalize_xml_encoding_chunks(size):
+    document = b'''
+        <?xml version="1.0" encoding="euc-kr" ?>
+        <doc title="\xc0\xce\xc4\xda\xb5\xf9 \xc5\xd7\xbd\xba\xc6\xae" />
+    '''
+    normalized = normalize_xml_encoding_chunks(split_chunks(document, size))
+    assert b''.join(normalized) == normalize_xml_encoding(document)
+    document = b'<doc title="\xec\x9d\xb8\x1c" />'
+    normalized = normalize_xml_encoding_chunks(split_chunks(document, size))
+    assert b''.join(normalized) == normalize_xml_encoding(document)
+    assert list(normalize_xml_encoding_chunks([])) == []
+    with raises(TypeError):
+        list(normalize_xml_encoding_chunks([u'<doc />']))
+
+
+@mark.parametrize('size', [1, 64, 4096])
+def test_parse_chunks(size):
+    url = 'http://vio.atomtest.com/feed/atom'
+    root = parse_xml(split_chunks(atom_xml, size))
+    assert root.tag == '{http://www.w3.org/2005/Atom}feed'
+    assert parse_xml(root) is root
+    assert get_format(split_chunks(atom_xml, size)) is parse_atom
+    assert get_format(split_chunks(rss_xml, size)) is parse_rss
+    assert get_format(split_chunks(atom_blog, size)) is None
+    for parse, document in [(parse_atom, atom_xml), (parse_rss, rss_xml)]:
+        feed, _ = parse(document, url)
+        chunked_feed, _ = parse(split_chunks(document, size), url)
+        assert (list(write(chunked_feed, canonical_order=True, hints=False)) ==
+                list(write(feed, canonical_order=True, hints=False)))
+    _, hints = parse_rss(split_chunks(rss_with_hints, size), url)
+    assert hints == parse_rss(rss_with_hints, url)[1]
+
+
+rss_with_hints = '''
+<rss version="2.0"
+     xmlns:sy="http://purl.org/rss/1.0/modules/syndication/">
+    <channel>
+        <title>Hints Test</title>
+        <ttl>60</ttl>
+        <skipHours>
+            <hour>0</hour>
+            <hour>1</hour>
+            <hour>24</hour>
+            <hour>invalid</hour>
+            <hour>25</hour>
+        </skipHours>
+        <skipDays>
+            <day>Saturday</day>
+            <day>sunday</day>
+            <day>Someday</day>
+        </skipDays>
+        <sy:updatePeriod>hourly</sy:updatePeriod>
+        <sy:updateFrequency>2</sy:updateFrequency>
+        <sy:updateBase>2000-01-01T12:00+00:00</sy:updateBase>
+    </channel>
+</rss>
+'''
+
+
+def test_rss_crawler_hints():
+    feed, crawler_hints = parse_rss(rss_with_hints)
+    assert crawler_hints == {
+        'ttl': 60,
+        'skipHours': frozenset([0, 1]),
+        'skipDays': frozenset(['Saturday', 'Sunday']),
+        'updatePeriod': 'hourly',
+        'updateFrequency': 2,
+        'updateBase': datetime.datetime(2000, 1, 1, 12, tzinfo=utc)
+    }
+    _, crawler_hints = parse_rss(rss_with_empty_title)
+    assert crawler_hints is None
+
+
+atom_with_hints = '''
+<feed xmlns="http://www.w3.org/2005/Atom"
+      xmlns:sy="http://purl.org/rss/1.0/modules/syndication/">
+    <title>Hints Test</title>
+    <sy:updatePeriod>Daily</sy:updatePeriod>
+    <sy:updateFrequency>zero</sy:updateFrequency>
+</feed>
+'''
+
+
+def test_atom_crawler_hints():
+    _, crawler_hints = parse_atom(atom_with_hints, None)
+    assert crawler_hints == {'updatePeriod': 'daily'}
+    _, crawler_hints = parse_atom(category_with_no_term, None)
+    assert crawler_hints is None
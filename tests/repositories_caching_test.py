@@ -0,0 +1,189 @@
+import os
+import threading
+
+from pytest import fixture, raises
+
+from libearth.repository import FileSystemRepository, RepositoryKeyError
+from libearth.repositories.caching import CachingRepository
+from libearth.session import Session
+from libearth.stage import DirtyBuffer
+
+from .repository_test import age_directories
+from .stage_test import TestDoc, TestStage
+
+
+class CountingRepository(FileSystemRepository):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingRepository, self).__init__(*args, **kwargs)
+        self.reads = []
+        self.lists = []
+
+    def read(self, key):
+        self.reads.append(tuple(key))
+        return super(CountingRepository, self).read(key)
+
+    def list(self, key):
+        self.lists.append(tuple(key))
+        return super(CountingRepository, self).list(key)
+
+
+@fixture
+def fx_inner(tmpdir):
+    return CountingRepository(str(tmpdir))
+
+
+def test_read_cache(fx_inner):
+    repo = CachingRepository(fx_inner)
+    repo.write(['dir', 'key'], [b'cached ', b'value'])
+    for _ in range(3):
+        assert b''.join(repo.read(['dir', 'key'])) == b'cached value'
+    assert fx_inner.reads == [('dir', 'key')]
+    assert repo.hits == 2
+    assert repo.misses == 1
+    assert repo.hit_rate == 2 / 3.0
+    assert repo.current_bytes == len(b'cached value')
+    with raises(RepositoryKeyError):
+        repo.read(['dir', 'nonexistent'])
+
+
+def test_list_cache(fx_inner):
+    repo = CachingRepository(fx_inner)
+    repo.write(['dir', 'a'], [b'a'])
+    assert repo.list(['dir']) == frozenset(['a'])
+    assert repo.list(['dir']) == frozenset(['a'])
+    assert fx_inner.lists == [('dir',)]
+    assert repo.exists(['dir', 'a'])
+    assert not repo.exists(['dir', 'b'])
+    repo.write(['dir', 'b'], [b'b'])
+    assert repo.exists(['dir', 'b'])
+    assert repo.list(['dir']) == frozenset(['a', 'b'])
+    assert fx_inner.lists == [('dir',), ('dir',)]
+
+
+def test_invalidate_on_write(fx_inner):
+    repo = CachingRepository(fx_inner)
+    repo.write(['key'], [b'old'])
+    assert b''.join(repo.read(['key'])) == b'old'
+    repo.write(['key'], [b'new'])
+    assert b''.join(repo.read(['key'])) == b'new'
+    repo.write_many([(['key'], [b'newer']), (['key2'], [b'value'])])
+    assert b''.join(repo.read(['key'])) == b'newer'
+    assert len(fx_inner.reads) == 3
+    # Writes bypassing the wrapper are not noticed until invalidated.
+    fx_inner.write(['key'], [b'newest'])
+    assert b''.join(repo.read(['key'])) == b'newer'
+    repo.invalidate(['key'])
+    assert b''.join(repo.read(['key'])) == b'newest'
+    repo.invalidate()
+    assert repo.current_bytes == 0
+
+
+def test_validate(fx_inner):
+    repo = CachingRepository(fx_inner, validate=True)
+    fx_inner.write(['dir', 'key'], [b'old'])
+    assert b''.join(repo.read(['dir', 'key'])) == b'old'
+    assert b''.join(repo.read(['dir', 'key'])) == b'old'
+    assert repo.hits == 1
+    fx_inner.write(['dir', 'key'], [b'new value'])
+    assert b''.join(repo.read(['dir', 'key'])) == b'new value'
+    assert repo.list(['dir']) == frozenset(['key'])
+    fx_inner.write(['dir', 'key2'], [b'value'])
+    assert repo.list(['dir']) == frozenset(['key', 'key2'])
+    os.remove(fx_inner.get_path(['dir', 'key']))
+    with raises(RepositoryKeyError):
+        repo.read(['dir', 'key'])
+    with raises(ValueError):
+        CachingRepository(DirtyBuffer(fx_inner, threading.RLock()),
+                          validate=True)
+
+
+def test_validate_sharded_list(tmpdir):
+    inner = FileSystemRepository(str(tmpdir), shard_width=1)
+    repo = CachingRepository(inner, validate=True)
+    for i in range(200):
+        repo.write(['feeds', 'key{0}'.format(i)], [b'value'])
+    age_directories(str(tmpdir), 60)
+    assert len(repo.list(['feeds'])) == 200
+    assert len(repo.list(['feeds'])) == 200
+    assert repo.hits == 1
+    # Written by another process into an existing shard directory.
+    other = FileSystemRepository(str(tmpdir))
+    other.write(['feeds', 'new-key'], [b'value'])
+    assert len(repo.list(['feeds'])) == 201
+    age_directories(str(tmpdir), 30)
+    assert len(repo.list(['feeds'])) == 201
+    assert repo.stamp(['feeds']) == inner.stamp(['feeds'])
+
+
+def test_stage_directory(tmpdir):
+    inner = FileSystemRepository(str(tmpdir), shard_width=1)
+    repo = CachingRepository(inner, validate=True)
+    stage = TestStage(Session('SESSID'), repo)
+    indices = ['doc{0:02d}'.format(i) for i in range(50)]
+    with stage:
+        for index in indices:
+            stage.dir_docs[index] = TestDoc()
+    age_directories(str(tmpdir), 60)
+    with stage:
+        assert list(stage.dir_docs) == indices
+        assert list(stage.dir_docs) == indices
+    # Changed behind the cache by another process.
+    other = TestStage(Session('SESSID2'), inner)
+    with other:
+        other.dir_docs['new'] = TestDoc()
+    with stage:
+        assert list(stage.dir_docs) == indices + ['new']
+
+
+def test_eviction(fx_inner):
+    repo = CachingRepository(fx_inner, max_bytes=10)
+    for name in 'abc':
+        repo.write([name], [name.encode('ascii') * 4])
+    assert b''.join(repo.read(['a'])) == b'aaaa'
+    assert b''.join(repo.read(['b'])) == b'bbbb'
+    assert b''.join(repo.read(['a'])) == b'aaaa'
+    assert b''.join(repo.read(['c'])) == b'cccc'  # evicts b
+    assert repo.evictions == 1
+    assert repo.current_bytes == 8
+    del fx_inner.reads[:]
+    assert b''.join(repo.read(['a'])) == b'aaaa'
+    assert b''.join(repo.read(['b'])) == b'bbbb'
+    assert fx_inner.reads == [('b',)]
+    repo.write(['large'], [b'x' * 11])
+    assert b''.join(repo.read(['large'])) == b'x' * 11
+    assert ('read', ('large',)) not in repo.entries
+
+
+def test_clear(fx_inner):
+    repo = CachingRepository(fx_inner)
+    repo.write(['key'], [b'value'])
+    repo.read(['key'])
+    repo.read(['key'])
+    repo.clear()
+    assert repo.hits == repo.misses == repo.current_bytes == 0
+    assert repo.hit_rate == 0
+    with raises(TypeError):
+        CachingRepository('not repository')
+
+
+def test_watch_invalidates(fx_inner):
+    repo = CachingRepository(fx_inner)
+    fx_inner.write(['dir', 'key'], [b'old'])
+    assert b''.join(repo.read(['dir', 'key'])) == b'old'
+    with repo.watch(['dir'], interval=0.01) as watcher:
+        fx_inner.write(['dir', 'key'], [b'new'])
+        assert b''.join(repo.read(['dir', 'key'])) == b'old'
+        assert watcher.poll(timeout=5) == [['dir', 'key']]
+        assert b''.join(repo.read(['dir', 'key'])) == b'new'
+
+
+def test_lock_keys_invalidates(fx_inner):
+    repo = CachingRepository(fx_inner)
+    repo.write(['key'], [b'old'])
+    assert b''.join(repo.read(['key'])) == b'old'
+    # Other process changes the value.
+    fx_inner.write(['key'], [b'new'])
+    assert b''.join(repo.read(['key'])) == b'old'
+    with repo.lock_keys([['key']]):
+        assert b''.join(repo.read(['key'])) == b'new'
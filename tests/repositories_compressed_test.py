@@ -0,0 +1,72 @@
+import zlib
+
+from pytest import fixture, mark, raises
+
+from libearth.repository import FileSystemRepository, RepositoryKeyError
+from libearth.repositories.compressed import (CODECS, HEADER_MAGIC,
+                                              CompressedRepository,
+                                              compress_chunks,
+                                              decompress_chunks)
+
+
+@fixture
+def fx_inner(tmpdir):
+    return FileSystemRepository(str(tmpdir))
+
+
+@mark.parametrize('codec', sorted(CODECS))
+def test_compressed_repository(fx_inner, codec):
+    repo = CompressedRepository(fx_inner, codec=codec)
+    value = b'<feed>' + b'<entry>hello earth reader</entry>' * 1000 + b'</feed>'
+    repo.write(['dir', 'key'], [value[:100], value[100:]])
+    stored = b''.join(fx_inner.read(['dir', 'key']))
+    assert stored.startswith(HEADER_MAGIC)
+    assert len(stored) < len(value) / 5
+    assert b''.join(repo.read(['dir', 'key'])) == value
+    assert repo.exists(['dir', 'key'])
+    assert repo.list(['dir']) == frozenset(['key'])
+    with raises(RepositoryKeyError):
+        repo.read(['dir', 'nonexistent'])
+
+
+def test_mixed_values(fx_inner):
+    fx_inner.write(['plain'], [b'<plain />'])
+    repo = CompressedRepository(fx_inner)
+    repo.write(['compressed'], [b'<compressed />'])
+    assert b''.join(repo.read(['plain'])) == b'<plain />'
+    assert b''.join(repo.read(['compressed'])) == b'<compressed />'
+    uncompressed = CompressedRepository(fx_inner, codec=None)
+    uncompressed.write(['plain2'], [b'<plain2 />'])
+    assert b''.join(fx_inner.read(['plain2'])) == b'<plain2 />'
+    assert b''.join(uncompressed.read(['compressed'])) == b'<compressed />'
+
+
+def test_decompress_chunks_streaming():
+    value = b''.join(str(i).encode('ascii') for i in range(10000))
+    compressed = b''.join(compress_chunks(CODECS['zlib'], [value]))
+    # Feed the compressed value byte by byte, to split the header as well.
+    chunks = [compressed[i:i + 1] for i in range(len(compressed))]
+    decompressed = list(decompress_chunks(chunks))
+    assert len(decompressed) > 1
+    assert b''.join(decompressed) == value
+    assert b''.join(decompress_chunks([b'\x89', b'LE'])) == b'\x89LE'
+    assert b''.join(decompress_chunks([b'\x89', b'LX', b'Y'])) == b'\x89LXY'
+    assert list(decompress_chunks([])) == []
+    with raises(ValueError):
+        list(decompress_chunks([HEADER_MAGIC + b'\x03abc' +
+                                zlib.compress(b'')]))
+
+
+def test_write_many(fx_inner):
+    repo = CompressedRepository(fx_inner)
+    repo.write_many([(['a'], [b'<a />']), (['b'], [b'<b />'])])
+    assert b''.join(repo.read(['a'])) == b'<a />'
+    assert b''.join(repo.read(['b'])) == b'<b />'
+    assert b''.join(fx_inner.read(['a'])).startswith(HEADER_MAGIC)
+
+
+def test_invalid_arguments(fx_inner):
+    with raises(TypeError):
+        CompressedRepository('not repository')
+    with raises(ValueError):
+        CompressedRepository(fx_inner, codec='unknown')
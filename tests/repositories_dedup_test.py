@@ -0,0 +1,128 @@
+import os
+import os.path
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from pytest import fixture, mark, raises
+
+from libearth.repository import RepositoryKeyError, from_url
+from libearth.repositories.dedup import (DedupRepository, decode_manifest,
+                                         encode_manifest, split_chunks)
+
+
+def make_feed(revision, *entries):
+    return [b'<feed revision="' + revision + b'">'] + \
+        [b'<entry><id>' + entry + b'</id></entry>' for entry in entries] + \
+        [b'</feed>']
+
+
+def count_chunks(repo):
+    return len(repo.chunks.list([]))
+
+
+@fixture
+def fx_repo(tmpdir):
+    return DedupRepository(str(tmpdir))
+
+
+def test_split_chunks():
+    assert list(split_chunks([b'<feed><entry>a</entry><en', b'try/>'])) == [
+        b'<feed>', b'<entry>a</entry>', b'<entry/>'
+    ]
+    assert list(split_chunks([b'<rss><channel><item>a</item>',
+                              b'<item>b</item></channel></rss>'])) == [
+        b'<rss><channel>', b'<item>a</item>', b'<item>b</item>',
+        b'</channel></rss>'
+    ]
+    assert list(split_chunks([b'<entry>', b'abcdefgh'], max_size=5)) == [
+        b'<entr', b'y>abc', b'defgh'
+    ]
+    assert list(split_chunks([b'<e', b'', b'ntry>'], [b'<entry'])) == [
+        b'<entry>'
+    ]
+    assert list(split_chunks([])) == []
+
+
+def test_manifest():
+    entries = [('a' * 40, 3), ('b' * 40, 0)]
+    assert decode_manifest(encode_manifest(entries)) == entries
+    assert decode_manifest(encode_manifest([])) == []
+    with raises(ValueError):
+        decode_manifest(b'<feed />')
+
+
+@mark.skipif('sys.platform == "win32"', reason='POSIX path test')
+def test_from_to_url__posix(tmpdir):
+    path = str(tmpdir.join('repo'))
+    repo = from_url('dedup://' + path)
+    assert isinstance(repo, DedupRepository)
+    assert repo.path == path
+    assert repo.to_url('dedup') == 'dedup://' + path
+    with raises(ValueError):
+        DedupRepository.from_url(urlparse.urlparse('file://' + path))
+    with raises(ValueError):
+        DedupRepository.from_url(urlparse.urlparse('dedup://host/repo'))
+
+
+def test_deduplication(fx_repo):
+    fx_repo.write(['feeds', 'a', 'session1.xml'],
+                  make_feed(b'1', b'x', b'y'))
+    assert count_chunks(fx_repo) == 4
+    fx_repo.write(['feeds', 'a', 'session2.xml'],
+                  make_feed(b'2', b'x', b'y'))
+    assert count_chunks(fx_repo) == 5
+    fx_repo.write(['feeds', 'b', 'session1.xml'],
+                  make_feed(b'1', b'y', b'z'))
+    assert count_chunks(fx_repo) == 6
+    assert b''.join(fx_repo.read(['feeds', 'a', 'session2.xml'])) == \
+        b''.join(make_feed(b'2', b'x', b'y'))
+    assert fx_repo.list(['feeds']) == frozenset(['a', 'b'])
+    assert fx_repo.exists(['feeds', 'b', 'session1.xml'])
+    assert not fx_repo.exists(['feeds', 'b', 'session2.xml'])
+    with raises(RepositoryKeyError):
+        fx_repo.read(['feeds', 'b', 'session2.xml'])
+    with raises(RepositoryKeyError):
+        fx_repo.read(['feeds'])
+
+
+def test_collect_garbage(tmpdir):
+    path = str(tmpdir)
+    repo = DedupRepository(path)
+    repo.write(['a'], make_feed(b'1', b'x', b'y'))
+    repo.write(['b'], make_feed(b'1', b'y'))
+    repo.write(['a'], make_feed(b'2', b'x'))
+    assert repo.collect_garbage() == 0
+    assert count_chunks(repo) == 5
+    repo.write(['b'], [b'empty'])
+    assert repo.collect_garbage() == \
+        len(b'<feed revision="1">') + len(b'<entry><id>y</id></entry>')
+    assert count_chunks(repo) == 4
+    assert b''.join(repo.read(['a'])) == b''.join(make_feed(b'2', b'x'))
+    assert repo.collect_garbage() == 0
+    # Reference counts are rebuilt from manifests.
+    reopened = DedupRepository(path)
+    assert reopened.get_refcounts() == repo.get_refcounts()
+    orphan = reopened.chunks.get_path(['0' * 40])
+    reopened.chunks.write(['0' * 40], [b'orphan'])
+    assert reopened.collect_garbage() == 0
+    assert reopened.collect_garbage(full=True) == len(b'orphan')
+    assert not os.path.exists(orphan)
+    assert b''.join(reopened.read(['b'])) == b'empty'
+
+
+def test_write_many(fx_repo):
+    fx_repo.write_many([
+        (['a'], make_feed(b'1', b'x')),
+        (['b'], make_feed(b'1', b'x')),
+        (['a'], make_feed(b'2', b'x'))
+    ])
+    assert b''.join(fx_repo.read(['a'])) == b''.join(make_feed(b'2', b'x'))
+    assert fx_repo.get_refcounts()[
+        decode_manifest(b''.join(fx_repo.manifests.read(['b'])))[1][0]
+    ] == 2
+    assert fx_repo.collect_garbage() == 0
+    with raises(RepositoryKeyError):
+        fx_repo.write_many([(['a', 'b'], [b'c'])])
+    assert fx_repo.collect_garbage() == 1
@@ -0,0 +1,156 @@
+import logging
+import time
+
+from pytest import fixture, raises
+
+from libearth.repository import FileSystemRepository, RepositoryKeyError
+from libearth.repositories.metered import Histogram, MeteredRepository
+
+
+class SlowRepository(FileSystemRepository):
+
+    def read(self, key):
+        chunks = super(SlowRepository, self).read(key)
+        for chunk in chunks:
+            time.sleep(0.01)
+            yield chunk
+
+
+@fixture
+def fx_repo(tmpdir):
+    return MeteredRepository(FileSystemRepository(str(tmpdir),
+                                                  buffer_size=4))
+
+
+def test_histogram():
+    histogram = Histogram([1, 2, 4, 8])
+    assert histogram.mean is None
+    assert histogram.percentile(0.5) is None
+    for value in [0.5, 1.5, 1.5, 3, 100]:
+        histogram.add(value)
+    assert histogram.buckets == [1, 2, 1, 0, 1]
+    assert histogram.count == 5
+    assert histogram.mean == 106.5 / 5
+    assert histogram.min == 0.5
+    assert histogram.max == 100
+    assert histogram.percentile(0) == 1
+    assert histogram.percentile(0.5) == 2
+    assert histogram.percentile(0.8) == 4
+    assert histogram.percentile(1) == 100
+    with raises(ValueError):
+        histogram.percentile(1.5)
+
+
+def test_metered_repository(fx_repo):
+    fx_repo.write(['feeds', 'a'], [b'hello ', b'world'])
+    fx_repo.write(['subscriptions.xml'], [b'subs'])
+    assert b''.join(fx_repo.read(['feeds', 'a'])) == b'hello world'
+    assert fx_repo.exists(['feeds', 'a'])
+    assert fx_repo.list(['feeds']) == frozenset(['a'])
+    with raises(RepositoryKeyError):
+        fx_repo.read(['feeds', 'b'])
+    meters = fx_repo.snapshot()
+    assert sorted(meters) == [
+        ('exists', ('feeds',)),
+        ('list', ('feeds',)),
+        ('read', ('feeds',)),
+        ('read.first_chunk', ('feeds',)),
+        ('write', ('feeds',)),
+        ('write', ('subscriptions.xml',))
+    ]
+    read = meters['read', ('feeds',)]
+    assert read.calls == 2
+    assert read.errors == 1
+    assert read.bytes == 11
+    assert meters['read.first_chunk', ('feeds',)].calls == 1
+    assert meters['write', ('feeds',)].bytes == 11
+    assert meters['write', ('subscriptions.xml',)].latency.count == 1
+    # Snapshots are copies.
+    fx_repo.exists(['feeds', 'a'])
+    assert meters['exists', ('feeds',)].calls == 1
+    assert fx_repo.snapshot(reset=True)['exists', ('feeds',)].calls == 2
+    assert fx_repo.snapshot() == {}
+
+
+class ClosingRepository(FileSystemRepository):
+
+    closed = 0
+
+    def read(self, key):
+        chunks = super(ClosingRepository, self).read(key)
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+def test_partial_read(tmpdir):
+    inner = ClosingRepository(str(tmpdir), buffer_size=4,
+                              max_buffer_size=None)
+    repo = MeteredRepository(inner)
+    repo.write(['feeds', 'a'], [b'hello ', b'world'])
+    chunks = repo.read(['feeds', 'a'])
+    assert next(chunks) == b'hell'
+    assert not repo.snapshot().get(('read', ('feeds',)))
+    chunks.close()
+    assert inner.closed == 1
+    read = repo.snapshot()['read', ('feeds',)]
+    assert read.calls == 1
+    assert read.errors == 0
+    assert read.bytes == 4
+    assert read.latency.count == 1
+
+
+def test_read_latency(tmpdir):
+    repo = MeteredRepository(SlowRepository(str(tmpdir), buffer_size=2,
+                                            max_buffer_size=None),
+                             prefix_depth=0)
+    repo.write(['key'], [b'123456'])
+    chunks = repo.read(['key'])
+    assert list(repo.snapshot()) == [('write', ())]
+    assert b''.join(chunks) == b'123456'
+    meters = repo.snapshot()
+    first_chunk = meters['read.first_chunk', ()].latency
+    exhaustion = meters['read', ()].latency
+    assert 0.01 <= first_chunk.total < exhaustion.total
+    assert exhaustion.total >= 0.03
+
+
+def test_batches(fx_repo):
+    fx_repo.write_many([(['a', 'x'], [b'ab']), (['a', 'y'], [b'c']),
+                        (['b'], [b'd'])])
+    assert fx_repo.exists_many([['a', 'x'], ['c']]) == [True, False]
+    chunks_list = fx_repo.read_many([['a', 'x'], ['b']])
+    assert [b''.join(chunks) for chunks in chunks_list] == [b'ab', b'd']
+    meters = fx_repo.snapshot()
+    assert meters['write_many', ('a',)].bytes == 3
+    assert meters['write_many', ('a',)].calls == 1
+    assert meters['write_many', ('b',)].bytes == 1
+    assert meters['exists_many', ('c',)].calls == 1
+    assert meters['read', ('a',)].bytes == 2
+
+
+def test_periodic_logging(tmpdir):
+    records = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            records.append(record.getMessage())
+    logger = logging.getLogger('libearth.repositories.metered')
+    handler = Handler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        repo = MeteredRepository(FileSystemRepository(str(tmpdir)),
+                                 log_interval=0.01)
+        repo.write(['feeds', 'a'], [b'value'])
+        for _ in range(500):
+            if records:
+                break
+            time.sleep(0.01)
+        repo.close()
+    finally:
+        logger.removeHandler(handler)
+    assert not repo.logging_thread.is_alive()
+    assert records[0].startswith('write feeds: 1 calls, 0 errors, 5 bytes')
@@ -0,0 +1,232 @@
+import os
+import os.path
+import sys
+import threading
+import time
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from pytest import fixture, mark, raises
+
+from libearth.repository import RepositoryKeyError, from_url
+from libearth.repositories.pack import PackRepository
+from libearth.stage import DirtyBuffer
+
+
+@fixture
+def fx_repo(request, tmpdir):
+    repo = PackRepository(str(tmpdir))
+    request.addfinalizer(repo.close)
+    return repo
+
+
+@mark.skipif('sys.platform == "win32"', reason='POSIX path test')
+def test_from_to_url__posix(tmpdir):
+    path = str(tmpdir.join('repo'))
+    repo = from_url('pack://' + path)
+    assert isinstance(repo, PackRepository)
+    assert repo.path == path
+    assert repo.to_url('pack') == 'pack://' + path
+    assert os.path.isdir(path)
+    repo.close()
+    with raises(ValueError):
+        PackRepository.from_url(urlparse.urlparse('file://' + path))
+    with raises(ValueError):
+        PackRepository.from_url(urlparse.urlparse('pack://host/repo'))
+
+
+def test_persistence(tmpdir):
+    path = str(tmpdir)
+    repo = PackRepository(path)
+    repo.write(['dir', 'key'], [b'old ', b'value'])
+    repo.write(['dir', 'key'], [b'persistent ', b'value'])
+    repo.write(['other'], [b'other value'])
+    repo.close()
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['dir', 'key'])) == b'persistent value'
+    assert b''.join(repo.read(['other'])) == b'other value'
+    assert repo.list([]) == frozenset(['dir', 'other'])
+    repo.close()
+
+
+def test_torn_write(tmpdir):
+    path = str(tmpdir)
+    repo = PackRepository(path)
+    repo.write(['key'], [b'complete'])
+    repo.close()
+    # Simulate a crash in the middle of appending a value and its record.
+    with open(os.path.join(path, '00000001.seg'), 'ab') as f:
+        f.write(b'incompl')
+    with open(os.path.join(path, PackRepository.INDEX_FILENAME), 'ab') as f:
+        f.write(b'[["key"], 1, 8, 100]\n[["ot')
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['key'])) == b'complete'
+    assert not repo.exists(['ot'])
+    repo.write(['key2'], [b'after crash'])
+    assert b''.join(repo.read(['key2'])) == b'after crash'
+    repo.close()
+    # Records appended after the crash survive reopening.
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['key'])) == b'complete'
+    assert b''.join(repo.read(['key2'])) == b'after crash'
+    repo.close()
+
+
+def test_torn_index_tail(tmpdir):
+    path = str(tmpdir)
+    repo = PackRepository(path)
+    repo.write(['a'], [b'first'])
+    repo.write(['b'], [b'second'])
+    repo.close()
+    index_path = os.path.join(path, PackRepository.INDEX_FILENAME)
+    # Simulate a crash in the middle of appending the last record.
+    with open(index_path, 'r+b') as f:
+        f.truncate(os.path.getsize(index_path) - 5)
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['a'])) == b'first'
+    assert not repo.exists(['b'])
+    repo.write(['c'], [b'third'])
+    repo.close()
+    with open(index_path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['a'])) == b'first'
+    assert b''.join(repo.read(['c'])) == b'third'
+    repo.close()
+
+
+def test_read_chunks(tmpdir):
+    repo = PackRepository(str(tmpdir), buffer_size=4)
+    repo.write(['key'], [b'hello ', b'earth reader'])
+    chunks = [bytes(chunk) for chunk in repo.read(['key'])]
+    assert chunks == [b'hell', b'o ea', b'rth ', b'read', b'er']
+    repo.write(['empty'], [])
+    assert b''.join(repo.read(['empty'])) == b''
+    repo.close()
+    with raises(ValueError):
+        PackRepository(str(tmpdir), buffer_size=0)
+
+
+def test_list(fx_repo):
+    for i in range(100):
+        fx_repo.write(['dir', 'key{0}'.format(i)], [b'value'])
+    assert fx_repo.list(['dir']) == frozenset(
+        'key{0}'.format(i) for i in range(100)
+    )
+    assert fx_repo.exists(['dir'])
+    with raises(RepositoryKeyError):
+        fx_repo.list(['dir', 'key0'])
+    with raises(RepositoryKeyError):
+        fx_repo.list(['nonexistent'])
+
+
+def test_stamp(fx_repo):
+    fx_repo.write(['dir', 'a'], [b'a'])
+    stamp = fx_repo.stamp(['dir'])
+    assert stamp is not None
+    fx_repo.write(['dir', 'a'], [b'updated'])
+    assert fx_repo.stamp(['dir']) == stamp
+    fx_repo.write(['dir', 'b'], [b'b'])
+    assert fx_repo.stamp(['dir']) != stamp
+    with raises(RepositoryKeyError):
+        fx_repo.stamp(['dir', 'a'])
+    with raises(RepositoryKeyError):
+        fx_repo.stamp(['not-exist'])
+
+
+def test_write_directory_errors(fx_repo):
+    fx_repo.write(['dir', 'key'], [b'value'])
+    with raises(RepositoryKeyError):
+        fx_repo.write(['dir'], [b'value'])
+    with raises(RepositoryKeyError):
+        fx_repo.write(['dir', 'key', 'subkey'], [b'value'])
+
+
+def test_write_many_atomic(fx_repo):
+    with raises(RepositoryKeyError):
+        fx_repo.write_many([
+            (['a'], [b'a']),
+            (['b'], [b'b']),
+            (['a', 'c'], [b'c'])
+        ])
+    assert not fx_repo.exists(['a'])
+    assert not fx_repo.exists(['b'])
+    fx_repo.write_many([(['a'], [b'a']), (['b'], [b'b'])])
+    assert b''.join(fx_repo.read(['a'])) == b'a'
+    assert b''.join(fx_repo.read(['b'])) == b'b'
+
+
+def test_segment_rollover(tmpdir):
+    repo = PackRepository(str(tmpdir), segment_size=16)
+    for i in range(10):
+        repo.write(['key{0}'.format(i)], [b'0123456789'])
+    assert repo.active_segment == 10
+    for i in range(10):
+        assert b''.join(repo.read(['key{0}'.format(i)])) == b'0123456789'
+    repo.close()
+
+
+def test_compact(tmpdir):
+    path = str(tmpdir)
+    repo = PackRepository(path, segment_size=32)
+    repo.write(['other'], [b'other'])
+    for i in range(4):
+        repo.write(['key'], [b'0123456789', str(i).encode('ascii')])
+    assert repo.active_segment == 2
+    assert repo.get_dead_ratio(1) > 0.5
+    assert repo.get_dead_ratio(2) == 0.5
+    assert repo.compact() == 22
+    assert sorted(repo.segment_sizes) == [2]
+    assert not os.path.exists(repo.get_segment_path(1))
+    assert b''.join(repo.read(['key'])) == b'01234567893'
+    assert b''.join(repo.read(['other'])) == b'other'
+    assert repo.compact() == 0
+    repo.close()
+    with open(os.path.join(path, PackRepository.INDEX_FILENAME), 'rb') as f:
+        assert len(f.readlines()) == 2
+    repo = PackRepository(path)
+    assert b''.join(repo.read(['key'])) == b'01234567893'
+    assert b''.join(repo.read(['other'])) == b'other'
+    repo.close()
+
+
+def test_background_compaction(tmpdir):
+    repo = PackRepository(str(tmpdir), segment_size=8,
+                          compaction_interval=0.01)
+    for i in range(5):
+        repo.write(['key'], [b'value', str(i).encode('ascii')])
+    for _ in range(500):
+        if len(repo.segment_sizes) < 3:
+            break
+        time.sleep(0.01)
+    assert len(repo.segment_sizes) < 3
+    assert b''.join(repo.read(['key'])) == b'value4'
+    repo.close()
+    assert not repo.compaction_thread.is_alive()
+
+
+def test_dirty_buffer(fx_repo):
+    buffer_ = DirtyBuffer(fx_repo, threading.RLock())
+    buffer_.write(['a', 'b'], [b'ab'])
+    buffer_.write(['c'], [b'c'])
+    assert not fx_repo.exists(['a'])
+    buffer_.flush()
+    assert b''.join(fx_repo.read(['a', 'b'])) == b'ab'
+    assert b''.join(fx_repo.read(['c'])) == b'c'
+
+
+def test_threads(fx_repo):
+    def work(n):
+        for i in range(20):
+            fx_repo.write(['t{0}'.format(n), str(i)], [str(n * i).encode()])
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for n in range(5):
+        assert len(fx_repo.list(['t{0}'.format(n)])) == 20
+        assert b''.join(fx_repo.read(['t{0}'.format(n), '19'])) == \
+            str(n * 19).encode()
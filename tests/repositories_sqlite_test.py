@@ -0,0 +1,163 @@
+import os.path
+import sys
+import threading
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+from pytest import fixture, mark, raises
+
+from libearth.repository import RepositoryKeyError, from_url
+from libearth.repositories.sqlite import SQLiteRepository
+from libearth.stage import DirtyBuffer
+
+
+@fixture
+def fx_repo(tmpdir):
+    return SQLiteRepository(str(tmpdir.join('repo.db')))
+
+
+@mark.skipif('sys.platform == "win32"', reason='POSIX path test')
+def test_from_to_url__posix(tmpdir):
+    path = str(tmpdir.join('repo.db'))
+    repo = from_url('sqlite://' + path)
+    assert isinstance(repo, SQLiteRepository)
+    assert repo.path == path
+    assert repo.to_url('sqlite') == 'sqlite://' + path
+    assert os.path.isfile(path)
+    memory = SQLiteRepository.from_url(urlparse.urlparse('sqlite://'))
+    assert memory.path == ':memory:'
+    assert memory.to_url('sqlite') == 'sqlite://'
+    with raises(ValueError):
+        SQLiteRepository.from_url(urlparse.urlparse('file://' + path))
+    with raises(ValueError):
+        SQLiteRepository.from_url(urlparse.urlparse('sqlite://host/a.db'))
+
+
+def test_persistence(tmpdir):
+    path = str(tmpdir.join('repo.db'))
+    repo = SQLiteRepository(path)
+    repo.write(['dir', 'key'], [b'persistent ', b'value'])
+    repo.connection.close()
+    repo = SQLiteRepository(path)
+    assert b''.join(repo.read(['dir', 'key'])) == b'persistent value'
+    assert repo.list([]) == frozenset(['dir'])
+
+
+def test_read_chunks(tmpdir):
+    repo = SQLiteRepository(str(tmpdir.join('repo.db')), buffer_size=4)
+    repo.write(['key'], [b'hello ', b'earth reader'])
+    chunks = [bytes(chunk) for chunk in repo.read(['key'])]
+    assert chunks == [b'hell', b'o ea', b'rth ', b'read', b'er']
+    repo.write(['empty'], [])
+    assert b''.join(repo.read(['empty'])) == b''
+    with raises(ValueError):
+        SQLiteRepository(buffer_size=0)
+
+
+def test_list(fx_repo):
+    for i in range(100):
+        fx_repo.write(['dir', 'd{0}'.format(i), 'key'], [b'value'])
+    fx_repo.write(['dir', 'file'], [b'value'])
+    assert (fx_repo.list(['dir']) ==
+            frozenset(['d{0}'.format(i) for i in range(100)] + ['file']))
+    assert fx_repo.list(['dir', 'd3']) == frozenset(['key'])
+    with raises(RepositoryKeyError):
+        fx_repo.list(['dir', 'file'])
+    with raises(RepositoryKeyError):
+        fx_repo.list(['not-exist'])
+
+
+def test_stamp(tmpdir):
+    path = str(tmpdir.join('repo.db'))
+    repo = SQLiteRepository(path)
+    repo.write(['dir', 'a'], [b'a'])
+    stamp = repo.stamp(['dir'])
+    assert stamp is not None
+    assert repo.stamp(['dir']) == stamp
+    # Keys written by other processes change the stamp as well.
+    other = SQLiteRepository(path)
+    other.write(['dir', 'b'], [b'b'])
+    assert repo.stamp(['dir']) != stamp
+    with raises(RepositoryKeyError):
+        repo.stamp(['dir', 'a'])
+    with raises(RepositoryKeyError):
+        repo.stamp(['not-exist'])
+
+
+def test_write_directory(fx_repo):
+    fx_repo.write(['dir', 'key'], [b'value'])
+    with raises(RepositoryKeyError):
+        fx_repo.write(['dir'], [b'directory cannot be overwritten'])
+    with raises(RepositoryKeyError):
+        fx_repo.read(['dir'])
+    with raises(RepositoryKeyError):
+        fx_repo.write(['dir', 'key', 'key'], [b'file is not a directory'])
+    with raises(RepositoryKeyError):
+        fx_repo.write(['dir', 'slash/key'], [b'slash is not allowed'])
+    assert not fx_repo.exists(['dir', 'slash/key'])
+
+
+def test_empty_key(fx_repo):
+    fx_repo.write(['key'], [b'value'])
+    with raises(RepositoryKeyError):
+        fx_repo.read([])
+    with raises(RepositoryKeyError):
+        fx_repo.read_many([['key'], []])
+    with raises(RepositoryKeyError):
+        fx_repo.write([], [b'value'])
+    assert fx_repo.exists_many([['key'], []]) == [True, True]
+    with raises(RepositoryKeyError):
+        fx_repo._split_key([])
+
+
+def test_write_many_transaction(fx_repo):
+    fx_repo.write(['key'], [b'first'])
+    with raises(RepositoryKeyError):
+        fx_repo.write_many([
+            (['key'], [b'second']),
+            (['new-key'], [b'new']),
+            (['key', 'key'], [b'invalid'])
+        ])
+    assert b''.join(fx_repo.read(['key'])) == b'first'
+    assert not fx_repo.exists(['new-key'])
+    fx_repo.write_many([(['key'], [b'second']), (['new-key'], [b'new'])])
+    assert b''.join(fx_repo.read(['key'])) == b'second'
+    assert b''.join(fx_repo.read(['new-key'])) == b'new'
+
+
+def test_dirty_buffer_flush(fx_repo):
+    dirty = DirtyBuffer(fx_repo, threading.RLock())
+    dirty.write(['a', 'b'], [b'ab'])
+    dirty.write(['a', 'c'], [b'ac'])
+    dirty.write(['d'], [b'd'])
+    assert sorted(dirty.flush()) == [('a', 'b'), ('a', 'c'), ('d',)]
+    assert fx_repo.list(['a']) == frozenset(['b', 'c'])
+    assert b''.join(fx_repo.read(['d'])) == b'd'
+
+
+def test_threads(fx_repo):
+    def write(i):
+        fx_repo.write(['dir', str(i)], [str(i).encode('ascii')])
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fx_repo.list(['dir']) == frozenset(str(i) for i in range(20))
+
+
+def test_read_many_batches(fx_repo):
+    fx_repo.SELECT_BATCH_SIZE = 3
+    for i in range(10):
+        fx_repo.write(['dir', str(i)], [str(i).encode()])
+    keys = [['dir', str(i)] for i in range(10)]
+    values = fx_repo.read_many(keys)
+    assert [b''.join(chunks) for chunks in values] == [
+        str(i).encode() for i in range(10)
+    ]
+    assert fx_repo.exists_many(keys + [['dir'], [], ['a/b'], ['dir', 'x']]) \
+        == [True] * 10 + [True, True, False, False]
+    with raises(RepositoryKeyError):
+        fx_repo.read_many([['dir']])
@@ -1,8 +1,11 @@
 import itertools
+import multiprocessing
 import os.path
+import stat
 import sys
 import tempfile
 import threading
+import time
 try:
     from urllib import parse as urlparse
 except ImportError:
@@ -10,10 +13,20 @@ except ImportError:
 
 from pytest import mark, raises
 
-from libearth.compat import IRON_PYTHON
+from libearth.compat import IRON_PYTHON, PY3
+from libearth.compat import inotify
 from libearth.repository import (FileIterator, FileNotFoundError,
-                                 FileSystemRepository, NotADirectoryError,
-                                 Repository, RepositoryKeyError, from_url)
+                                 FileSystemRepository, InotifyWatcher,
+                                 MappedFileIterator, NotADirectoryError,
+                                 PollingWatcher, Repository,
+                                 RepositoryKeyError, Watcher, from_url,
+                                 get_shard_name, iterate_chunks,
+                                 migrate_layout, replace_file)
+from libearth.repositories.caching import CachingRepository
+from libearth.repositories.compressed import CompressedRepository
+from libearth.repositories.dedup import DedupRepository
+from libearth.repositories.pack import PackRepository
+from libearth.repositories.sqlite import SQLiteRepository
 from libearth.stage import DirtyBuffer
 
 
@@ -156,6 +169,38 @@ def test_file_list(tmpdir):
         f.list(['not-exist'])
 
 
+def test_stamp_default():
+    repo = RepositoryImplemented()
+    assert repo.stamp(['dir']) is None
+    with raises(TypeError):
+        repo.stamp(123)
+
+
+def age_directories(path, seconds):
+    mtime = time.time() - seconds
+    for dirpath, _, _ in os.walk(path):
+        os.utime(dirpath, (mtime, mtime))
+
+
+@mark.parametrize('shard_width', [None, 2])
+def test_file_stamp(tmpdir, shard_width):
+    f = FileSystemRepository(str(tmpdir), shard_width=shard_width)
+    f.write(['dir', 'a'], [b'a'])
+    # Just modified directories can't be stamped
+    assert f.stamp(['dir']) is None
+    age_directories(str(tmpdir), 60)
+    stamp = f.stamp(['dir'])
+    assert stamp is not None
+    assert f.stamp(['dir']) == stamp
+    f.write(['dir', 'a'], [b'updated'])
+    age_directories(str(tmpdir), 60)
+    f.write(['dir', 'b'], [b'b'])
+    age_directories(str(tmpdir), 30)
+    assert f.stamp(['dir']) not in (None, stamp)
+    with raises(RepositoryKeyError):
+        f.stamp(['not-exist'])
+
+
 def test_file_not_found(tmpdir):
     path = tmpdir.join('not-exist')
     with raises(FileNotFoundError):
@@ -173,8 +218,16 @@ def test_not_dir(tmpdir):
 
 def repositories():
     yield FileSystemRepository(tempfile.mkdtemp())
+    if not IRON_PYTHON:
+        yield FileSystemRepository(tempfile.mkdtemp(), mmap_threshold=0)
+    yield FileSystemRepository(tempfile.mkdtemp(), shard_width=2)
     yield DirtyBuffer(FileSystemRepository(tempfile.mkdtemp()),
                       threading.RLock())
+    yield PackRepository(tempfile.mkdtemp())
+    yield CompressedRepository(FileSystemRepository(tempfile.mkdtemp()))
+    yield CachingRepository(FileSystemRepository(tempfile.mkdtemp()))
+    yield DedupRepository(tempfile.mkdtemp())
+    yield SQLiteRepository()
 
 
 @mark.parametrize('repository', list(repositories()))
@@ -213,6 +266,109 @@ def test_repository(repository):
         repository.list(['key'])
 
 
+@mark.parametrize('repository', list(repositories()))
+def test_repository_read_many(repository):
+    with raises(TypeError):
+        repository.read_many(None)
+    with raises(TypeError):
+        repository.exists_many(None)
+    keys = [['key{0}'.format(i)] for i in range(20)] + [['dir', 'key']]
+    for key in keys:
+        repository.write(key, [b'/'.join(k.encode() for k in key)])
+    values = repository.read_many(reversed(keys))
+    assert [b''.join(chunks) for chunks in values] == [
+        b'/'.join(k.encode() for k in key) for key in reversed(keys)
+    ]
+    assert repository.read_many([]) == []
+    with raises(RepositoryKeyError):
+        repository.read_many([['key0'], ['nonexistent']])
+    with raises(RepositoryKeyError):
+        repository.read_many([['key0'], []])
+    assert repository.exists_many(
+        [['key3'], ['nonexistent'], ['dir'], ['dir', 'key'], ['dir', 'no']]
+    ) == [True, False, True, True, False]
+
+
+def test_file_read_many(tmpdir):
+    repo = FileSystemRepository(str(tmpdir), buffer_size=2)
+    repo.pool_size = 3
+    for i in range(10):
+        repo.write(['key{0}'.format(i)], [str(i).encode() * 5])
+    values = repo.read_many(['key{0}'.format(i)] for i in range(10))
+    assert [b''.join(chunks) for chunks in values] == [
+        str(i).encode() * 5 for i in range(10)
+    ]
+    with raises(RepositoryKeyError):
+        repo.read_many([['key0'], ['key1', 'nonexistent']])
+    single, = repo.read_many([['key0']])
+    assert isinstance(single, FileIterator)
+    assert b''.join(single) == b'00000'
+
+
+@mark.parametrize('repository', list(repositories()))
+def test_repository_watch(repository):
+    with raises(TypeError):
+        repository.watch(None)
+    repository.write(['dir', 'old'], [b'old'])
+    with repository.watch(['dir'], interval=0.01) as watcher:
+        assert isinstance(watcher, Watcher)
+        assert watcher.poll(timeout=0.05) == []
+        repository.write(['dir', 'new'], [b'new'])
+        repository.write(['other'], [b'other'])
+        assert watcher.poll(timeout=5) == [['dir', 'new']]
+        repository.write(['dir', 'old'], [b'updated'])
+        assert next(watcher) == ['dir', 'old']
+    assert watcher.closed
+    assert list(watcher) == []
+
+
+@mark.skipif('not inotify.available')
+@mark.parametrize('shard_width', [None, 2])
+def test_inotify_watcher(tmpdir, shard_width):
+    repo = FileSystemRepository(str(tmpdir), shard_width=shard_width)
+    repo.write(['a', 'b'], [b'b'])
+    watcher = repo.watch([])
+    assert isinstance(watcher, InotifyWatcher)
+    repo.write(['a', 'b'], [b'updated'])
+    assert watcher.poll(timeout=5) == [['a', 'b']]
+    repo.write(['x', 'y', 'z'], [b'new directories'])
+    assert watcher.poll(timeout=5) == [['x', 'y', 'z']]
+    repo.write(['x', 'y', 'w'], [b'watched'])
+    assert watcher.poll(timeout=5) == [['x', 'y', 'w']]
+    os.remove(repo.get_path(['a', 'b']))
+    assert watcher.poll(timeout=5) == [['a', 'b']]
+    assert watcher.poll(timeout=0.01) == []
+    with raises(NotADirectoryError):
+        InotifyWatcher(repo, ['x', 'y', 'z'])
+    keys = []
+
+    def consume():
+        keys.extend(watcher)
+    thread = threading.Thread(target=consume)
+    thread.start()
+    repo.write(['x', 'y', 'z'], [b'updated'])
+    for _ in range(500):
+        if keys:
+            break
+        time.sleep(0.01)
+    watcher.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert keys == [['x', 'y', 'z']]
+
+
+def test_file_watch_polling(tmpdir, monkeypatch):
+    monkeypatch.setattr(inotify, 'available', False)
+    repo = FileSystemRepository(str(tmpdir))
+    repo.write(['a', 'b'], [b'b'])
+    repo.write(['a', 'c'], [b'c'])
+    with repo.watch(['a'], interval=0.01) as watcher:
+        assert isinstance(watcher, PollingWatcher)
+        repo.write(['a', 'b'], [b'updated'])
+        os.remove(repo.get_path(['a', 'c']))
+        assert watcher.poll(timeout=5) == [['a', 'b'], ['a', 'c']]
+
+
 def test_atomicity(tmpdir):
     repo = FileSystemRepository(str(tmpdir), atomic=True)
     repo.write(['key'], [b'first ', b'revision'])
@@ -227,6 +383,267 @@ def test_atomicity(tmpdir):
     assert b''.join(repo.read(['key'])) == b'second revision'
 
 
+def test_atomic_write_same_directory(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    repo.write(['dir', 'key'], [b'first revision'])
+    tmpdir.join('dir', 'key').chmod(0o640)
+
+    def gen():
+        names = os.listdir(str(tmpdir.join('dir')))
+        assert len(names) == 2
+        assert any(name.endswith(repo.TEMPORARY_SUFFIX) for name in names)
+        assert repo.list(['dir']) == frozenset(['key'])
+        yield b'second revision'
+    repo.write(['dir', 'key'], gen())
+    assert os.listdir(str(tmpdir.join('dir'))) == ['key']
+    assert b''.join(repo.read(['dir', 'key'])) == b'second revision'
+    if sys.platform != 'win32':
+        assert tmpdir.join('dir', 'key').stat().mode & 0o777 == 0o640
+
+
+def test_atomic_write_failure(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    repo.write(['key'], [b'first revision'])
+
+    def gen():
+        yield b'second '
+        raise ZeroDivisionError()
+    with raises(ZeroDivisionError):
+        repo.write_many([(['key2'], [b'other']), (['key'], gen())])
+    assert os.listdir(str(tmpdir)) == ['key']
+    assert b''.join(repo.read(['key'])) == b'first revision'
+
+
+@mark.skipif('sys.platform == "win32"',
+             reason='file modes are not supported on Windows')
+def test_write_file_mode(tmpdir):
+    repo = FileSystemRepository(str(tmpdir), shard_width=1)
+    repo.write(['dir', 'key'], [b'value'])
+    plain = tmpdir.join('plain')
+    plain.write('value')
+    expected = stat.S_IMODE(os.stat(str(plain)).st_mode)
+    path = repo.get_path(['dir', 'key'])
+    assert stat.S_IMODE(os.stat(path).st_mode) == expected
+    os.chmod(path, 0o640)
+    repo.write(['dir', 'key'], [b'updated'])
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+@mark.skipif('IRON_PYTHON')
+def test_write_many_fsync(tmpdir, monkeypatch):
+    repo = FileSystemRepository(str(tmpdir), fsync=True)
+    synced = []
+    original_fsync = os.fsync
+
+    def fsync(fd):
+        synced.append(os.path.isdir('/proc/self/fd/{0}'.format(fd))
+                      if os.path.isdir('/proc/self/fd') else None)
+        original_fsync(fd)
+    monkeypatch.setattr(os, 'fsync', fsync)
+    repo.write_many([
+        (['dir', 'a'], [b'a']),
+        (['dir', 'b'], [b'b']),
+        (['dir', 'c'], [b'c'])
+    ])
+    assert repo.list(['dir']) == frozenset(['a', 'b', 'c'])
+    assert b''.join(repo.read(['dir', 'b'])) == b'b'
+    if sys.platform == 'win32':
+        assert len(synced) == 3
+    else:
+        # 3 files, the dir, and the root which the dir was created in
+        assert len(synced) == 5
+        if synced[0] is not None:
+            assert synced == [False, False, False, True, True]
+
+
+def test_write_many(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    repo.write_many([(['a'], [b'a']), (['dir', 'b'], [b'b', b'b'])])
+    assert b''.join(repo.read(['a'])) == b'a'
+    assert b''.join(repo.read(['dir', 'b'])) == b'bb'
+    with raises(TypeError):
+        repo.write_many(None)
+    with raises(RepositoryKeyError):
+        repo.write_many([([], [b'empty key'])])
+    r2 = RepositoryImplemented()
+    r2.write_many([(['key'], [b''])])
+
+
+def test_sharded_layout(tmpdir):
+    repo = FileSystemRepository(str(tmpdir), shard_width=2)
+    for i in range(50):
+        repo.write(['feeds', 'feed{0}.xml'.format(i)], [b'feed'])
+    repo.write(['key'], [b'value'])
+    shard = get_shard_name('feeds', 2)
+    assert len(shard) == 2
+    assert tmpdir.join(shard, 'feeds').check(dir=True)
+    assert repo.get_path(['feeds', 'feed0.xml']) == str(tmpdir.join(
+        shard, 'feeds', get_shard_name('feed0.xml', 2), 'feed0.xml'
+    ))
+    assert 1 < len(tmpdir.join(shard, 'feeds').listdir()) <= 50
+    assert repo.list([]) == frozenset(['feeds', 'key'])
+    assert repo.list(['feeds']) == frozenset(
+        'feed{0}.xml'.format(i) for i in range(50)
+    )
+    assert b''.join(repo.read(['feeds', 'feed3.xml'])) == b'feed'
+    assert repo.exists(['feeds', 'feed3.xml'])
+    assert not repo.exists(['feeds', 'feed50.xml'])
+    # The layout is detected from the existing repository.
+    reopened = FileSystemRepository(str(tmpdir))
+    assert reopened.shard_width == 2
+    assert b''.join(reopened.read(['key'])) == b'value'
+    name = b'\xec\x96\xb4\xec\x8a\xa4'
+    assert get_shard_name(name.decode('utf-8'), 3) == \
+        get_shard_name(name, 3)
+
+
+def test_shard_width_mismatch(tmpdir):
+    FileSystemRepository(str(tmpdir), shard_width=2)
+    with raises(ValueError):
+        FileSystemRepository(str(tmpdir), shard_width=3)
+    flat = tmpdir.mkdir('flat')
+    FileSystemRepository(str(flat)).write(['key'], [b'value'])
+    with raises(ValueError):
+        FileSystemRepository(str(flat), shard_width=2)
+    with raises(ValueError):
+        FileSystemRepository(str(tmpdir.mkdir('empty')), shard_width=0)
+
+
+def test_migrate_layout(tmpdir):
+    path = str(tmpdir.join('repo'))
+    flat = FileSystemRepository(path)
+    flat.write(['key'], [b'value'])
+    for i in range(10):
+        flat.write(['feeds', 'feed{0}.xml'.format(i)], [str(i).encode()])
+    sharded = migrate_layout(path, shard_width=1)
+    assert sharded.shard_width == 1
+    assert sharded.list([]) == frozenset(['feeds', 'key'])
+    assert len(sharded.list(['feeds'])) == 10
+    assert b''.join(sharded.read(['feeds', 'feed7.xml'])) == b'7'
+    assert not tmpdir.join('repo', 'key').check()
+    assert sorted(p.basename for p in tmpdir.listdir()) == ['repo']
+    assert migrate_layout(path, shard_width=1).shard_width == 1
+    flat = migrate_layout(path)
+    assert flat.shard_width is None
+    assert sorted(os.listdir(path)) == ['feeds', 'key']
+    assert b''.join(flat.read(['feeds', 'feed7.xml'])) == b'7'
+
+
+def test_migrate_layout_hidden_files(tmpdir):
+    path = str(tmpdir.join('repo'))
+    flat = FileSystemRepository(path)
+    flat.write(['.validators', 'feed.xml'], [b'etag'])
+    flat.write(['.favicons'], [b'icons'])
+    sharded = migrate_layout(path, shard_width=1)
+    assert sharded.list([]) == frozenset(['.validators', '.favicons'])
+    assert b''.join(sharded.read(['.validators', 'feed.xml'])) == b'etag'
+    assert sorted(p.basename for p in tmpdir.listdir()) == ['repo']
+    flat = migrate_layout(path)
+    assert sorted(os.listdir(path)) == ['.favicons', '.validators']
+    assert b''.join(flat.read(['.favicons'])) == b'icons'
+
+
+def test_migrate_layout_leftovers(tmpdir):
+    path = str(tmpdir.join('repo'))
+    sharded = FileSystemRepository(path, shard_width=1)
+    sharded.write(['key'], [b'value'])
+    tmpdir.join('repo', 'unknown.txt').write('unknown')
+    with raises(OSError):
+        migrate_layout(path)
+    flat = FileSystemRepository(path)
+    assert flat.shard_width is None
+    assert b''.join(flat.read(['key'])) == b'value'
+    backup = tmpdir.join('repo.libearth-old')
+    assert [p.basename for p in backup.listdir()] == ['unknown.txt']
+    assert backup.join('unknown.txt').read() == 'unknown'
+
+
+def test_lock_keys_default():
+    repo = RepositoryImplemented()
+    with repo.lock_keys([['key'], ['dir']]):
+        pass
+    with raises(TypeError):
+        repo.lock_keys(123)
+    with FileSystemRepository(tempfile.mkdtemp()).lock_keys([['key']]):
+        pass
+
+
+def hold_lock(repo, keys, acquired, release):
+    with repo.lock_keys(keys):
+        acquired.set()
+        release.wait(5)
+
+
+@mark.skipif('sys.platform == "win32"', reason='fcntl is unavailable')
+@mark.parametrize(('locked', 'conflicting', 'blocked'), [
+    ([['a', 'b']], [['a', 'b']], True),
+    ([['a', 'b']], [['a']], True),
+    ([['a']], [['a', 'b', 'c']], True),
+    ([['a', 'b']], [['a', 'c']], False),
+    ([['a', 'b'], ['x']], [['y'], ['x']], True)
+])
+def test_file_lock_keys(tmpdir, locked, conflicting, blocked):
+    repo = FileSystemRepository(str(tmpdir), process_lock=True,
+                                shard_width=2)
+    # Avoid false sharing of lock files so that the result is predictable.
+    repo.lock_stripes = 2 ** 32
+    repo.write(['a', 'b'], [b'value'])
+    acquired = threading.Event()
+    release = threading.Event()
+    with repo.lock_keys(locked):
+        thread = threading.Thread(target=hold_lock,
+                                  args=(repo, conflicting, acquired, release))
+        thread.start()
+        acquired.wait(0.2)
+        assert acquired.is_set() != blocked
+    acquired.wait(5)
+    assert acquired.is_set()
+    release.set()
+    thread.join()
+    assert repo.list([]) == frozenset(['a'])
+    assert repo.list(['a']) == frozenset(['b'])
+
+
+def increment_counter(path, times):
+    repo = FileSystemRepository(path, process_lock=True)
+    for _ in range(times):
+        with repo.lock_keys([['counter']]):
+            value = int(b''.join(repo.read(['counter'])))
+            repo.write(['counter'], [str(value + 1).encode('ascii')])
+
+
+@mark.skipif('sys.platform == "win32"', reason='fcntl is unavailable')
+def test_file_lock_keys_processes(tmpdir):
+    path = str(tmpdir)
+    FileSystemRepository(path).write(['counter'], [b'0'])
+    processes = [multiprocessing.Process(target=increment_counter,
+                                         args=(path, 50))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    repo = FileSystemRepository(path)
+    assert b''.join(repo.read(['counter'])) == b'200'
+
+
+def test_iterate_chunks():
+    assert [bytes(c) for c in iterate_chunks(b'abcde', 2)] == [
+        b'ab', b'cd', b'e'
+    ]
+    assert list(iterate_chunks(b'', 2)) == []
+
+
+def test_replace_file(tmpdir):
+    src = tmpdir.join('src')
+    dst = tmpdir.join('dst')
+    src.write('new')
+    dst.write('old')
+    replace_file(str(src), str(dst))
+    assert not src.check()
+    assert dst.read() == 'new'
+
+
 def test_file_iterator(tmpdir):
     f = tmpdir.join('test.txt')
     f.write('hello earth reader')
@@ -240,9 +657,85 @@ def test_file_iterator(tmpdir):
     assert it.file_.closed
 
 
+def test_file_iterator_adaptive(tmpdir):
+    f = tmpdir.join('test.txt')
+    f.write('0123456789' * 5)
+    chunks = list(FileIterator(str(f), 2, max_buffer_size=16))
+    assert [len(chunk) for chunk in chunks] == [2, 4, 8, 16, 16, 4]
+    assert b''.join(chunks) == b'0123456789' * 5
+    mapped = list(MappedFileIterator(str(f), 2, max_buffer_size=16))
+    assert [len(chunk) for chunk in mapped] == [2, 4, 8, 16, 16, 4]
+    it = FileIterator(str(f), 4)
+    assert next(it) == b'0123'
+    it.close()
+    assert it.file_.closed
+    with raises(StopIteration):
+        next(it)
+
+
+def test_file_iterator_reuse_buffer(tmpdir):
+    f = tmpdir.join('test.txt')
+    f.write('hello earth reader')
+    it = iter(FileIterator(str(f), 5, max_buffer_size=8, reuse_buffer=True))
+    first = next(it)
+    assert bytes(first) == b'hello'
+    second = next(it)
+    assert bytes(second) == b' earth r'
+    if PY3:
+        assert isinstance(first, memoryview)
+        # The buffer is reused, so the first chunk is overwritten.
+        assert bytes(first) == b' eart'
+    assert bytes(next(it)) == b'eader'
+    with raises(StopIteration):
+        next(it)
+    # Repositories never reuse buffers, since consumers of read() are
+    # allowed to keep chunks e.g. by joining them.
+    repo = FileSystemRepository(str(tmpdir), buffer_size=1,
+                                max_buffer_size=4)
+    chunks = list(repo.read(['test.txt']))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert b''.join(chunks) == b'hello earth reader'
+    assert b''.join(repo.read(['test.txt'])) == b'hello earth reader'
+
+
+def test_mapped_file_iterator(tmpdir):
+    f = tmpdir.join('test.txt')
+    f.write('hello earth reader')
+    it = iter(MappedFileIterator(str(f), 5))
+    chunks = list(it)
+    if PY3:
+        assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert [bytes(chunk) for chunk in chunks] == [
+        b'hello', b' eart', b'h rea', b'der'
+    ]
+    assert it.closed
+    with raises(StopIteration):
+        next(it)
+    empty = tmpdir.join('empty.txt')
+    empty.write('')
+    assert list(MappedFileIterator(str(empty), 5)) == []
+
+
+@mark.skipif('IRON_PYTHON')
+def test_file_read_mmap_threshold(tmpdir):
+    repo = FileSystemRepository(str(tmpdir), buffer_size=3,
+                                mmap_threshold=10)
+    repo.write(['small'], [b'small'])
+    repo.write(['large'], [b'large file content'])
+    small = repo.read(['small'])
+    large = repo.read(['large'])
+    assert type(small) is FileIterator
+    assert isinstance(large, MappedFileIterator)
+    assert b''.join(small) == b'small'
+    assert b''.join(large) == b'large file content'
+    with raises(ValueError):
+        FileSystemRepository(str(tmpdir), buffer_size=0)
+
+
 @mark.skipif('IRON_PYTHON')  # FIXME: make it to work on IronPython as well
-def test_read_write_same_file(tmpdir):
-    repo = FileSystemRepository(str(tmpdir))
+@mark.parametrize('mmap_threshold', [None, 0])
+def test_read_write_same_file(mmap_threshold, tmpdir):
+    repo = FileSystemRepository(str(tmpdir), mmap_threshold=mmap_threshold)
     repo.write(['key'], itertools.repeat(b'first revision\n', 1024))
     first_iterator = iter(repo.read(['key']))
     second_iterator = iter(repo.read(['key']))
@@ -0,0 +1,198 @@
+import datetime
+
+from pytest import mark, raises
+
+from libearth.crawler import CrawlError, CrawlResult
+from libearth.feed import Entry, Feed, Text
+from libearth.repository import FileSystemRepository
+from libearth.schedule import (DEFAULT_INTERVAL, MAX_INTERVAL, MIN_INTERVAL,
+                               FeedScheduler, estimate_interval,
+                               get_hinted_interval, skip_hinted_times)
+from libearth.tz import FixedOffset, utc
+
+
+def make_feed(*hours):
+    base = datetime.datetime(2013, 8, 1, tzinfo=utc)
+    return Feed(
+        id='urn:earthreader:test',
+        title=Text(value='Test'),
+        updated_at=base,
+        entries=[
+            Entry(id='urn:earthreader:test:{0}'.format(i),
+                  title=Text(value='Entry {0}'.format(i)),
+                  updated_at=base + datetime.timedelta(hours=hour))
+            for i, hour in enumerate(hours)
+        ]
+    )
+
+
+def test_estimate_interval():
+    assert estimate_interval(make_feed(0, 6, 12, 18).entries) == \
+        datetime.timedelta(hours=6)
+    assert estimate_interval(make_feed(30, 0, 10, 20).entries) == \
+        datetime.timedelta(hours=10)
+    assert estimate_interval(make_feed(0, 1, 2, 20, 30).entries,
+                             samples=3) == datetime.timedelta(hours=14)
+    assert estimate_interval(make_feed(0).entries) is None
+    assert estimate_interval(make_feed(5, 5).entries) is None
+    assert estimate_interval([]) is None
+
+
+@mark.parametrize(('hints', 'interval'), [
+    (None, None),
+    ({}, None),
+    ({'skipHours': frozenset([1])}, None),
+    ({'ttl': 90}, datetime.timedelta(minutes=90)),
+    ({'updatePeriod': 'daily'}, datetime.timedelta(days=1)),
+    ({'updatePeriod': 'hourly', 'updateFrequency': 4},
+     datetime.timedelta(minutes=15)),
+    ({'ttl': 60, 'updatePeriod': 'daily', 'updateFrequency': 2},
+     datetime.timedelta(hours=12)),
+])
+def test_get_hinted_interval(hints, interval):
+    assert get_hinted_interval(hints) == interval
+
+
+def test_skip_hinted_times():
+    # 2013-08-02 is Friday.
+    when = datetime.datetime(2013, 8, 2, 22, 30, tzinfo=utc)
+    assert skip_hinted_times(when, None) is when
+    assert skip_hinted_times(when, {'ttl': 60}) is when
+    assert skip_hinted_times(when, {'skipHours': frozenset([1])}) is when
+    assert skip_hinted_times(when, {'skipHours': frozenset([22, 23])}) == \
+        datetime.datetime(2013, 8, 3, 0, tzinfo=utc)
+    hints = {'skipHours': frozenset([22, 23]),
+             'skipDays': frozenset(['Saturday', 'Sunday'])}
+    assert skip_hinted_times(when, hints) == \
+        datetime.datetime(2013, 8, 5, 0, tzinfo=utc)
+    kst = FixedOffset(9 * 60)
+    postponed = skip_hinted_times(when.astimezone(kst), hints)
+    assert postponed.tzinfo is kst
+    assert postponed == datetime.datetime(2013, 8, 5, 0, tzinfo=utc)
+    # Every hour is excluded; gives up.
+    hints = {'skipHours': frozenset(range(24))}
+    assert skip_hinted_times(when, hints) == \
+        when.replace(minute=0) + datetime.timedelta(days=7)
+
+
+def test_feed_scheduler():
+    now = datetime.datetime(2013, 8, 2, 12, tzinfo=utc)
+    scheduler = FeedScheduler()
+    assert len(scheduler) == 0
+    scheduler.add('http://a.com/', now)
+    scheduler.add('http://b.com/', now - datetime.timedelta(minutes=1))
+    scheduler.add('http://c.com/', now + datetime.timedelta(minutes=1))
+    assert len(scheduler) == 3
+    assert 'http://a.com/' in scheduler
+    assert scheduler.due_feeds(now) == ['http://b.com/', 'http://a.com/']
+    assert scheduler.due_feeds() == ['http://b.com/', 'http://a.com/',
+                                     'http://c.com/']
+    # Crawled twice as often as entries are published.
+    due = scheduler.update(
+        CrawlResult('http://a.com/', make_feed(0, 6, 12), None), now
+    )
+    assert due == now + datetime.timedelta(hours=3)
+    assert scheduler.get_next_due('http://a.com/') == due
+    # Hints are respected.
+    due = scheduler.update(
+        CrawlResult('http://b.com/', make_feed(0, 6, 12), {'ttl': 240}), now
+    )
+    assert due == now + datetime.timedelta(hours=4)
+    # Bounded by min_interval and max_interval.
+    due = scheduler.update(
+        CrawlResult('http://c.com/', make_feed(0, 0.1), None), now
+    )
+    assert due == now + MIN_INTERVAL
+    due = scheduler.update(
+        CrawlResult('http://c.com/', make_feed(0, 100), None), now
+    )
+    assert due == now + MAX_INTERVAL
+    # Backs off when not modified or failed.
+    due = scheduler.update(
+        CrawlResult('http://a.com/', None, None, not_modified=True), now
+    )
+    assert due == now + datetime.timedelta(hours=6)
+    due = scheduler.update(CrawlError('http://a.com/', 'error'), now)
+    assert due == now + datetime.timedelta(hours=12)
+    due = scheduler.update(
+        CrawlResult('http://d.com/', make_feed(0), None), now
+    )
+    assert due == now + DEFAULT_INTERVAL
+    assert scheduler.due_feeds(now + datetime.timedelta(hours=4)) == \
+        ['http://d.com/', 'http://b.com/']
+    scheduler.remove('http://d.com/')
+    assert 'http://d.com/' not in scheduler
+    with raises(KeyError):
+        scheduler.get_next_due('http://d.com/')
+    with raises(TypeError):
+        scheduler.update('http://a.com/')
+
+
+def test_feed_scheduler_skip_hints():
+    now = datetime.datetime(2013, 8, 2, 12, tzinfo=utc)
+    scheduler = FeedScheduler()
+    hints = {'skipHours': frozenset([15, 16])}
+    due = scheduler.update(
+        CrawlResult('http://a.com/', make_feed(0, 6, 12), hints), now
+    )
+    assert due == datetime.datetime(2013, 8, 2, 17, tzinfo=utc)
+
+
+def test_feed_scheduler_keeps_hints():
+    now = datetime.datetime(2013, 8, 2, 0, tzinfo=utc)
+    scheduler = FeedScheduler()
+    hints = {'skipHours': frozenset(range(23)), 'ttl': 30,
+             'updateBase': now}
+    due = scheduler.update(
+        CrawlResult('http://a.com/', make_feed(0, 6, 12), hints), now
+    )
+    assert due == datetime.datetime(2013, 8, 2, 23, tzinfo=utc)
+    # Hints of the last successful crawl are still respected.
+    due = scheduler.update(
+        CrawlResult('http://a.com/', None, None, not_modified=True), now
+    )
+    assert due == datetime.datetime(2013, 8, 2, 23, tzinfo=utc)
+    due = scheduler.update(CrawlError('http://a.com/', 'error'), now)
+    assert due == datetime.datetime(2013, 8, 2, 23, tzinfo=utc)
+    # New hints replace old ones.
+    due = scheduler.update(
+        CrawlResult('http://a.com/', make_feed(0, 6, 12), None), now
+    )
+    assert due == now + datetime.timedelta(hours=3)
+
+
+def test_feed_scheduler_naive_datetime():
+    scheduler = FeedScheduler()
+    with raises(ValueError):
+        scheduler.add('http://a.com/', datetime.datetime(2000, 1, 1))
+    assert 'http://a.com/' not in scheduler
+    with raises(ValueError):
+        scheduler.update(CrawlError('http://a.com/', 'error'),
+                         datetime.datetime(2000, 1, 1))
+    assert 'http://a.com/' not in scheduler
+
+
+def test_feed_scheduler_persistence(tmpdir):
+    repo = FileSystemRepository(str(tmpdir))
+    with raises(TypeError):
+        FeedScheduler(repo)
+    with raises(ValueError):
+        FeedScheduler(min_interval=MAX_INTERVAL, max_interval=MIN_INTERVAL)
+    with raises(TypeError):
+        FeedScheduler().save()
+    now = datetime.datetime(2013, 8, 2, 12, 0, 0, 123, tzinfo=utc)
+    scheduler = FeedScheduler(repo, ['schedule'])
+    scheduler.add('http://a.com/', now)
+    scheduler.update(CrawlResult('http://b.com/', make_feed(0, 6), None), now)
+    hints = {'skipHours': frozenset([15, 16]),
+             'skipDays': frozenset(['Sunday']),
+             'ttl': 60, 'updatePeriod': 'daily', 'updateFrequency': 2}
+    scheduler.update(CrawlResult('http://c.com/', make_feed(0, 6), hints),
+                     now)
+    scheduler.save()
+    loaded = FeedScheduler(repo, ['schedule'])
+    assert len(loaded) == 3
+    assert loaded.get_next_due('http://a.com/') == now
+    assert loaded.get_next_due('http://b.com/') == \
+        now + datetime.timedelta(hours=3)
+    assert loaded.schedule == scheduler.schedule
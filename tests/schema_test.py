@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import collections
+import pickle
 
 from pytest import fixture, mark, raises
 
@@ -467,6 +468,24 @@ def test_complete(fx_test_doc):
     assert not is_partially_loaded(doc)
 
 
+def test_element_pickle(fx_test_doc):
+    doc, _ = fx_test_doc
+    loaded = pickle.loads(pickle.dumps(doc, pickle.HIGHEST_PROTOCOL))
+    assert isinstance(loaded, TestDoc)
+    assert not is_partially_loaded(loaded)
+    assert loaded.attr_attr == doc.attr_attr
+    assert loaded.title_attr.value == doc.title_attr.value
+    assert [e.value for e in loaded.multi_attr] == ['a', 'b', 'c']
+    assert list(loaded.text_multi_attr) == ['a', 'b']
+    assert loaded.ns_element_attr.ns_attr_attr == 'namespace attribute value'
+    assert list(write(loaded, canonical_order=True, hints=False)) == \
+        list(write(doc, canonical_order=True, hints=False))
+    # Hints are kept as well.
+    assert doc._hints
+    assert list(write(loaded, canonical_order=True)) == \
+        list(write(doc, canonical_order=True))
+
+
 @fixture
 def fx_adhoc_element_type():
 
@@ -1,15 +1,18 @@
 import collections
+import copy
 import io
 import logging
+import sys
 import threading
 
-from pytest import fixture, raises
+from pytest import fixture, mark, raises
 
 from libearth.compat import IRON_PYTHON, binary_type
 from libearth.repository import (FileSystemRepository, Repository,
                                  RepositoryKeyError)
-from libearth.schema import read
-from libearth.session import MergeableDocumentElement, Session
+from libearth.schema import read, write
+from libearth.session import (MergeableDocumentElement, RevisionSet,
+                              Session)
 from libearth.stage import (BaseStage, Directory, DirtyBuffer, Route,
                             TransactionError, compile_format_to_pattern)
 from libearth.tz import now
@@ -180,7 +183,7 @@ class TestRepository(MemoryRepository):
     }
 
     def __init__(self):
-        self.data = dict(self.DATA)
+        self.data = copy.deepcopy(self.DATA)
 
 
 @fixture
@@ -365,3 +368,264 @@ def test_doubly_begun_transaction(fx_stage):
         with raises(TransactionError):
             with fx_stage:
                 pass
+
+
+def test_route_key_patterns():
+    route = TestStage.deep_docs
+    assert len(route.key_patterns) == len(route.key_spec)
+    assert route.key_patterns[1].match('preabc').group(1) == 'abc'
+    assert route.key_patterns[2].match('xyzpost').group(1) == 'xyz'
+    assert compile_format_to_pattern('pre{0}') is route.key_patterns[1]
+
+
+class StampedRepository(TestRepository):
+
+    def __init__(self):
+        super(StampedRepository, self).__init__()
+        self.list_calls = 0
+        self.stamps = {}
+
+    def list(self, key):
+        self.list_calls += 1
+        return super(StampedRepository, self).list(key)
+
+    def stamp(self, key):
+        return self.stamps.get(tuple(key), 0)
+
+
+def test_directory_index_cache(fx_session):
+    repo = StampedRepository()
+    stage = TestStage(fx_session, repo)
+    with stage:
+        assert len(stage.dir_docs) == 2
+        calls = repo.list_calls
+        assert len(stage.dir_docs) == 2
+        assert list(stage.dir_docs) == ['abc', 'def']
+        assert repo.list_calls == calls
+        stage.dir_docs['aaa'] = TestDoc()
+        stage.dir_docs['ghi'] = TestDoc()
+    assert repo.list_calls == calls
+    with stage:
+        assert list(stage.dir_docs) == ['aaa', 'abc', 'def', 'ghi']
+        assert len(stage.dir_docs) == 4
+        assert repo.list_calls == calls
+        assert stage.dir_docs['ghi'].__revision__.session is fx_session
+    # Stamp changed by others
+    repo.data['dir']['jkl'] = {'OTHER.xml': b'<test />'}
+    repo.stamps[('dir',)] = 1
+    calls = repo.list_calls
+    with stage:
+        assert list(stage.dir_docs) == ['aaa', 'abc', 'def', 'ghi', 'jkl']
+        assert repo.list_calls == calls + 1
+
+
+def test_directory_index_unstamped(fx_session):
+    repo = StampedRepository()
+    repo.stamp = lambda key: None
+    stage = TestStage(fx_session, repo)
+    with stage:
+        assert len(stage.dir_docs) == 2
+    repo.data['dir']['jkl'] = {'OTHER.xml': b'<test />'}
+    with stage:
+        assert len(stage.dir_docs) == 3
+
+
+def test_directory_index_rollback(fx_stage):
+    with fx_stage:
+        assert len(fx_stage.dir_docs) == 2
+    with raises(ZeroDivisionError):
+        with fx_stage:
+            fx_stage.dir_docs['ghi'] = TestDoc()
+            1 / 0
+    with fx_stage:
+        assert list(fx_stage.dir_docs) == ['abc', 'def']
+
+
+def test_directory_index_invalidate(fx_stage, fx_other_stage):
+    with fx_stage:
+        assert len(fx_stage.dir_docs) == 2
+        assert len(fx_stage.deep_docs['abc']) == 2
+    with fx_other_stage:
+        fx_other_stage.dir_docs['ghi'] = TestDoc()
+        fx_other_stage.deep_docs['abc']['zzz'] = TestDoc()
+    with fx_stage:
+        assert list(fx_stage.dir_docs) == ['abc', 'def', 'ghi']
+        assert list(fx_stage.deep_docs['abc']) == ['xxx', 'xyz', 'zzz']
+    indices = fx_stage.directory_indices
+    assert (('dir2', 'preabc'), '{1}post') in indices
+    fx_stage.invalidate_directory_indices(['dir2', 'preabc'])
+    assert (('dir2', 'preabc'), '{1}post') not in indices
+    assert (('dir',), '{0}') in indices
+    with fx_stage:
+        assert list(fx_stage.deep_docs['abc']) == ['xxx', 'xyz', 'zzz']
+    fx_stage.invalidate_directory_indices()
+    assert not indices
+    with fx_stage:
+        assert list(fx_stage.dir_docs) == ['abc', 'def', 'ghi']
+
+
+def test_directory_paginate(fx_stage):
+    with fx_stage:
+        for index in ['ghi', 'aaa', 'jkl']:
+            fx_stage.dir_docs[index] = TestDoc()
+    with fx_stage:
+        dir = fx_stage.dir_docs
+        assert dir.paginate() == ['aaa', 'abc', 'def', 'ghi', 'jkl']
+        assert dir.paginate(limit=2) == ['aaa', 'abc']
+        assert dir.paginate(2, 2) == ['def', 'ghi']
+        assert dir.paginate(4, 2) == ['jkl']
+        assert dir.paginate(5) == []
+        with raises(ValueError):
+            dir.paginate(-1)
+        with raises(ValueError):
+            dir.paginate(0, -1)
+
+
+def test_apply_changes(fx_session, fx_stage, fx_repo):
+    with fx_stage:
+        assert list(fx_stage.dir_docs) == ['abc', 'def']
+        assert list(fx_stage.deep_docs) == ['abc', 'def']
+    # Changes made by other processes
+    fx_repo.write(['dir', 'ghi', 'OTHER.xml'], [b'<test />'])
+    del fx_repo.data['dir2']['predef']
+    fx_stage.apply_changes([['dir', 'ghi', 'OTHER.xml'],
+                            ['dir2', 'predef', 'xyzpost', 'SESSID.xml']])
+    assert (('dir',), '{0}') in fx_stage.directory_indices
+    with fx_stage:
+        assert list(fx_stage.dir_docs) == ['abc', 'def', 'ghi']
+        assert list(fx_stage.deep_docs) == ['abc']
+
+
+class ReadManyCountingRepository(TestRepository):
+
+    def __init__(self):
+        super(ReadManyCountingRepository, self).__init__()
+        self.read_calls = []
+
+    def read(self, key):
+        self.read_calls.append(None)
+        return super(ReadManyCountingRepository, self).read(key)
+
+    def read_many(self, keys):
+        super(ReadManyCountingRepository, self).read_many(keys)
+        keys = list(keys)
+        self.read_calls.append(len(keys))
+        return [MemoryRepository.read(self, key) for key in keys]
+
+
+def test_directory_get_many(fx_session):
+    repo = ReadManyCountingRepository()
+    stage = TestStage(fx_session, repo)
+    with stage:
+        docs = stage.dir_docs.get_many(['abc', 'def', 'not-exist'])
+        assert frozenset(docs) == frozenset(['abc', 'def'])
+        assert all(isinstance(doc, TestDoc) for doc in docs.values())
+        assert repo.read_calls == [2]
+        assert docs['abc'].__revision__.session is fx_session
+        dirs = stage.deep_docs.get_many(['abc', 'not-exist'])
+        assert list(dirs) == ['abc']
+        assert isinstance(dirs['abc'], Directory)
+        deep_docs = dirs['abc'].get_many(['xyz', 'xxx'])
+        assert frozenset(deep_docs) == frozenset(['xyz', 'xxx'])
+        assert repo.read_calls == [2, 2]
+
+
+def test_dirty_buffer_read_many(fx_repo):
+    buffer_ = DirtyBuffer(fx_repo, threading.RLock())
+    buffer_.write(['new'], [b'<new />'])
+    keys = [['new'], ['doc.SESSID.xml'], ['dir', 'abc', 'SESSID.xml']]
+    assert [b''.join(chunks) for chunks in buffer_.read_many(keys)] == [
+        b'<new />', b'<test />', b'<test />'
+    ]
+    with raises(RepositoryKeyError):
+        buffer_.read_many([['new'], ['not-exist']])
+    assert buffer_.exists_many([['new'], ['dir', 'abc'], ['not-exist']]) == [
+        True, True, False
+    ]
+
+
+@mark.skipif('IRON_PYTHON')
+def test_stage_mapped_files(tmpdir, fx_session, fx_other_session):
+    repo = FileSystemRepository(str(tmpdir), buffer_size=16,
+                                mmap_threshold=0)
+    stage = TestStage(fx_session, repo)
+    other_stage = TestStage(fx_other_session, repo)
+    with stage:
+        stage.dir_docs['abc'] = TestDoc()
+    with other_stage:
+        doc = other_stage.dir_docs['abc']
+        assert isinstance(doc, TestDoc)
+        other_stage.dir_docs['abc'] = doc
+    with stage:
+        doc = stage.dir_docs['abc']
+        assert doc.__revision__.session is fx_session
+
+
+def test_stage_read_streams_file(tmpdir, fx_session, monkeypatch):
+    repo = FileSystemRepository(str(tmpdir))
+    stage = TestStage(fx_session, repo)
+    with stage:
+        stage.dir_docs['abc'] = TestDoc()
+    reads = []
+    original_read = FileSystemRepository.read
+
+    def read(self, key):
+        reads.append(key)
+        return original_read(self, key)
+    monkeypatch.setattr(FileSystemRepository, 'read', read)
+    key = ['dir', 'abc', '{0}.xml'.format(fx_session.identifier)]
+    with stage:
+        assert isinstance(stage.read(TestDoc, key), TestDoc)
+        assert isinstance(stage.dir_docs['abc'], TestDoc)
+    # Single documents are read through Repository.read() which doesn't
+    # load the whole file at once.
+    assert reads == [key, key]
+
+
+class LockRecordingRepository(FileSystemRepository):
+
+    def lock_keys(self, keys):
+        keys = list(keys)
+        self.locked.append(sorted(keys))
+        return super(LockRecordingRepository, self).lock_keys(keys)
+
+
+@mark.skipif('sys.platform == "win32"', reason='fcntl is unavailable')
+def test_dirty_buffer_flush_locks_keys(tmpdir):
+    repo = LockRecordingRepository(str(tmpdir), process_lock=True)
+    repo.locked = []
+    buffer_ = DirtyBuffer(repo, threading.RLock())
+    buffer_.write(['a', 'b'], [b'ab'])
+    buffer_.write(['c'], [b'c'])
+    buffer_.flush()
+    assert repo.locked == [[('a', 'b'), ('c',)]]
+    assert b''.join(repo.read(['a', 'b'])) == b'ab'
+
+
+class ChunkCountingRepository(FileSystemRepository):
+
+    chunks = 0
+
+    def read(self, key):
+        for chunk in super(ChunkCountingRepository, self).read(key):
+            self.chunks += 1
+            yield chunk
+
+
+def test_dirty_buffer_flush_reads_head(tmpdir, fx_session):
+    repo = ChunkCountingRepository(str(tmpdir), buffer_size=64,
+                                   max_buffer_size=None)
+    prev = TestDoc()
+    fx_session.revise(prev)
+    prev_bytes = b''.join(write(prev, as_bytes=True)) + \
+        b'<!-- ' + b'padding ' * 1000 + b'-->'
+    repo.write(['doc.xml'], [prev_bytes])
+    doc = TestDoc()
+    doc.__base_revisions__ = RevisionSet([prev.__revision__])
+    fx_session.revise(doc)
+    buffer_ = DirtyBuffer(repo, threading.RLock())
+    buffer_.write(['doc.xml'], write(doc, as_bytes=True), TestDoc)
+    buffer_.flush()
+    assert 0 < repo.chunks < 10
+    flushed = read(TestDoc, repo.read(['doc.xml']))
+    assert flushed.__revision__ == doc.__revision__
@@ -1,4 +1,5 @@
 import datetime
+import pickle
 
 from libearth.tz import FixedOffset, guess_tzinfo_by_locale, now, utc
 
@@ -30,6 +31,16 @@ def test_fixed_offset_name():
     assert tz.tzname(dt) == 'custom'
 
 
+def test_fixed_offset_pickle():
+    tz = pickle.loads(pickle.dumps(FixedOffset(-9 * 60 - 30, 'custom')))
+    assert tz.utcoffset(None) == datetime.timedelta(hours=-9, minutes=-30)
+    assert tz.tzname(None) == 'custom'
+    dt = datetime.datetime(2013, 8, 15, 3, 18, 30, tzinfo=FixedOffset(540))
+    loaded = pickle.loads(pickle.dumps(dt))
+    assert loaded == dt
+    assert loaded.tzname() == '+09:00'
+
+
 def test_now():
     before = datetime.datetime.utcnow().replace(tzinfo=utc)
     actual = now()